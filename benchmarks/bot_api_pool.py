@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Пропускная способность и хвостовые задержки вызовов Bot API при разных настройках HTTP-клиента.
+
+Параллельные sendMessage идут в локальный фейковый Bot API несколькими
+всплесками с паузой между ними (как промоуты и удаления после волны
+сообщений). Сравниваются:
+  bare     - HTTPXRequest() без параметров (пул из одного соединения)
+  builder  - то, что собирает Application.builder() по умолчанию
+             (256 соединений, keep-alive httpx 5 с, pool timeout 1 с)
+  tuned    - services.bot_request.create_bot_request() с настройками BOT_API_*
+
+Время вызова включает ожидание свободного соединения в пуле. Сервер
+считает открытые соединения, handshake имитирует стоимость нового
+соединения (TCP + TLS до Telegram). Сервер работает в отдельном процессе и говорит только HTTP/1.1,
+поэтому BOT_API_HTTP_VERSION=2 здесь не проверяется.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRACE_FILE', '')
+
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from telegram import Bot
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+from benchmarks.fake_api_server import FakeBotApiServer
+from benchmarks.role_assign_latency import percentile
+from services.bot_request import create_bot_request
+
+TOKEN = "123456:benchmark"
+CHAT_ID = -100
+
+CONFIGS = {
+    'bare': lambda args: HTTPXRequest(),
+    'builder': lambda args: HTTPXRequest(connection_pool_size=256),
+    'tuned': lambda args: create_bot_request(args.pool_size, args.keepalive),
+}
+
+async def burst(bot: Bot, calls: int, concurrency: int, latencies: list, errors: Counter):
+    """calls вызовов sendMessage не более чем в concurrency параллельных потоков"""
+    remaining = iter(range(calls))
+
+    async def worker():
+        for i in remaining:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(CHAT_ID, f"message {i}")
+                latencies.append(time.perf_counter() - started)
+            except TelegramError as e:
+                errors[type(e).__name__] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+def serve(conn: Connection, latency: float, handshake: float):
+    """Фейковый Bot API в отдельном процессе: его CPU не смешивается с клиентским"""
+    async def main():
+        server = FakeBotApiServer(latency=latency, handshake=handshake)
+        await server.start()
+        conn.send(server.base_url)
+        # Любое сообщение от родителя - сигнал остановки
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await server.stop()
+        conn.send(server.connections)
+
+    asyncio.run(main())
+
+async def run_config(name: str, args) -> dict:
+    parent, child = Pipe()
+    process = Process(target=serve, args=(child, args.latency, args.handshake), daemon=True)
+    process.start()
+    bot = Bot(TOKEN, base_url=parent.recv(), request=CONFIGS[name](args))
+    latencies, errors = [], Counter()
+    busy = 0.0
+    try:
+        async with bot:
+            for index in range(args.bursts):
+                if index:
+                    await asyncio.sleep(args.gap)
+                started = time.perf_counter()
+                await burst(bot, args.calls, args.concurrency, latencies, errors)
+                busy += time.perf_counter() - started
+    finally:
+        parent.send('stop')
+        connections = parent.recv()
+        process.join()
+
+    return {
+        'config': name,
+        'calls_per_second': len(latencies) / busy if busy else 0,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else 0,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else 0,
+        'max_ms': max(latencies) * 1000 if latencies else 0,
+        # getMe при инициализации тоже открывает соединение
+        'connections': connections,
+        'errors': dict(errors),
+    }
+
+async def run(args) -> list:
+    return [await run_config(name, args) for name in args.configs]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), default=['builder', 'tuned'])
+    parser.add_argument('--calls', type=int, default=500, help="вызовов в одном всплеске")
+    parser.add_argument('--concurrency', type=int, default=32, help="параллельных вызовов")
+    parser.add_argument('--bursts', type=int, default=3)
+    parser.add_argument('--gap', type=float, default=6, help="пауза между всплесками, сек")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа Bot API, сек")
+    parser.add_argument('--handshake', type=float, default=0.15, help="стоимость нового соединения, сек")
+    parser.add_argument('--pool-size', type=int, default=None, help="пул для tuned (по умолчанию BOT_API_POOL_SIZE)")
+    parser.add_argument('--keepalive', type=float, default=None, help="keep-alive для tuned, сек")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    results = asyncio.run(run(args))
+    print(f"{args.bursts} bursts x {args.calls} calls, concurrency {args.concurrency}, "
+          f"gap {args.gap}s, latency {args.latency * 1000:.0f}ms, handshake {args.handshake * 1000:.0f}ms")
+    print(f"{'config':8} {'calls/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'conns':>6}  errors")
+    for r in results:
+        print(f"{r['config']:8} {r['calls_per_second']:8.1f} {r['p50_ms']:8.1f} {r['p99_ms']:8.1f} "
+              f"{r['max_ms']:8.1f} {r['connections']:6d}  {r['errors'] or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Бюджеты обращений к БД и Bot API на один сценарий обработки.
+
+Каждый сценарий прогоняется через настоящие обработчики (Application как в
+main.py) поверх FakeBot и хранилища в памяти; считаются все обращения, в
+том числе фоновые операции очереди ролей и работа планировщика удалений
+(запись заданий в scheduled_deletions и немедленные удаления), запущенные
+сценарием. Удаления с задержкой в замер не входят. Если
+сценарий превысил объявленный бюджет, скрипт завершается с кодом 1 -
+рост числа запросов становится заметен сразу, а не по задержкам в бою.
+
+При осознанном изменении обработчика бюджет правится в BUDGETS вместе с ним.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRACE_FILE', '')
+
+import asyncio
+import logging
+import argparse
+import itertools
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Tuple
+from telegram import Chat, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated, Update
+from telegram.ext import CallbackContext
+from benchmarks.end_to_end import build_application
+from benchmarks.fakes import FakeBot, InMemoryStore, make_admin, make_tg_user
+from database.models import RoleHistory, User
+from services.activity_service import ActivityService
+from services.deletion_scheduler import deletion_scheduler
+from services.flood_guard import FloodGuard
+from services.spam_detector import SpamDetector
+from services.profanity_filter import ProfanityFilter
+from services.role_queue import RoleJobQueue
+
+BAD_WORDS = ['блин']
+USER_ID = 42
+FLOOD_LIMIT = 5
+RAID_TEXT = "Заработай {price} рублей в день без вложений! Пиши в личку, места ограничены"
+
+# Сценарий -> (обращений к БД, вызовов Bot API), включая фоновые операции
+BUDGETS: Dict[str, Tuple[int, int]] = {
+    'clean_message': (1, 0),
+    'profane_message': (4, 2),
+    'new_member': (4, 1),
+    'rejoin': (6, 3),
+    'changenick': (6, 5),
+    'inactivity_demotion': (6, 2),
+    'flood_mute': (0, 1),
+    'flood_dropped': (0, 0),
+    'raid_message': (5, 3),
+}
+
+class Harness:
+    """Application с обработчиками на FakeBot и счетчики обращений одного сценария"""
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.store = InMemoryStore()
+        self.bot = FakeBot(latency=0, propagation_delay=(0, 0), update_delay=(0, 0))
+        self.update_ids = itertools.count(1)
+        self.bot._update_ids = self.update_ids
+        self.message_ids = itertools.count(1)
+        profanity_filter = ProfanityFilter()
+        profanity_filter.bad_words = BAD_WORDS
+        profanity_filter._update_pattern()
+        self.role_queue = RoleJobQueue()
+        self.activity_service = ActivityService(self.role_queue)
+        self.spam_detector = SpamDetector(min_accounts=3, min_similarity=0.6, window=60, min_length=40)
+        self.flood_guard = FloodGuard(user_limit=FLOOD_LIMIT, chat_limit=0, window=60, mute_seconds=60)
+        self.application = build_application(
+            self.bot, None, self.activity_service, profanity_filter, self.role_queue,
+            flood_guard=self.flood_guard, spam_detector=self.spam_detector
+        )
+        # События chat_member после промоута обрабатываются сразу, без очереди
+        self.bot.on_update = self.application.process_update
+
+    async def __aenter__(self):
+        self.store.install()
+        await self.application.initialize()
+        await self.application.start()
+        await self.role_queue.start()
+        # Планировщик удалений без своего цикла: settle() выполняет его проход сам,
+        # чтобы запись заданий и удаления попали в замер целиком
+        deletion_scheduler.bot = self.bot
+        self.activity_service.context = CallbackContext(self.application)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Отложенные удаления сценария не переходят в следующий
+        deletion_scheduler._heap.clear()
+        deletion_scheduler._unsaved.clear()
+        await self.role_queue.stop()
+        await self.application.stop()
+        await self.application.shutdown()
+        self.store.uninstall()
+
+    def add_user(self, **fields) -> User:
+        user = User(user_id=USER_ID, chat_id=self.chat_id, last_activity=datetime.now(), **fields)
+        self.store.users[(self.chat_id, USER_ID)] = user
+        return user
+
+    def message(self, text: str) -> Update:
+        data = {
+            'update_id': next(self.update_ids),
+            'message': {
+                'message_id': next(self.message_ids),
+                'date': int(datetime.now().timestamp()),
+                'chat': {'id': self.chat_id, 'type': 'supergroup'},
+                'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'user'},
+                'text': text,
+            }
+        }
+        if text.startswith('/'):
+            data['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json(data, self.application.bot)
+
+    def join(self) -> Update:
+        user = make_tg_user(USER_ID)
+        self.bot._members[(self.chat_id, USER_ID)] = ChatMemberMember(user=user)
+        return Update(
+            update_id=next(self.update_ids),
+            chat_member=ChatMemberUpdated(
+                chat=Chat(id=self.chat_id, type=Chat.SUPERGROUP),
+                from_user=user,
+                date=datetime.now(),
+                old_chat_member=ChatMemberLeft(user=user),
+                new_chat_member=ChatMemberMember(user=user)
+            )
+        )
+
+    async def settle(self):
+        """Ожидание фоновых операций, запущенных сценарием"""
+        while True:
+            await self.role_queue.join()
+            if not self.bot._background:
+                break
+            await asyncio.gather(*self.bot._background)
+        await deletion_scheduler.flush()
+
+    async def measure(self, action: Callable[[], Awaitable[None]]) -> Tuple[Counter, Counter]:
+        self.store.calls.clear()
+        self.bot.calls.clear()
+        existing = asyncio.all_tasks()
+        await action()
+        await self.settle()
+        # Фоновые задачи обработчиков (application.create_task), например мут флудера
+        spawned = asyncio.all_tasks() - existing - {asyncio.current_task()}
+        if spawned:
+            await asyncio.wait(spawned, timeout=5)
+        return Counter(self.store.calls), Counter(self.bot.calls)
+
+async def clean_message(h: Harness):
+    h.add_user()
+    return await h.measure(lambda: h.application.process_update(h.message("всем привет")))
+
+async def profane_message(h: Harness):
+    h.add_user()
+    return await h.measure(lambda: h.application.process_update(h.message("ну блин опять")))
+
+async def new_member(h: Harness):
+    return await h.measure(lambda: h.application.process_update(h.join()))
+
+async def rejoin(h: Harness):
+    h.add_user(nickname="Старый_ник", role_assigned=False)
+    return await h.measure(lambda: h.application.process_update(h.join()))
+
+async def changenick(h: Harness):
+    h.add_user()
+    return await h.measure(lambda: h.application.process_update(h.message("/cn Новый_ник")))
+
+async def inactivity_demotion(h: Harness):
+    h.add_user(nickname="Ник", role_assigned=True)
+    h.store.users[(h.chat_id, USER_ID)].last_activity = datetime.now() - timedelta(days=30)
+    h.store.role_history.append(RoleHistory(user_id=USER_ID, chat_id=h.chat_id, role_name="Ник"))
+    h.bot._members[(h.chat_id, USER_ID)] = make_admin(make_tg_user(USER_ID), custom_title="Ник")
+    # Путь срабатывания срока неактивности в ActivityService
+    return await h.measure(lambda: h.activity_service._remove_expired([(USER_ID, h.chat_id)]))
+
+async def flood_mute(h: Harness):
+    h.add_user()
+    for _ in range(FLOOD_LIMIT):
+        h.flood_guard.check(h.chat_id, USER_ID)
+    # Сообщение сверх лимита: мут без обращений к БД
+    return await h.measure(lambda: h.application.process_update(h.message("спам")))
+
+async def flood_dropped(h: Harness):
+    h.add_user()
+    for _ in range(FLOOD_LIMIT + 1):
+        h.flood_guard.check(h.chat_id, USER_ID)
+    # Пользователь уже замучен: сообщение отбрасывается целиком
+    return await h.measure(lambda: h.application.process_update(h.message("спам")))
+
+async def raid_message(h: Harness):
+    h.add_user()
+    # Та же реклама с небольшими правками уже пришла от двух других аккаунтов
+    for other_user, price in ((101, "50000"), (102, "70000")):
+        h.spam_detector.check(h.chat_id, other_user, next(h.message_ids), RAID_TEXT.format(price=price))
+    # Копии других аккаунтов удаляются пачкой через планировщик
+    return await h.measure(lambda: h.application.process_update(h.message(RAID_TEXT.format(price="60000"))))
+
+SCENARIOS = [
+    clean_message, profane_message, new_member, rejoin, changenick, inactivity_demotion,
+    flood_mute, flood_dropped, raid_message
+]
+
+async def run(args) -> bool:
+    ok = True
+    print(f"{'scenario':22} {'db':>4} {'budget':>6} {'api':>4} {'budget':>6}")
+    for index, scenario in enumerate(SCENARIOS):
+        # Отдельный чат на сценарий: кэши участников не переходят между сценариями
+        async with Harness(chat_id=-1002000000000 - index) as harness:
+            db, api = await scenario(harness)
+        db_budget, api_budget = BUDGETS[scenario.__name__]
+        db_total, api_total = sum(db.values()), sum(api.values())
+        failed = db_total > db_budget or api_total > api_budget
+        ok = ok and not failed
+        status = 'OVER BUDGET' if failed else 'ok'
+        print(f"{scenario.__name__:22} {db_total:4d} {db_budget:6d} {api_total:4d} {api_budget:6d}  {status}")
+        if failed or args.verbose:
+            print(f"    db: {dict(db)}")
+            print(f"    api: {dict(api)}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help="разбивка обращений по методам")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
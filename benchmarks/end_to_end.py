@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Сквозной бенчмарк: настоящие обработчики PTB на синтетическом потоке обновлений.
+
+Application собирается как в main.py (UserHandlers, AdminHandlers,
+ChatMemberHandlers, PerUserUpdateProcessor), Bot API выполняет FakeBot с
+заданной задержкой, БД подменена хранилищем в памяти. Поток: обычные и
+матерные сообщения, вступления, выходы и пачки /cn. Выводит пропускную
+способность, перцентили обработки по типам обновлений и число обращений
+к БД и API на обновление.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Выборку трасс в файл в бенчмарке не пишем
+os.environ.setdefault('TRACE_FILE', '')
+
+import time
+import random
+import asyncio
+import logging
+import argparse
+import itertools
+import contextvars
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Optional
+from telegram import Chat, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated, Update
+from telegram.ext import Application
+from benchmarks.fakes import FakeBot, FakeBotRequest, InMemoryStore, make_tg_user
+from benchmarks.role_assign_latency import percentile
+from handlers.user_handlers import UserHandlers
+from handlers.admin_handlers import AdminHandlers
+from handlers.chat_member_handlers import ChatMemberHandlers
+from handlers.flood_handlers import FloodHandlers
+from services.activity_service import ActivityService
+from services.deletion_scheduler import deletion_scheduler
+from services.flood_guard import FloodGuard
+from services.spam_detector import SpamDetector
+from services.profanity_filter import ProfanityFilter
+from services.rate_limiter import PriorityRateLimiter
+from services.role_queue import RoleJobQueue
+from services.update_processor import PerUserUpdateProcessor
+
+TOKEN = '123456:benchmark'
+CHAT_BASE_ID = -1001000000000
+BAD_WORDS = ['блин', 'хрен', 'дурак']
+WORDS = ['привет', 'как', 'дела', 'сегодня', 'встреча', 'в', 'семь', 'кто', 'идет', 'ок', 'спасибо']
+
+# Тип обновления, которое сейчас обрабатывается (фоновые задачи - 'background')
+current_kind: contextvars.ContextVar[str] = contextvars.ContextVar('current_kind', default='background')
+
+class AttributedCounter(Counter):
+    """Счетчик вызовов, дополнительно разложенный по типу текущего обновления"""
+
+    def __init__(self):
+        super().__init__()
+        self.by_kind = defaultdict(Counter)
+
+    def __setitem__(self, key, value):
+        self.by_kind[current_kind.get()][key] += value - self.get(key, 0)
+        super().__setitem__(key, value)
+
+class UpdateRecorder:
+    """Учет отправленных обновлений и времени их обработки по типам"""
+
+    def __init__(self):
+        self.kinds = {}
+        self.sent_at = {}
+        self.processing = defaultdict(list)
+        self.delays = defaultdict(list)
+        self.sent = 0
+        self.done_count = 0
+        self.all_sent = False
+        self.idle = asyncio.Event()
+
+    async def send(self, application: Application, kind: str, update: Update):
+        self.kinds[update.update_id] = kind
+        self.sent_at[update.update_id] = time.perf_counter()
+        self.sent += 1
+        await application.update_queue.put(update)
+
+    def finished(self, update_id: int, kind: str, started: float):
+        now = time.perf_counter()
+        self.processing[kind].append(now - started)
+        if update_id in self.sent_at:
+            self.delays[kind].append(now - self.sent_at.pop(update_id))
+        self.done_count += 1
+        if self.all_sent and not self.sent_at:
+            self.idle.set()
+
+    def close(self):
+        """Все обновления отправлены"""
+        self.all_sent = True
+        if not self.sent_at:
+            self.idle.set()
+
+class MeasuredProcessor(PerUserUpdateProcessor):
+    """PerUserUpdateProcessor с замером времени обработки каждого обновления"""
+
+    def __init__(self, max_concurrent_updates: int, recorder: UpdateRecorder):
+        super().__init__(max_concurrent_updates)
+        self.recorder = recorder
+
+    async def _run(self, update, coroutine):
+        kind = self.recorder.kinds.get(update.update_id, 'service')
+        token = current_kind.set(kind)
+        started = time.perf_counter()
+        try:
+            await super()._run(update, coroutine)
+        finally:
+            current_kind.reset(token)
+            self.recorder.finished(update.update_id, kind, started)
+
+class Workload(UpdateRecorder):
+    """Генератор синтетического потока обновлений"""
+
+    def __init__(self, args, bot: FakeBot):
+        super().__init__()
+        self.args = args
+        self.bot = bot
+        self.rng = random.Random(args.seed)
+        self.chat_ids = [CHAT_BASE_ID - i for i in range(args.chats)]
+        # Все пользователи изначально в чате
+        self.members = {chat_id: set(range(1, args.users + 1)) for chat_id in self.chat_ids}
+        # Общий счетчик с FakeBot, чтобы события chat_member не совпадали по update_id
+        self.update_ids = itertools.count(1)
+        bot._update_ids = self.update_ids
+        self.message_ids = itertools.count(1)
+        self.mix = self._parse_mix(args.mix)
+
+    @staticmethod
+    def _parse_mix(spec: str) -> dict:
+        mix = {}
+        for part in spec.split(','):
+            name, weight = part.split('=')
+            mix[name.strip()] = float(weight)
+        return mix
+
+    def _message(self, chat_id: int, user_id: int, text: str) -> dict:
+        data = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'benchmark'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}", 'username': f"user{user_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            data['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return data
+
+    def _member_change(self, chat_id: int, user_id: int, joined: bool) -> Update:
+        user = make_tg_user(user_id)
+        old, new = (ChatMemberLeft(user=user), ChatMemberMember(user=user))
+        if not joined:
+            old, new = new, old
+        # Состояние фейкового Telegram меняется вместе с событием
+        self.bot._members[(chat_id, user_id)] = new
+        if joined:
+            self.members[chat_id].add(user_id)
+        else:
+            self.members[chat_id].discard(user_id)
+        return Update(
+            update_id=next(self.update_ids),
+            chat_member=ChatMemberUpdated(
+                chat=Chat(id=chat_id, type=Chat.SUPERGROUP),
+                from_user=user,
+                date=datetime.now(),
+                old_chat_member=old,
+                new_chat_member=new
+            )
+        )
+
+    def _text(self, profane: bool) -> str:
+        words = self.rng.choices(WORDS, k=self.rng.randint(3, 12))
+        if profane:
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(BAD_WORDS))
+        return ' '.join(words)
+
+    def make_update(self, kind: str, bot) -> tuple:
+        chat_id = self.rng.choice(self.chat_ids)
+        members = self.members[chat_id]
+        outsiders = self.args.users - len(members)
+        if kind == 'join' and outsiders == 0 or kind in ('leave', 'clean', 'profane', 'cn') and not members:
+            kind = 'clean' if members else 'join'
+
+        if kind == 'join':
+            user_id = self.rng.choice([u for u in range(1, self.args.users + 1) if u not in members])
+            return kind, self._member_change(chat_id, user_id, joined=True)
+        user_id = self.rng.choice(tuple(members))
+        if kind == 'leave':
+            return kind, self._member_change(chat_id, user_id, joined=False)
+        if kind == 'cn':
+            text = f"/cn nick{self.rng.randint(1, 9999)}"
+        else:
+            text = self._text(kind == 'profane')
+        data = {'update_id': next(self.update_ids), 'message': self._message(chat_id, user_id, text)}
+        return kind, Update.de_json(data, bot)
+
+    async def generate(self, application: Application):
+        """Поток с заданной частотой плюс пачки /cn"""
+        kinds, weights = zip(*self.mix.items())
+        total = int(self.args.rate * self.args.duration)
+        started = time.perf_counter()
+        next_burst = self.args.burst_interval
+        for i in range(total):
+            target = started + i / self.args.rate
+            delay = target - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.args.burst_size and i / self.args.rate >= next_burst:
+                next_burst += self.args.burst_interval
+                for _ in range(self.args.burst_size):
+                    await self.send(application, *self.make_update('cn', application.bot))
+            await self.send(application, *self.make_update(self.rng.choices(kinds, weights)[0], application.bot))
+        self.close()
+
+def build_application(
+    bot: FakeBot,
+    processor: Optional[PerUserUpdateProcessor],
+    activity_service: ActivityService,
+    profanity_filter: ProfanityFilter,
+    role_queue: RoleJobQueue,
+    rate_limiter: bool = False,
+    flood_guard: Optional[FloodGuard] = None,
+    spam_detector: Optional[SpamDetector] = None
+) -> Application:
+    """Application с обработчиками как в main.py поверх FakeBot"""
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .request(FakeBotRequest(bot))
+        .updater(None)
+    )
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    if rate_limiter:
+        builder = builder.rate_limiter(PriorityRateLimiter())
+    application = builder.build()
+    application.bot_data['activity_service'] = activity_service
+    application.bot_data['profanity_filter'] = profanity_filter
+    application.bot_data['role_queue'] = role_queue
+    for handler in ChatMemberHandlers().get_handlers():
+        application.add_handler(handler, group=-1)
+    if flood_guard is not None:
+        for handler in FloodHandlers(flood_guard).get_handlers():
+            application.add_handler(handler, group=-1)
+    for handler in UserHandlers(activity_service, profanity_filter, role_queue, spam_detector).get_handlers():
+        application.add_handler(handler)
+    for handler in AdminHandlers().get_handlers():
+        application.add_handler(handler)
+
+    async def push_member_update(update: Update):
+        # Событие chat_member от Telegram после промоута
+        await application.update_queue.put(update)
+    bot.on_update = push_member_update
+    return application
+
+async def run(args):
+    store = InMemoryStore().install()
+    bot = FakeBot(
+        latency=args.latency,
+        propagation_delay=(args.min_propagation, args.max_propagation),
+        seed=args.seed
+    )
+    bot.calls = AttributedCounter()
+    store.calls = AttributedCounter()
+    workload = Workload(args, bot)
+
+    profanity_filter = ProfanityFilter()
+    profanity_filter.bad_words = BAD_WORDS
+    profanity_filter._update_pattern()
+    role_queue = RoleJobQueue()
+    activity_service = ActivityService(role_queue)
+    role_latencies = []
+    role_queue.listeners.append(lambda job, result: role_latencies.append(time.perf_counter() - job.enqueued_at))
+
+    application = build_application(
+        bot, MeasuredProcessor(args.concurrency, workload),
+        activity_service, profanity_filter, role_queue, rate_limiter=args.rate_limiter,
+        flood_guard=FloodGuard() if args.flood else None
+    )
+
+    handled = drained = None
+    try:
+        async with application:
+            await application.start()
+            await role_queue.start()
+            await deletion_scheduler.start(application.bot)
+            started = time.perf_counter()
+            try:
+                await workload.generate(application)
+                await asyncio.wait_for(workload.idle.wait(), timeout=args.timeout)
+                handled = time.perf_counter() - started
+                await asyncio.wait_for(role_queue.join(), timeout=args.timeout)
+                drained = time.perf_counter() - started
+            except asyncio.TimeoutError:
+                print(f"timed out after {args.timeout}s: {len(workload.sent_at)} updates and "
+                      f"{role_queue.depth} role jobs still pending")
+            finally:
+                handled = handled or time.perf_counter() - started
+                await role_queue.stop()
+                await deletion_scheduler.stop()
+                await application.stop()
+    finally:
+        store.uninstall()
+
+    report(args, workload, bot, store, handled, drained, role_latencies)
+
+def _ms(values, q) -> str:
+    return f"{percentile(values, q) * 1000:7.1f}" if values else "      -"
+
+def report(args, workload: Workload, bot: FakeBot, store: InMemoryStore, handled: float, drained: float, role_latencies):
+    generated = sum(len(values) for kind, values in workload.delays.items())
+    print(f"rate={args.rate}/s duration={args.duration}s users={args.users} chats={args.chats} "
+          f"api latency={args.latency * 1000:.0f}ms mix={args.mix} "
+          f"/cn burst={args.burst_size} every {args.burst_interval}s "
+          f"rate limiter={'on' if args.rate_limiter else 'off'}")
+    drained = f"{drained:.2f}s" if drained is not None else "-"
+    print(f"throughput: {generated / handled:.0f} upd/s ({generated} updates in {handled:.2f}s, "
+          f"role queue drained at {drained})")
+    print()
+    print(f"{'kind':10} {'count':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'e2e p99':>7} {'db/upd':>7} {'api/upd':>7}")
+    for kind in sorted(workload.processing):
+        values = workload.processing[kind]
+        count = len(values)
+        db_calls = sum(store.calls.by_kind[kind].values())
+        api_calls = sum(bot.calls.by_kind[kind].values())
+        print(f"{kind:10} {count:6d} {_ms(values, 50)} {_ms(values, 95)} {_ms(values, 99)} "
+              f"{_ms(workload.delays.get(kind, []), 99)} {db_calls / count:7.2f} {api_calls / count:7.2f}")
+    background_db = sum(store.calls.by_kind['background'].values())
+    background_api = sum(bot.calls.by_kind['background'].values())
+    print(f"{'background':10} {'':6} {'':7} {'':7} {'':7} {'':7} {background_db:7d} {background_api:7d}  (role jobs, deletions; totals)")
+    if role_latencies:
+        print(f"role jobs: {len(role_latencies)} p50={_ms(role_latencies, 50).strip()}ms "
+              f"p99={_ms(role_latencies, 99).strip()}ms (from queueing to completion)")
+    total_updates = sum(len(values) for values in workload.processing.values()) or 1
+    print(f"per update overall: db={sum(store.calls.values()) / total_updates:.2f} "
+          f"api={sum(bot.calls.values()) / total_updates:.2f}")
+    if args.verbose:
+        print(f"db calls: {dict(store.calls.most_common())}")
+        print(f"api calls: {dict(bot.calls.most_common())}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=200, help="обновлений в секунду")
+    parser.add_argument('--duration', type=float, default=10, help="секунд генерации")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--chats', type=int, default=1)
+    parser.add_argument('--mix', default='clean=85,profane=8,join=3,leave=2,cn=2',
+                        help="веса типов обновлений: clean, profane, join, leave, cn")
+    parser.add_argument('--burst-size', type=int, default=20, help="/cn в одной пачке (0 - без пачек)")
+    parser.add_argument('--burst-interval', type=float, default=3.0, help="секунд между пачками /cn")
+    parser.add_argument('--latency', type=float, default=0.03, help="задержка одного вызова API, сек")
+    parser.add_argument('--min-propagation', type=float, default=0.05)
+    parser.add_argument('--max-propagation', type=float, default=0.6)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rate-limiter', action='store_true', help="ограничения Telegram как в main.py")
+    parser.add_argument('--flood', action='store_true', help="антифлуд с лимитами FLOOD_* как в main.py")
+    parser.add_argument('--timeout', type=float, default=120, help="ожидание обработки после генерации, сек")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Фейковый HTTP-сервер Bot API для бенчмарков транспорта"""
+import json
+import asyncio
+import itertools
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from benchmarks.fakes import BOT_ID
+
+class FakeBotApiServer:
+    """Минимальный HTTP/1.1 сервер (keep-alive) с методами Bot API.
+
+    getUpdates отдает обновления из очереди с long polling, остальные методы
+    возвращают правдоподобный ответ. latency имитирует время прохождения
+    запроса до Telegram и обратно, handshake - установку нового соединения
+    (TCP + TLS).
+    """
+
+    def __init__(self, latency: float = 0.05, host: str = '127.0.0.1', handshake: float = 0):
+        self.latency = latency
+        self.handshake = handshake
+        self.host = host
+        self.port = None
+        self.calls = Counter()
+        self.connections = 0
+        self.webhook_url = ''
+        self._updates: Deque[dict] = deque()
+        self._has_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def push_update(self, update: dict):
+        """Новое обновление для getUpdates"""
+        self._updates.append(update)
+        self._has_updates.set()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            if self.handshake:
+                await asyncio.sleep(self.handshake)
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                result = await self._dispatch(path.rsplit('/', 1)[-1], self._parse_params(headers, body))
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_params(headers: Dict[str, str], body: bytes) -> dict:
+        if not body:
+            return {}
+        if headers.get('content-type', '').startswith('application/json'):
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    async def _dispatch(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url', '')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = ''
+            return True
+        if method == 'sendMessage':
+            return {
+                'message_id': next(self._message_ids), 'date': 0,
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'supergroup'},
+                'text': params.get('text', '')
+            }
+        return True
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # Запрос и ответ идут до Telegram по половине RTT каждый
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+
+        # Подтвержденные обновления удаляются, как в Bot API
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+
+        if not self._updates and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout=min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+        batch = list(itertools.islice(self._updates, limit))
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+        return batch
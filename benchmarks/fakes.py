@@ -0,0 +1,307 @@
+"""Фейковый Bot и хранилище в памяти для бенчмарков"""
+import os
+import re
+import json
+import asyncio
+import random
+import itertools
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+os.environ.setdefault('BOT_TOKEN', 'benchmark')
+
+from telegram import (
+    Chat, ChatMemberAdministrator, ChatMemberMember, ChatMemberUpdated,
+    Message, Update, User as TgUser
+)
+from telegram.error import BadRequest
+from telegram.request import BaseRequest, RequestData
+from database.repositories import (
+    UserRepository, LogRepository, RoleHistoryRepository, ScheduledDeletionRepository
+)
+
+BOT_ID = 1_000_000
+
+def make_tg_user(user_id: int, is_bot: bool = False) -> TgUser:
+    return TgUser(id=user_id, first_name=f"user{user_id}", is_bot=is_bot, username=f"user{user_id}")
+
+def make_admin(user: TgUser, can_promote_members: bool = False, custom_title: str = None) -> ChatMemberAdministrator:
+    return ChatMemberAdministrator(
+        user=user, can_be_edited=not can_promote_members, is_anonymous=False,
+        can_manage_chat=True, can_delete_messages=can_promote_members,
+        can_manage_video_chats=False, can_restrict_members=can_promote_members,
+        can_promote_members=can_promote_members, can_change_info=False,
+        can_invite_users=False, can_post_stories=False, can_edit_stories=False,
+        can_delete_stories=False, custom_title=custom_title
+    )
+
+class FakeBot:
+    """Имитация Bot API с задержкой сети и задержкой применения промоута"""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        propagation_delay: Tuple[float, float] = (0.05, 0.6),
+        update_delay: Tuple[float, float] = (0.02, 0.2),
+        seed: int = 0
+    ):
+        self.id = BOT_ID
+        self.username = "benchmark_bot"
+        self.latency = latency
+        self.propagation_delay = propagation_delay
+        self.update_delay = update_delay
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.on_update: Optional[Callable[[Update], Awaitable[None]]] = None
+        self._members: Dict[Tuple[int, int], object] = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._background = set()
+
+    async def _call(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _member(self, chat_id: int, user_id: int):
+        member = self._members.get((chat_id, user_id))
+        if member is None:
+            user = make_tg_user(user_id, is_bot=user_id == self.id)
+            if user_id == self.id:
+                member = make_admin(user, can_promote_members=True)
+            else:
+                member = ChatMemberMember(user=user)
+            self._members[(chat_id, user_id)] = member
+        return member
+
+    async def get_me(self):
+        await self._call('get_me')
+        return make_tg_user(self.id, is_bot=True)
+
+    async def get_chat(self, chat_id: int):
+        await self._call('get_chat')
+        return Chat(id=chat_id, type=Chat.SUPERGROUP, title="benchmark")
+
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        await self._call('get_chat_member')
+        return self._member(chat_id, user_id)
+
+    async def promote_chat_member(self, chat_id: int, user_id: int, **rights):
+        await self._call('promote_chat_member')
+        old = self._member(chat_id, user_id)
+        if any(value for value in rights.values()):
+            new = make_admin(old.user)
+        else:
+            new = ChatMemberMember(user=old.user)
+        self._spawn(self._apply_member_change(chat_id, old, new))
+        return True
+
+    async def _apply_member_change(self, chat_id: int, old, new):
+        await asyncio.sleep(self.random.uniform(*self.propagation_delay))
+        self._members[(chat_id, new.user.id)] = new
+        if self.on_update is not None:
+            await asyncio.sleep(self.random.uniform(*self.update_delay))
+            await self.on_update(Update(
+                update_id=next(self._update_ids),
+                chat_member=ChatMemberUpdated(
+                    chat=Chat(id=chat_id, type=Chat.SUPERGROUP),
+                    from_user=make_tg_user(self.id, is_bot=True),
+                    date=datetime.now(),
+                    old_chat_member=old,
+                    new_chat_member=new
+                )
+            ))
+
+    async def get_chat_administrators(self, chat_id: int):
+        await self._call('get_chat_administrators')
+        self._member(chat_id, self.id)
+        return tuple(
+            member for (member_chat_id, _), member in self._members.items()
+            if member_chat_id == chat_id and member.status in ('administrator', 'creator')
+        )
+
+    async def set_chat_administrator_custom_title(self, chat_id: int, user_id: int, custom_title: str):
+        await self._call('set_chat_administrator_custom_title')
+        if self._member(chat_id, user_id).status != 'administrator':
+            raise BadRequest("User is not an administrator")
+        return True
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await self._call('send_message')
+        return Message(
+            message_id=next(self._message_ids), date=datetime.now(),
+            chat=Chat(id=chat_id, type=Chat.SUPERGROUP), text=text
+        )
+
+    async def delete_message(self, chat_id: int, message_id: int, **kwargs):
+        await self._call('delete_message')
+        return True
+
+    async def delete_messages(self, chat_id: int, message_ids, **kwargs):
+        await self._call('delete_messages')
+        return True
+
+    async def restrict_chat_member(self, chat_id: int, user_id: int, permissions=None, **kwargs):
+        await self._call('restrict_chat_member')
+        return True
+
+class FakeBotRequest(BaseRequest):
+    """Транспорт PTB без сети: запросы настоящего Bot выполняет FakeBot.
+
+    Параметры и ответы проходят ту же сериализацию, что и с Telegram, поэтому
+    в замер попадают ExtBot, ограничитель запросов и разбор ответов.
+    """
+
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, **timeouts) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        handler = getattr(self.bot, re.sub(r'(?<!^)(?=[A-Z])', '_', endpoint).lower(), None)
+        if handler is None:
+            return self._error(f"Bad Request: method {endpoint} is not supported by the fake")
+        try:
+            result = await handler(**(request_data.parameters if request_data else {}))
+        except BadRequest as e:
+            return self._error(e.message)
+        if isinstance(result, (list, tuple)):
+            result = [item.to_dict() for item in result]
+        elif hasattr(result, 'to_dict'):
+            result = result.to_dict()
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    @staticmethod
+    def _error(description: str) -> Tuple[int, bytes]:
+        return 400, json.dumps({'ok': False, 'error_code': 400, 'description': description}).encode()
+
+class InMemoryStore:
+    """Подмена репозиториев хранилищем в памяти с подсчетом обращений к БД"""
+
+    def __init__(self):
+        self.users = {}  # (chat_id, user_id) -> User
+        self.logs = []
+        self.role_history = []
+        self.calls = Counter()
+        self._originals = {}
+
+    def install(self):
+        store = self
+
+        async def get_by_id(user_id, chat_id):
+            store.calls['users.get_by_id'] += 1
+            user = store.users.get((chat_id, user_id))
+            return user.model_copy() if user else None
+
+        async def create_or_update(user):
+            store.calls['users.create_or_update'] += 1
+            store.users[(user.chat_id, user.user_id)] = user.model_copy()
+            return True
+
+        async def create(user):
+            store.calls['users.create'] += 1
+            store.users.setdefault((user.chat_id, user.user_id), user.model_copy())
+            return True
+
+        async def touch_activity(user_id, chat_id):
+            store.calls['users.touch_activity'] += 1
+            user = store.users.get((chat_id, user_id))
+            if user is None:
+                return None
+            user.last_activity = user.updated_at = datetime.now()
+            return user.model_copy()
+
+        async def increment_warnings(user_id, chat_id):
+            store.calls['users.increment_warnings'] += 1
+            user = store.users.get((chat_id, user_id))
+            if user is None:
+                return None
+            user.warnings_count += 1
+            return user.warnings_count
+
+        async def update_role(user_id, chat_id, nickname=None, role_assigned=None):
+            store.calls['users.update_role'] += 1
+            user = store.users.get((chat_id, user_id))
+            if user:
+                if nickname is not None:
+                    user.nickname = nickname
+                if role_assigned is not None:
+                    user.role_assigned = role_assigned
+                user.updated_at = datetime.now()
+            return True
+
+        async def claim_inactive(chat_id, timeout_minutes, limit, user_ids=None):
+            store.calls['users.claim_inactive'] += 1
+            cutoff = datetime.now() - timedelta(minutes=timeout_minutes)
+            claimed = [
+                user.model_copy() for (user_chat_id, user_id), user in store.users.items()
+                if user_chat_id == chat_id and user.role_assigned and user.last_activity
+                and user.last_activity < cutoff and (user_ids is None or user_id in user_ids)
+            ]
+            return claimed[:limit]
+
+        async def log_create(log_entry):
+            store.calls['logs.create'] += 1
+            store.logs.append(log_entry)
+            return True
+
+        async def history_create(role_history):
+            store.calls['role_history.create'] += 1
+            store.role_history.append(role_history)
+            return True
+
+        async def history_by_user(user_id, chat_id):
+            store.calls['role_history.get_by_user_id'] += 1
+            return [h for h in store.role_history if h.user_id == user_id and h.chat_id == chat_id]
+
+        async def history_update(role_history):
+            store.calls['role_history.update'] += 1
+            return True
+
+        async def deletions_add(deletions):
+            store.calls['scheduled_deletions.add_many'] += 1
+            return True
+
+        async def deletions_delete(chat_id, message_ids):
+            store.calls['scheduled_deletions.delete_many'] += 1
+            return True
+
+        patches = [
+            (UserRepository, 'get_by_id', get_by_id),
+            (UserRepository, 'create_or_update', create_or_update),
+            (UserRepository, 'create', create),
+            (UserRepository, 'touch_activity', touch_activity),
+            (UserRepository, 'increment_warnings', increment_warnings),
+            (UserRepository, 'update_role', update_role),
+            (UserRepository, 'claim_inactive', claim_inactive),
+            (LogRepository, 'create', log_create),
+            (RoleHistoryRepository, 'create', history_create),
+            (RoleHistoryRepository, 'get_by_user_id', history_by_user),
+            (RoleHistoryRepository, 'update', history_update),
+            (ScheduledDeletionRepository, 'add_many', deletions_add),
+            (ScheduledDeletionRepository, 'delete_many', deletions_delete),
+        ]
+        for owner, name, func in patches:
+            self._originals[(owner, name)] = owner.__dict__[name]
+            setattr(owner, name, staticmethod(func))
+        return self
+
+    def uninstall(self):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals.clear()
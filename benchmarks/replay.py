@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Воспроизведение записанного трафика (CAPTURE_FILE) через настоящие обработчики.
+
+Обновления подаются в Application с исходными интервалами (--speed 1),
+ускоренно (--speed N) или без пауз (--speed 0). Bot API выполняет FakeBot,
+данные пишутся в локальный Postgres из настроек DB_* (или в память с
+--in-memory). Итог можно сохранить (--save) и сравнить с прошлым прогоном
+(--compare): рост числа обращений к БД/API на обновление или p99 обработки
+больше допуска завершает скрипт с кодом 1.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRACE_FILE', '')
+
+import json
+import time
+import asyncio
+import logging
+import argparse
+from telegram import Update
+from benchmarks.end_to_end import MeasuredProcessor, UpdateRecorder, build_application
+from benchmarks.fakes import FakeBot, InMemoryStore
+from benchmarks.role_assign_latency import percentile
+from config.settings import settings
+from database.connection import Database, DB_QUERY_SECONDS
+from services.activity_service import ActivityService
+from services.chat_config import chat_config
+from services.deletion_scheduler import deletion_scheduler
+from services.profanity_filter import ProfanityFilter
+from services.role_queue import RoleJobQueue
+from services.traffic_capture import read_capture
+from services.update_processor import PerUserUpdateProcessor
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+DB_METHODS = ('execute', 'executemany', 'fetch', 'fetchrow', 'fetchval')
+
+def load_capture(path: str, limit: int = None):
+    """bot_id из заголовка и записи обновлений по порядку"""
+    bot_id = None
+    records = []
+    for record in read_capture(path):
+        if 'bot_id' in record:
+            bot_id = bot_id or record['bot_id']
+        elif 'update' in record:
+            records.append(record)
+            if limit and len(records) >= limit:
+                break
+    return bot_id, records
+
+def update_kind(update: Update) -> str:
+    """Тип обновления для отчета; команды отдельно от обычных сообщений"""
+    if update.message is not None and update.message.text and update.message.text.startswith('/'):
+        return 'command'
+    return str(PerUserUpdateProcessor.update_type(update))
+
+def db_calls(store: InMemoryStore) -> int:
+    if store is not None:
+        return sum(store.calls.values())
+    return sum(DB_QUERY_SECONDS.count(method=method) for method in DB_METHODS)
+
+async def feed(application, recorder: UpdateRecorder, records: list, speed: float):
+    """Подача обновлений с исходными интервалами, деленными на speed"""
+    first_ts = records[0]['ts']
+    started = time.perf_counter()
+    for record in records:
+        if speed > 0:
+            delay = (record['ts'] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(record['update'], application.bot)
+        await recorder.send(application, update_kind(update), update)
+    recorder.close()
+
+async def prepare_database(profanity_filter: ProfanityFilter):
+    from database.migrations import run_migrations
+    from database.update_database import update_database_schema
+    await update_database_schema()
+    await run_migrations()
+    await chat_config.load()
+    await profanity_filter.load_words()
+
+async def run(args) -> dict:
+    bot_id, records = load_capture(args.capture, args.limit)
+    if not records:
+        raise SystemExit(f"No updates in {args.capture}")
+
+    store = None
+    profanity_filter = ProfanityFilter()
+    if args.in_memory:
+        store = InMemoryStore().install()
+        profanity_filter.bad_words = [word for word in args.profanity_words.split(',') if word]
+        profanity_filter._update_pattern()
+    else:
+        if settings.DB_HOST not in LOCAL_HOSTS and not args.allow_remote_db:
+            raise SystemExit(f"Refusing to replay into non-local database {settings.DB_HOST} (use --allow-remote-db)")
+        await prepare_database(profanity_filter)
+
+    bot = FakeBot(latency=args.latency, seed=args.seed)
+    if bot_id:
+        # Пользователи не должны совпасть с ботом, которого видели при записи
+        bot.id = bot_id
+    bot._update_ids = iter(range(10 ** 12, 10 ** 13))
+    recorder = UpdateRecorder()
+    role_queue = RoleJobQueue()
+    activity_service = ActivityService(role_queue)
+    application = build_application(
+        bot, MeasuredProcessor(args.concurrency, recorder),
+        activity_service, profanity_filter, role_queue, rate_limiter=args.rate_limiter
+    )
+
+    db_before = db_calls(store)
+    elapsed = None
+    try:
+        async with application:
+            await application.start()
+            await role_queue.start()
+            await deletion_scheduler.start(application.bot)
+            started = time.perf_counter()
+            try:
+                await feed(application, recorder, records, args.speed)
+                await asyncio.wait_for(recorder.idle.wait(), timeout=args.timeout)
+                await asyncio.wait_for(role_queue.join(), timeout=args.timeout)
+            except asyncio.TimeoutError:
+                print(f"timed out after {args.timeout}s: {len(recorder.sent_at)} updates and "
+                      f"{role_queue.depth} role jobs still pending")
+            finally:
+                elapsed = time.perf_counter() - started
+                await role_queue.stop()
+                await deletion_scheduler.stop()
+                await application.stop()
+    finally:
+        if store is not None:
+            store.uninstall()
+        else:
+            await Database.close_pool()
+
+    handled = sum(len(values) for kind, values in recorder.processing.items() if kind != 'service')
+    return {
+        'capture': os.path.basename(args.capture),
+        'speed': args.speed,
+        'updates': handled,
+        'captured_span_s': round(records[-1]['ts'] - records[0]['ts'], 3),
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(handled / elapsed, 1) if elapsed else 0,
+        'db_per_update': round((db_calls(store) - db_before) / max(handled, 1), 3),
+        'api_per_update': round(sum(bot.calls.values()) / max(handled, 1), 3),
+        'api_calls': dict(bot.calls.most_common()),
+        'kinds': {
+            kind: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+            for kind, values in sorted(recorder.processing.items())
+        },
+    }
+
+def print_summary(summary: dict):
+    print(f"{summary['updates']} updates from {summary['capture']} "
+          f"(captured over {summary['captured_span_s']}s) at speed {summary['speed'] or 'max'}")
+    print(f"throughput: {summary['throughput']} upd/s in {summary['elapsed_s']}s, "
+          f"db/update={summary['db_per_update']} api/update={summary['api_per_update']}")
+    print(f"{'kind':14} {'count':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, stats in summary['kinds'].items():
+        print(f"{kind:14} {stats['count']:6d} {stats['p50_ms']:8.1f} {stats['p99_ms']:8.1f}")
+    print(f"api calls: {summary['api_calls']}")
+
+def compare(summary: dict, baseline: dict, tolerance: float, latency_tolerance: float) -> list:
+    """Регрессии относительно прошлого прогона на том же файле"""
+    problems = []
+    for key in ('db_per_update', 'api_per_update'):
+        if summary[key] > baseline[key] * (1 + tolerance) + 1e-9:
+            problems.append(f"{key}: {baseline[key]} -> {summary[key]}")
+    for kind, stats in summary['kinds'].items():
+        before = baseline['kinds'].get(kind)
+        if before and stats['p99_ms'] > before['p99_ms'] * (1 + latency_tolerance) + 1:
+            problems.append(f"{kind} p99: {before['p99_ms']}ms -> {stats['p99_ms']}ms")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help="файл записи (CAPTURE_FILE)")
+    parser.add_argument('--speed', type=float, default=1.0, help="1 - как записано, N - в N раз быстрее, 0 - без пауз")
+    parser.add_argument('--limit', type=int, default=None, help="воспроизвести первые N обновлений")
+    parser.add_argument('--in-memory', action='store_true', help="хранилище в памяти вместо Postgres")
+    parser.add_argument('--profanity-words', default='', help="матные слова для --in-memory, через запятую")
+    parser.add_argument('--allow-remote-db', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.03, help="задержка одного вызова API, сек")
+    parser.add_argument('--concurrency', type=int, default=settings.MAX_CONCURRENT_UPDATES)
+    parser.add_argument('--rate-limiter', action='store_true', help="ограничения Telegram как в main.py")
+    parser.add_argument('--timeout', type=float, default=300, help="ожидание обработки после подачи, сек")
+    parser.add_argument('--save', help="сохранить итог в JSON")
+    parser.add_argument('--compare', help="итог прошлого прогона (JSON) для проверки регрессий")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="допустимый рост обращений к БД/API")
+    parser.add_argument('--latency-tolerance', type=float, default=0.5, help="допустимый рост p99 обработки")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            problems = compare(summary, json.load(f), args.tolerance, args.latency_tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Задержка RoleService.assign_role на фейковом Bot API (p50/p99)"""
+import asyncio
+import argparse
+import statistics
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from types import SimpleNamespace
+from benchmarks.fakes import FakeBot, InMemoryStore
+from database.models import User
+from handlers.chat_member_handlers import ChatMemberHandlers
+from services.role_service import RoleService
+
+CHAT_ID = -100
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run(args):
+    store = InMemoryStore().install()
+    bot = FakeBot(
+        latency=args.latency,
+        propagation_delay=(args.min_propagation, args.max_propagation),
+        seed=args.seed
+    )
+    context = SimpleNamespace(bot=bot, bot_data={})
+    tracker = ChatMemberHandlers()
+    bot.on_update = lambda update: tracker.track_chat_member(update, context)
+
+    latencies = []
+    try:
+        for user_id in range(1, args.users + 1):
+            store.users[(CHAT_ID, user_id)] = User(user_id=user_id, chat_id=CHAT_ID)
+            started = time.perf_counter()
+            await RoleService.assign_role(user_id, CHAT_ID, f"nick{user_id}", context)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        store.uninstall()
+
+    calls = sum(bot.calls.values())
+    print(f"users={args.users} latency={args.latency}s propagation={args.min_propagation}-{args.max_propagation}s")
+    print(f"p50={percentile(latencies, 50):.3f}s p99={percentile(latencies, 99):.3f}s "
+          f"mean={statistics.mean(latencies):.3f}s max={max(latencies):.3f}s")
+    print(f"api calls per assign: {calls / args.users:.1f} {dict(bot.calls)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка одного вызова API, сек")
+    parser.add_argument('--min-propagation', type=float, default=0.05)
+    parser.add_argument('--max-propagation', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
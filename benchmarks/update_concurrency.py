@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Пропускная способность обработки обновлений: последовательно против PerUserUpdateProcessor"""
+import asyncio
+import argparse
+import random
+import statistics
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collections import defaultdict
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from benchmarks.fake_api_server import FakeBotApiServer
+from benchmarks.role_assign_latency import percentile
+from benchmarks.webhook_ingress import TOKEN, load_updates
+from services.update_processor import PerUserUpdateProcessor
+
+class Workload:
+    """Смешанная нагрузка: обычные сообщения и редкие медленные /cn"""
+
+    def __init__(self, args, total: int):
+        self.args = args
+        self.total = total
+        # Медленные обновления у случайных пользователей
+        rng = random.Random(args.seed)
+        self.slow_ids = set(rng.sample(range(1, total + 1), total // args.slow_every))
+        self.sent_at = {}
+        self.delays = []
+        self.slow_delays = []
+        self.order = defaultdict(list)
+        self.done = asyncio.Event()
+
+    async def handle(self, update: Update, context):
+        user_id = update.effective_user.id
+        self.order[user_id].append(update.update_id)
+        slow = update.update_id in self.slow_ids
+        # Медленное обновление - /cn в ожидании промоута, обычное - БД и удаление сообщения
+        await asyncio.sleep(self.args.slow_time if slow else self.args.fast_time)
+        delay = time.perf_counter() - self.sent_at[update.update_id]
+        (self.slow_delays if slow else self.delays).append(delay)
+        if len(self.delays) + len(self.slow_delays) >= self.total:
+            self.done.set()
+
+    def ordered(self) -> bool:
+        return all(ids == sorted(ids) for ids in self.order.values())
+
+async def run_mode(args, updates: list, processor) -> tuple:
+    server = FakeBotApiServer(latency=0)
+    await server.start()
+    workload = Workload(args, len(updates))
+    builder = Application.builder().token(TOKEN).base_url(server.base_url).updater(None)
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, workload.handle))
+
+    started = time.perf_counter()
+    async with application:
+        await application.start()
+        for data in updates:
+            workload.sent_at[data['update_id']] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(data, application.bot))
+            if args.interval:
+                await asyncio.sleep(args.interval)
+        await asyncio.wait_for(workload.done.wait(), timeout=600)
+        await application.stop()
+    await server.stop()
+    return workload, time.perf_counter() - started
+
+def report(mode: str, workload: Workload, elapsed: float):
+    print(f"{mode:12} throughput={workload.total / elapsed:.0f} upd/s "
+          f"fast p50={percentile(workload.delays, 50) * 1000:.0f}ms "
+          f"p99={percentile(workload.delays, 99) * 1000:.0f}ms "
+          f"mean={statistics.mean(workload.delays) * 1000:.0f}ms "
+          f"per-user order kept={workload.ordered()}")
+
+async def run(args):
+    updates = load_updates(None, args.count)
+    print(f"updates={args.count} users=50 slow 1/{args.slow_every} ({args.slow_time}s), "
+          f"fast {args.fast_time}s, interval={args.interval}s")
+    workload, elapsed = await run_mode(args, updates, None)
+    report('sequential', workload, elapsed)
+    workload, elapsed = await run_mode(args, updates, PerUserUpdateProcessor(args.concurrency))
+    report(f'per-user/{args.concurrency}', workload, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--slow-every', type=int, default=50, help="доля медленных обновлений 1/N")
+    parser.add_argument('--slow-time', type=float, default=1.0)
+    parser.add_argument('--fast-time', type=float, default=0.01)
+    parser.add_argument('--interval', type=float, default=0.005)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Пропускная способность и задержка доставки обновлений: polling против webhook"""
+import asyncio
+import argparse
+import json
+import statistics
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from benchmarks.fake_api_server import FakeBotApiServer
+from benchmarks.role_assign_latency import percentile
+
+TOKEN = "123456:benchmark"
+SECRET = "benchmark-secret"
+WEBHOOK_PATH = "telegram"
+CHAT_ID = -100
+
+def load_updates(path: str, count: int) -> list:
+    """Записанные обновления (JSON lines) или синтетические сообщения"""
+    if path:
+        with open(path, encoding='utf-8') as f:
+            recorded = [json.loads(line) for line in f if line.strip()]
+        return [dict(recorded[i % len(recorded)], update_id=i + 1) for i in range(count)]
+    return [
+        {
+            'update_id': i + 1,
+            'message': {
+                'message_id': i + 1,
+                'date': int(time.time()),
+                'chat': {'id': CHAT_ID, 'type': 'supergroup', 'title': 'benchmark'},
+                'from': {'id': 1 + i % 50, 'is_bot': False, 'first_name': f"user{1 + i % 50}"},
+                'text': f"message {i}"
+            }
+        }
+        for i in range(count)
+    ]
+
+class Meter:
+    """Время от появления обновления до его обработки"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent_at = {}
+        self.delays = []
+        self.done = asyncio.Event()
+
+    async def on_update(self, update: Update, context):
+        self.delays.append(time.perf_counter() - self.sent_at[update.update_id])
+        if len(self.delays) >= self.total:
+            self.done.set()
+
+def build_application(server: FakeBotApiServer, meter: Meter) -> Application:
+    application = Application.builder().token(TOKEN).base_url(server.base_url).build()
+    application.add_handler(TypeHandler(Update, meter.on_update))
+    return application
+
+async def run_polling(args, updates: list) -> Meter:
+    server = FakeBotApiServer(latency=args.latency)
+    await server.start()
+    meter = Meter(len(updates))
+    application = build_application(server, meter)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(timeout=10)
+    try:
+        for update in updates:
+            meter.sent_at[update['update_id']] = time.perf_counter()
+            server.push_update(update)
+            if args.interval:
+                await asyncio.sleep(args.interval)
+        await asyncio.wait_for(meter.done.wait(), timeout=60)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await server.stop()
+    return meter
+
+async def run_webhook(args, updates: list) -> Meter:
+    server = FakeBotApiServer(latency=args.latency)
+    await server.start()
+    meter = Meter(len(updates))
+    application = build_application(server, meter)
+    url = f"http://127.0.0.1:{args.port}/{WEBHOOK_PATH}"
+    await application.initialize()
+    await application.start()
+    await application.updater.start_webhook(
+        listen='127.0.0.1',
+        port=args.port,
+        url_path=WEBHOOK_PATH,
+        webhook_url=url,
+        secret_token=SECRET,
+        max_connections=args.max_connections
+    )
+    limits = httpx.Limits(max_connections=args.max_connections)
+    semaphore = asyncio.Semaphore(args.max_connections)
+    try:
+        async with httpx.AsyncClient(limits=limits) as client:
+            # Запрос без секретного токена должен быть отклонен
+            rejected = await client.post(url, json=updates[0])
+            print(f"webhook without secret token: HTTP {rejected.status_code}")
+
+            async def post(update: dict):
+                async with semaphore:
+                    # Telegram доставляет запрос за половину RTT
+                    if args.latency:
+                        await asyncio.sleep(args.latency / 2)
+                    response = await client.post(
+                        url, json=update,
+                        headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}
+                    )
+                    response.raise_for_status()
+
+            tasks = []
+            for update in updates:
+                meter.sent_at[update['update_id']] = time.perf_counter()
+                tasks.append(asyncio.create_task(post(update)))
+                if args.interval:
+                    await asyncio.sleep(args.interval)
+            await asyncio.gather(*tasks)
+            await asyncio.wait_for(meter.done.wait(), timeout=60)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await server.stop()
+    return meter
+
+def report(mode: str, meter: Meter, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"{mode:8} updates={len(meter.delays)} throughput={len(meter.delays) / elapsed:.0f} upd/s "
+          f"delay p50={percentile(meter.delays, 50) * 1000:.1f}ms "
+          f"p99={percentile(meter.delays, 99) * 1000:.1f}ms "
+          f"mean={statistics.mean(meter.delays) * 1000:.1f}ms")
+
+async def run(args):
+    updates = load_updates(args.updates, args.count)
+    print(f"updates={args.count} interval={args.interval}s rtt={args.latency}s "
+          f"max_connections={args.max_connections}")
+    for mode, runner in (('polling', run_polling), ('webhook', run_webhook)):
+        if args.mode in (mode, 'both'):
+            started = time.perf_counter()
+            meter = await runner(args, updates)
+            report(mode, meter, started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=('polling', 'webhook', 'both'), default='both')
+    parser.add_argument('--updates', help="файл с записанными обновлениями (JSON lines)")
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.002, help="пауза между обновлениями, сек")
+    parser.add_argument('--latency', type=float, default=0.05, help="RTT до Telegram, сек")
+    parser.add_argument('--max-connections', type=int, default=40)
+    parser.add_argument('--port', type=int, default=8443)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
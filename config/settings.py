@@ -1,5 +1,6 @@
 import os
 import logging
+import secrets
 from typing import List, Optional
 from dotenv import load_dotenv
 
@@ -36,6 +37,55 @@ class Settings:
         self.ADMIN_IDS = parse_admin_ids(os.getenv('ADMIN_IDS', ''))
         self.BOT_USERNAME = os.getenv('BOT_USERNAME', '')
         self.CHAT_ID = self._parse_chat_id(os.getenv('CHAT_ID'))
+        # Все обслуживаемые чаты; CHAT_ID входит в список
+        self.CHAT_IDS = self._parse_chat_ids(os.getenv('CHAT_IDS', ''))
+        if self.CHAT_ID and self.CHAT_ID not in self.CHAT_IDS:
+            self.CHAT_IDS.insert(0, self.CHAT_ID)
+        
+        # Получение обновлений: polling или webhook
+        self.UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').strip().lower()
+        self.WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+        self.WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        self.WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+        self.WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+        # Без заданного токена генерируется случайный на время работы процесса
+        # (только для одного воркера: у нескольких секрет должен быть общим)
+        self.WEBHOOK_SECRET_TOKEN_SET = bool(os.getenv('WEBHOOK_SECRET_TOKEN'))
+        self.WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or secrets.token_urlsafe(32)
+        self.WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+        # Обновления разных пользователей обрабатываются параллельно
+        self.MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+        
+        # Метрики в формате Prometheus
+        self.METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))  # 0 - отключено
+        
+        # Трассировка обновлений (БД, Bot API, шаги назначения ролей)
+        self.TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')  # Пусто - выборка не пишется
+        self.TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # Доля обновлений в файле
+        self.TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', '5'))  # Секунд; медленные пишутся всегда (0 - отключено)
+        
+        # Запись входящих обновлений (обезличенных) для воспроизведения: benchmarks/replay.py
+        self.CAPTURE_FILE = os.getenv('CAPTURE_FILE', '')  # Пусто - запись выключена
+        # Ключ обезличивания; постоянный ключ дает одинаковые псевдонимы между перезапусками
+        self.CAPTURE_KEY = os.getenv('CAPTURE_KEY') or secrets.token_hex(16)
+        self.CAPTURE_FLUSH_INTERVAL = float(os.getenv('CAPTURE_FLUSH_INTERVAL', '5'))  # Секунды
+        
+        # Профилирование по запросу (/profile или SIGUSR1)
+        self.PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+        self.PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # Секунды между выборками стека
+        self.PROFILE_LOOP_LAG_THRESHOLD = float(os.getenv('PROFILE_LOOP_LAG_THRESHOLD', '0.1'))  # Секунды блокировки loop
+        self.PROFILE_DEFAULT_SECONDS = int(os.getenv('PROFILE_DEFAULT_SECONDS', '30'))
+        self.PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '300'))
+        
+        # Несколько процессов бота: чаты делятся между воркерами по chat_id
+        self.WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+        self.WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+        self.WORKER_URLS = [url.strip() for url in os.getenv('WORKER_URLS', '').split(',') if url.strip()]
+        self.LEADER_CHECK_INTERVAL = float(os.getenv('LEADER_CHECK_INTERVAL', '10'))  # Секунды
+        self.SWEEP_BATCH_SIZE = int(os.getenv('SWEEP_BATCH_SIZE', '100'))
+        self.SWEEP_CLAIM_TTL = int(os.getenv('SWEEP_CLAIM_TTL', '300'))  # Секунды
+        self.DELETION_RECOVERY_GRACE = float(os.getenv('DELETION_RECOVERY_GRACE', '10'))  # Секунды
         
         # Database
         self.DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -47,8 +97,59 @@ class Settings:
         
         # Application
         self.LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+        self.LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').strip().lower()  # 'json' или 'text'
+        # Частые строки (на каждое сообщение): не больше LOG_SAMPLE_LIMIT за LOG_SAMPLE_WINDOW сек на шаблон
+        self.LOG_SAMPLE_LIMIT = int(os.getenv('LOG_SAMPLE_LIMIT', '10'))  # 0 - без ограничения
+        self.LOG_SAMPLE_WINDOW = float(os.getenv('LOG_SAMPLE_WINDOW', '1'))  # Секунды
         self.ACTIVITY_TIMEOUT_MINUTES = int(os.getenv('ACTIVITY_TIMEOUT_MINUTES', '5'))
+        self.ACTIVITY_SAFETY_SCAN_MINUTES = int(os.getenv('ACTIVITY_SAFETY_SCAN_MINUTES', '15'))
+        # Ведущий подгружает сроки, обновленные другими воркерами (секунды)
+        self.ACTIVITY_DEADLINE_REFRESH = float(os.getenv('ACTIVITY_DEADLINE_REFRESH', '10'))
+        self.RECONCILE_INTERVAL_MINUTES = int(os.getenv('RECONCILE_INTERVAL_MINUTES', '30'))  # 0 - отключено
+        self.RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '4'))
+        self.ERROR_DEDUP_WINDOW = int(os.getenv('ERROR_DEDUP_WINDOW', '300'))  # Секунды
+        self.ERROR_DIGEST_INTERVAL = int(os.getenv('ERROR_DIGEST_INTERVAL', '300'))  # Секунды
+        self.ERROR_ALERTS_PER_DIGEST = int(os.getenv('ERROR_ALERTS_PER_DIGEST', '5'))
+        self.ERROR_LOG_FLUSH_INTERVAL = float(os.getenv('ERROR_LOG_FLUSH_INTERVAL', '5'))  # Секунды
         self.MESSAGE_DELETE_DELAY = 5  # Секунды для удаления сообщений
+        self.DELETE_BATCH_WINDOW = float(os.getenv('DELETE_BATCH_WINDOW', '0.5'))  # Окно объединения удалений (сек)
+        self.CHAT_MEMBER_CACHE_TTL = int(os.getenv('CHAT_MEMBER_CACHE_TTL', '30'))  # Секунды
+        self.PROMOTION_CONFIRM_TIMEOUT = float(os.getenv('PROMOTION_CONFIRM_TIMEOUT', '8'))  # Секунды
+        self.ROLE_QUEUE_WORKERS = int(os.getenv('ROLE_QUEUE_WORKERS', '4'))
+        self.RESTORE_FAILURE_COOLDOWN = float(os.getenv('RESTORE_FAILURE_COOLDOWN', '60'))  # Секунды
+        self.BREAKER_BASE_BACKOFF = float(os.getenv('BREAKER_BASE_BACKOFF', '60'))  # Секунды
+        self.BREAKER_MAX_BACKOFF = float(os.getenv('BREAKER_MAX_BACKOFF', '1800'))  # Секунды
+        
+        # Ограничение исходящих запросов к Bot API
+        self.RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', '30'))
+        self.RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', '20'))
+        self.RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '2'))
+        self.RATE_LIMIT_QUEUE_WARN = int(os.getenv('RATE_LIMIT_QUEUE_WARN', '50'))
+        
+        # HTTP-клиент Bot API; getUpdates использует отдельное соединение со своими таймаутами
+        self.BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', '16'))  # Одновременных соединений
+        self.BOT_API_KEEPALIVE_EXPIRY = float(os.getenv('BOT_API_KEEPALIVE_EXPIRY', '60'))  # Секунды простоя до закрытия соединения
+        self.BOT_API_HTTP_VERSION = os.getenv('BOT_API_HTTP_VERSION', '1.1').strip()  # '1.1' или '2'
+        self.BOT_API_CONNECT_TIMEOUT = float(os.getenv('BOT_API_CONNECT_TIMEOUT', '5'))  # Секунды
+        self.BOT_API_READ_TIMEOUT = float(os.getenv('BOT_API_READ_TIMEOUT', '10'))  # Секунды
+        self.BOT_API_WRITE_TIMEOUT = float(os.getenv('BOT_API_WRITE_TIMEOUT', '10'))  # Секунды
+        self.BOT_API_POOL_TIMEOUT = float(os.getenv('BOT_API_POOL_TIMEOUT', '5'))  # Ожидание свободного соединения (сек)
+        self.GET_UPDATES_CONNECT_TIMEOUT = float(os.getenv('GET_UPDATES_CONNECT_TIMEOUT', '5'))  # Секунды
+        self.GET_UPDATES_READ_TIMEOUT = float(os.getenv('GET_UPDATES_READ_TIMEOUT', '5'))  # Сверх таймаута long polling (сек)
+        self.GET_UPDATES_POOL_TIMEOUT = float(os.getenv('GET_UPDATES_POOL_TIMEOUT', '1'))  # Секунды
+        
+        # Антифлуд: проверяется до любых запросов к БД (0 - проверка отключена)
+        self.FLOOD_WINDOW = float(os.getenv('FLOOD_WINDOW', '10'))  # Скользящее окно (сек)
+        self.FLOOD_USER_LIMIT = int(os.getenv('FLOOD_USER_LIMIT', '10'))  # Сообщений пользователя за окно
+        self.FLOOD_CHAT_LIMIT = int(os.getenv('FLOOD_CHAT_LIMIT', '200'))  # Сообщений в чате за окно
+        self.FLOOD_MUTE_SECONDS = int(os.getenv('FLOOD_MUTE_SECONDS', '300'))  # Мут флудера (от 30 сек)
+        
+        # Рейды: почти одинаковые сообщения от разных аккаунтов удаляются
+        self.SPAM_MIN_ACCOUNTS = int(os.getenv('SPAM_MIN_ACCOUNTS', '3'))  # Разных авторов для срабатывания (0 - отключено)
+        self.SPAM_SIMILARITY = float(os.getenv('SPAM_SIMILARITY', '0.6'))  # Оценка сходства текстов (Жаккар), от 0 до 1
+        self.SPAM_WINDOW = float(os.getenv('SPAM_WINDOW', '600'))  # Секунды
+        self.SPAM_MIN_LENGTH = int(os.getenv('SPAM_MIN_LENGTH', '40'))  # Короткие сообщения не проверяются
+        self.SPAM_INDEX_SIZE = int(os.getenv('SPAM_INDEX_SIZE', '5000'))  # Сообщений в индексе одного чата
         
         # Список матных слов (можно вынести в отдельный файл)
         self.PROFANITY_WORDS = [
@@ -74,11 +175,52 @@ class Settings:
             logger.warning(f"Invalid CHAT_ID format: {chat_id_str}. Should be integer.")
             return None
     
+    def _parse_chat_ids(self, chat_ids_str: str) -> List[int]:
+        """Парсинг CHAT_IDS (через запятую)"""
+        chat_ids = []
+        for chat_id_str in chat_ids_str.split(','):
+            chat_id = self._parse_chat_id(chat_id_str)
+            if chat_id is not None and chat_id not in chat_ids:
+                chat_ids.append(chat_id)
+        return chat_ids
+    
     def _validate(self):
         """Проверка обязательных полей"""
         if not self.BOT_TOKEN:
             raise ValueError("BOT_TOKEN is required")
         
+        if self.UPDATE_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"UPDATE_MODE must be 'polling' or 'webhook', got '{self.UPDATE_MODE}'")
+        
+        if self.UPDATE_MODE == 'webhook' and not self.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL is required when UPDATE_MODE=webhook")
+        
+        # Telegram считает мут короче 30 секунд или длиннее 366 дней бессрочным
+        if not 30 <= self.FLOOD_MUTE_SECONDS <= 366 * 86400:
+            raise ValueError(f"FLOOD_MUTE_SECONDS must be between 30 and {366 * 86400}, got {self.FLOOD_MUTE_SECONDS}")
+        
+        if not 0 < self.SPAM_SIMILARITY <= 1:
+            raise ValueError(f"SPAM_SIMILARITY must be in (0, 1], got {self.SPAM_SIMILARITY}")
+        
+        if self.LOG_FORMAT not in ('json', 'text'):
+            raise ValueError(f"LOG_FORMAT must be 'json' or 'text', got '{self.LOG_FORMAT}'")
+        
+        if self.BOT_API_HTTP_VERSION not in ('1.1', '2', '2.0'):
+            raise ValueError(f"BOT_API_HTTP_VERSION must be '1.1' or '2', got '{self.BOT_API_HTTP_VERSION}'")
+        
+        if not 0 <= self.WORKER_INDEX < self.WORKER_COUNT:
+            raise ValueError(f"WORKER_INDEX must be in [0, {self.WORKER_COUNT}), got {self.WORKER_INDEX}")
+        
+        if self.WORKER_COUNT > 1 and self.UPDATE_MODE != 'webhook':
+            raise ValueError("WORKER_COUNT > 1 requires UPDATE_MODE=webhook")
+        
+        if self.WORKER_COUNT > 1 and len(self.WORKER_URLS) != self.WORKER_COUNT:
+            raise ValueError("WORKER_URLS must list a webhook URL for every worker when WORKER_COUNT > 1")
+        
+        # Секрет проверяют все воркеры, а регистрирует webhook только воркер 0
+        if self.WORKER_COUNT > 1 and not self.WEBHOOK_SECRET_TOKEN_SET:
+            raise ValueError("WEBHOOK_SECRET_TOKEN must be set explicitly (same for all workers) when WORKER_COUNT > 1")
+        
         logger.info(f"Settings loaded: ADMIN_IDS={self.ADMIN_IDS}, CHAT_ID={self.CHAT_ID}")
 
 settings = Settings()
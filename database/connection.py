@@ -2,9 +2,22 @@ import asyncpg
 import logging
 from typing import Optional
 from config.settings import settings
+from services.metrics import metrics
+from services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+DB_QUERY_SECONDS = metrics.histogram(
+    'db_query_duration_seconds', 'Database call time including pool wait', ('method',)
+)
+DB_ERRORS = metrics.counter(
+    'db_errors_total', 'Failed database calls', ('method',)
+)
+
+def _query_name(query: str) -> str:
+    """Сокращенный текст запроса для трассировки"""
+    return ' '.join(query.split())[:120]
+
 class Database:
     _pool: Optional[asyncpg.Pool] = None
     
@@ -45,26 +58,70 @@ class Database:
     async def execute(cls, query: str, *args):
         """Выполнение запроса"""
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
-            return await conn.execute(query, *args)
+        try:
+            with DB_QUERY_SECONDS.time(method='execute'), tracer.span('db.execute', query=_query_name(query)):
+                async with pool.acquire() as conn:
+                    return await conn.execute(query, *args)
+        except Exception:
+            DB_ERRORS.inc(method='execute')
+            raise
+    
+    @classmethod
+    async def executemany(cls, query: str, args):
+        """Выполнение запроса для набора параметров"""
+        pool = await cls.get_pool()
+        try:
+            with DB_QUERY_SECONDS.time(method='executemany'), tracer.span('db.executemany', query=_query_name(query)):
+                async with pool.acquire() as conn:
+                    return await conn.executemany(query, args)
+        except Exception:
+            DB_ERRORS.inc(method='executemany')
+            raise
     
     @classmethod
     async def fetch(cls, query: str, *args):
         """Получение нескольких записей"""
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
-            return await conn.fetch(query, *args)
+        try:
+            with DB_QUERY_SECONDS.time(method='fetch'), tracer.span('db.fetch', query=_query_name(query)):
+                async with pool.acquire() as conn:
+                    return await conn.fetch(query, *args)
+        except Exception:
+            DB_ERRORS.inc(method='fetch')
+            raise
     
     @classmethod
     async def fetchrow(cls, query: str, *args):
         """Получение одной записи"""
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
-            return await conn.fetchrow(query, *args)
+        try:
+            with DB_QUERY_SECONDS.time(method='fetchrow'), tracer.span('db.fetchrow', query=_query_name(query)):
+                async with pool.acquire() as conn:
+                    return await conn.fetchrow(query, *args)
+        except Exception:
+            DB_ERRORS.inc(method='fetchrow')
+            raise
     
     @classmethod
     async def fetchval(cls, query: str, *args):
         """Получение одного значения"""
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
-            return await conn.fetchval(query, *args)
\ No newline at end of file
+        try:
+            with DB_QUERY_SECONDS.time(method='fetchval'), tracer.span('db.fetchval', query=_query_name(query)):
+                async with pool.acquire() as conn:
+                    return await conn.fetchval(query, *args)
+        except Exception:
+            DB_ERRORS.inc(method='fetchval')
+            raise
+    
+    @classmethod
+    async def acquire(cls) -> asyncpg.Connection:
+        """Выделенное подключение (например, для сессионных advisory-блокировок)"""
+        pool = await cls.get_pool()
+        return await pool.acquire()
+    
+    @classmethod
+    async def release(cls, conn: asyncpg.Connection):
+        """Возврат выделенного подключения в пул"""
+        if cls._pool:
+            await cls._pool.release(conn)
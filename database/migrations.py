@@ -5,7 +5,7 @@ logger = logging.getLogger(__name__)
 
 CREATE_USERS_TABLE = """
 CREATE TABLE IF NOT EXISTS users (
-    user_id BIGINT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
     chat_id BIGINT NOT NULL,
     username VARCHAR(255),
     first_name VARCHAR(255),
@@ -15,8 +15,10 @@ CREATE TABLE IF NOT EXISTS users (
     is_blocked BOOLEAN DEFAULT FALSE,
     last_activity TIMESTAMP,
     warnings_count INTEGER DEFAULT 0,
+    sweep_claimed_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (chat_id, user_id)
 );
 """
 
@@ -42,6 +44,7 @@ CREATE_ROLE_HISTORY_TABLE = """
 CREATE TABLE IF NOT EXISTS role_history (
     history_id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL,
+    chat_id BIGINT,
     role_name VARCHAR(255) NOT NULL,
     assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     removed_at TIMESTAMP,
@@ -49,14 +52,35 @@ CREATE TABLE IF NOT EXISTS role_history (
 );
 """
 
+CREATE_SCHEDULED_DELETIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS scheduled_deletions (
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    delete_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+);
+"""
+
+CREATE_CHAT_SETTINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS chat_settings (
+    chat_id BIGINT PRIMARY KEY,
+    activity_timeout_minutes INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
 CREATE_INDEXES = [
-    "CREATE INDEX IF NOT EXISTS idx_users_chat_id ON users(chat_id);",
+    "CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_users_chat_activity ON users(chat_id, last_activity) WHERE role_assigned = TRUE;",
     "CREATE INDEX IF NOT EXISTS idx_users_role_assigned ON users(role_assigned);",
+    "CREATE INDEX IF NOT EXISTS idx_users_role_updated ON users(updated_at) WHERE role_assigned = TRUE;",
     "CREATE INDEX IF NOT EXISTS idx_users_is_blocked ON users(is_blocked);",
     "CREATE INDEX IF NOT EXISTS idx_profanity_words_word ON profanity_words(word);",
     "CREATE INDEX IF NOT EXISTS idx_logs_user_id ON logs(user_id);",
     "CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at);",
     "CREATE INDEX IF NOT EXISTS idx_role_history_user_id ON role_history(user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_role_history_chat_user ON role_history(chat_id, user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_deletions_delete_at ON scheduled_deletions(delete_at);",
 ]
 
 async def run_migrations():
@@ -67,6 +91,8 @@ async def run_migrations():
         await Database.execute(CREATE_PROFANITY_WORDS_TABLE)
         await Database.execute(CREATE_LOGS_TABLE)
         await Database.execute(CREATE_ROLE_HISTORY_TABLE)
+        await Database.execute(CREATE_SCHEDULED_DELETIONS_TABLE)
+        await Database.execute(CREATE_CHAT_SETTINGS_TABLE)
         
         # Создаем индексы
         for index_query in CREATE_INDEXES:
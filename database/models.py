@@ -31,10 +31,23 @@ class LogEntry(BaseModel):
     details: Optional[str] = None
     created_at: datetime = datetime.now()
 
+class ScheduledDeletion(BaseModel):
+    """Отложенное удаление сообщения"""
+    chat_id: int
+    message_id: int
+    delete_at: datetime
+
+class ChatConfig(BaseModel):
+    """Настройки чата"""
+    chat_id: int
+    activity_timeout_minutes: Optional[int] = None  # None - значение из настроек
+    updated_at: datetime = datetime.now()
+
 class RoleHistory(BaseModel):
     """История назначения ролей"""
     history_id: Optional[int] = None
     user_id: int
+    chat_id: Optional[int] = None
     role_name: str
     assigned_at: datetime = datetime.now()
     removed_at: Optional[datetime] = None
@@ -1,8 +1,9 @@
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
 from database.connection import Database
-from database.models import User, ProfanityWord, LogEntry, RoleHistory
+from config.settings import settings
+from database.models import User, ProfanityWord, LogEntry, RoleHistory, ScheduledDeletion, ChatConfig
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +18,7 @@ class UserRepository:
                 nickname, role_assigned, is_blocked,
                 last_activity, warnings_count, created_at, updated_at
             ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-            ON CONFLICT (user_id) DO UPDATE SET
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
                 username = EXCLUDED.username,
                 first_name = EXCLUDED.first_name,
                 last_name = EXCLUDED.last_name,
@@ -26,7 +27,8 @@ class UserRepository:
                 is_blocked = EXCLUDED.is_blocked,
                 last_activity = EXCLUDED.last_activity,
                 warnings_count = EXCLUDED.warnings_count,
-                updated_at = EXCLUDED.updated_at
+                updated_at = EXCLUDED.updated_at,
+                sweep_claimed_at = NULL
             """
             
             await Database.execute(
@@ -42,11 +44,68 @@ class UserRepository:
             return False
     
     @staticmethod
-    async def get_by_id(user_id: int) -> Optional[User]:
-        """Получение пользователя по ID"""
+    async def create(user: User) -> bool:
+        """Создание пользователя; существующая строка не перезаписывается"""
+        try:
+            query = """
+            INSERT INTO users (
+                user_id, chat_id, username, first_name, last_name,
+                nickname, role_assigned, is_blocked,
+                last_activity, warnings_count, created_at, updated_at
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+            ON CONFLICT (chat_id, user_id) DO NOTHING
+            """
+            await Database.execute(
+                query,
+                user.user_id, user.chat_id, user.username, user.first_name,
+                user.last_name, user.nickname, user.role_assigned,
+                user.is_blocked, user.last_activity, user.warnings_count,
+                user.created_at, user.updated_at
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error creating user: {e}")
+            return False
+    
+    @staticmethod
+    async def touch_activity(user_id: int, chat_id: int) -> Optional[User]:
+        """Отметка активности; возвращает строку после обновления (None - пользователя нет).
+
+        Меняются только last_activity и updated_at: никнейм и роль пишут
+        фоновые операции с ролями, обработчики их не перезаписывают.
+        """
+        try:
+            query = """
+            UPDATE users SET last_activity = $1, updated_at = $1
+            WHERE chat_id = $2 AND user_id = $3
+            RETURNING *
+            """
+            row = await Database.fetchrow(query, datetime.now(), chat_id, user_id)
+            return User(**dict(row)) if row else None
+        except Exception as e:
+            logger.error(f"Error updating user activity: {e}")
+            return None
+    
+    @staticmethod
+    async def increment_warnings(user_id: int, chat_id: int) -> Optional[int]:
+        """Увеличение счетчика предупреждений; возвращает новое значение"""
         try:
-            query = "SELECT * FROM users WHERE user_id = $1"
-            row = await Database.fetchrow(query, user_id)
+            query = """
+            UPDATE users SET warnings_count = warnings_count + 1, updated_at = $1
+            WHERE chat_id = $2 AND user_id = $3
+            RETURNING warnings_count
+            """
+            return await Database.fetchval(query, datetime.now(), chat_id, user_id)
+        except Exception as e:
+            logger.error(f"Error incrementing warnings: {e}")
+            return None
+    
+    @staticmethod
+    async def get_by_id(user_id: int, chat_id: int) -> Optional[User]:
+        """Получение пользователя чата по ID"""
+        try:
+            query = "SELECT * FROM users WHERE chat_id = $1 AND user_id = $2"
+            row = await Database.fetchrow(query, chat_id, user_id)
             
             if row:
                 user_dict = dict(row)
@@ -77,27 +136,163 @@ class UserRepository:
             return []
     
     @staticmethod
-    async def get_inactive_users(timeout_minutes: int) -> List[User]:
-        """Получение неактивных пользователей"""
+    async def get_inactive_users(chat_id: int, timeout_minutes: int) -> List[User]:
+        """Получение неактивных пользователей чата"""
         try:
             timeout = datetime.now() - timedelta(minutes=timeout_minutes)
             query = """
             SELECT * FROM users 
-            WHERE role_assigned = TRUE 
-            AND last_activity < $1
+            WHERE chat_id = $1
+            AND role_assigned = TRUE 
+            AND last_activity < $2
             """
-            rows = await Database.fetch(query, timeout)
+            rows = await Database.fetch(query, chat_id, timeout)
             return [User(**dict(row)) for row in rows]
         except Exception as e:
             logger.error(f"Error getting inactive users: {e}")
             return []
     
     @staticmethod
-    async def delete(user_id: int) -> bool:
-        """Удаление пользователя"""
+    async def claim_inactive(
+        chat_id: int,
+        timeout_minutes: int,
+        limit: int,
+        user_ids: Optional[List[int]] = None
+    ) -> List[User]:
+        """Захват пачки неактивных пользователей чата для снятия роли.
+
+        Строки, заблокированные или недавно захваченные другим процессом,
+        пропускаются (FOR UPDATE SKIP LOCKED), поэтому один пользователь не
+        обрабатывается двумя воркерами.
+        """
         try:
-            query = "DELETE FROM users WHERE user_id = $1"
-            await Database.execute(query, user_id)
+            now = datetime.now()
+            query = """
+            UPDATE users SET sweep_claimed_at = $1
+            WHERE (chat_id, user_id) IN (
+                SELECT chat_id, user_id FROM users
+                WHERE chat_id = $2
+                AND role_assigned = TRUE
+                AND last_activity < $3
+                AND (sweep_claimed_at IS NULL OR sweep_claimed_at < $4)
+                AND ($5::bigint[] IS NULL OR user_id = ANY($5::bigint[]))
+                ORDER BY last_activity
+                LIMIT $6
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """
+            rows = await Database.fetch(
+                query, now, chat_id,
+                now - timedelta(minutes=timeout_minutes),
+                now - timedelta(seconds=settings.SWEEP_CLAIM_TTL),
+                user_ids, limit
+            )
+            return [User(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error claiming inactive users: {e}")
+            return []
+    
+    @staticmethod
+    async def get_with_role(chat_id: Optional[int] = None) -> List[User]:
+        """Получение пользователей с назначенной ролью (всех чатов или одного)"""
+        try:
+            if chat_id is None:
+                query = "SELECT * FROM users WHERE role_assigned = TRUE"
+                rows = await Database.fetch(query)
+            else:
+                query = "SELECT * FROM users WHERE chat_id = $1 AND role_assigned = TRUE"
+                rows = await Database.fetch(query, chat_id)
+            return [User(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting users with role: {e}")
+            return []
+    
+    @staticmethod
+    async def get_with_role_updated_since(since: datetime) -> List[User]:
+        """Пользователи с ролью, чьи строки изменены начиная с since"""
+        try:
+            query = "SELECT * FROM users WHERE role_assigned = TRUE AND updated_at >= $1"
+            rows = await Database.fetch(query, since)
+            return [User(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting recently updated users with role: {e}")
+            return []
+    
+    @staticmethod
+    async def get_chat_ids_with_roles() -> List[int]:
+        """Получение чатов, в которых есть пользователи с ролью"""
+        try:
+            query = "SELECT DISTINCT chat_id FROM users WHERE role_assigned = TRUE"
+            rows = await Database.fetch(query)
+            return [row['chat_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting chat ids with roles: {e}")
+            return []
+    
+    @staticmethod
+    async def get_chat_stats(chat_id: int) -> Dict[str, int]:
+        """Количество пользователей чата и пользователей с ролью одним запросом"""
+        try:
+            query = """
+            SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE role_assigned) AS with_role
+            FROM users WHERE chat_id = $1
+            """
+            row = await Database.fetchrow(query, chat_id)
+            return {'total': row['total'], 'with_role': row['with_role']}
+        except Exception as e:
+            logger.error(f"Error getting chat stats: {e}")
+            return {'total': 0, 'with_role': 0}
+    
+    @staticmethod
+    async def set_role_assigned_bulk(chat_id: int, user_ids: List[int], role_assigned: bool) -> bool:
+        """Массовое изменение флага роли в чате одним запросом"""
+        try:
+            query = """
+            UPDATE users
+            SET role_assigned = $1, updated_at = $2
+            WHERE chat_id = $3 AND user_id = ANY($4::bigint[])
+            """
+            await Database.execute(query, role_assigned, datetime.now(), chat_id, user_ids)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating role flag in bulk: {e}")
+            return False
+    
+    @staticmethod
+    async def update_role(
+        user_id: int,
+        chat_id: int,
+        nickname: Optional[str] = None,
+        role_assigned: Optional[bool] = None
+    ) -> bool:
+        """Изменение только никнейма и флага роли (None - без изменений).
+
+        Операции с ролями идут в фоне параллельно с обработчиками, поэтому
+        строка целиком не перезаписывается: last_activity, warnings_count и
+        захват сборщиком, записанные за время операции, сохраняются.
+        """
+        try:
+            query = """
+            UPDATE users
+            SET nickname = COALESCE($1, nickname),
+                role_assigned = COALESCE($2::boolean, role_assigned),
+                sweep_claimed_at = CASE WHEN $2::boolean = FALSE THEN NULL ELSE sweep_claimed_at END,
+                updated_at = $3
+            WHERE chat_id = $4 AND user_id = $5
+            """
+            await Database.execute(query, nickname, role_assigned, datetime.now(), chat_id, user_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating user role: {e}")
+            return False
+    
+    @staticmethod
+    async def delete(user_id: int, chat_id: int) -> bool:
+        """Удаление пользователя из чата"""
+        try:
+            query = "DELETE FROM users WHERE chat_id = $1 AND user_id = $2"
+            await Database.execute(query, chat_id, user_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting user: {e}")
@@ -178,6 +373,23 @@ class LogRepository:
             logger.error(f"Error creating log: {e}")
             return False
     
+    @staticmethod
+    async def create_many(log_entries: List[LogEntry]) -> bool:
+        """Создание записей лога одним пакетом"""
+        try:
+            query = """
+            INSERT INTO logs (user_id, action, details, created_at)
+            VALUES ($1, $2, $3, $4)
+            """
+            await Database.executemany(
+                query,
+                [(e.user_id, e.action, e.details, e.created_at) for e in log_entries]
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error creating logs: {e}")
+            return False
+    
     @staticmethod
     async def get_by_user(user_id: int, limit: int = 50) -> List[LogEntry]:
         """Получение логов пользователя"""
@@ -215,12 +427,12 @@ class RoleHistoryRepository:
         """Создание записи истории ролей"""
         try:
             query = """
-            INSERT INTO role_history (user_id, role_name, assigned_at, removed_at, reason)
-            VALUES ($1, $2, $3, $4, $5)
+            INSERT INTO role_history (user_id, chat_id, role_name, assigned_at, removed_at, reason)
+            VALUES ($1, $2, $3, $4, $5, $6)
             """
             await Database.execute(
                 query,
-                role_history.user_id, role_history.role_name,
+                role_history.user_id, role_history.chat_id, role_history.role_name,
                 role_history.assigned_at, role_history.removed_at,
                 role_history.reason
             )
@@ -245,15 +457,15 @@ class RoleHistoryRepository:
             return False
     
     @staticmethod
-    async def get_by_user_id(user_id: int) -> List[RoleHistory]:
-        """Получение истории ролей пользователя"""
+    async def get_by_user_id(user_id: int, chat_id: int) -> List[RoleHistory]:
+        """Получение истории ролей пользователя в чате"""
         try:
             query = """
             SELECT * FROM role_history 
-            WHERE user_id = $1 
+            WHERE chat_id = $1 AND user_id = $2 
             ORDER BY assigned_at DESC
             """
-            rows = await Database.fetch(query, user_id)
+            rows = await Database.fetch(query, chat_id, user_id)
             return [RoleHistory(**dict(row)) for row in rows]
         except Exception as e:
             logger.error(f"Error getting role history by user_id: {e}")
@@ -277,4 +489,97 @@ class RoleHistoryRepository:
             return True
         except Exception as e:
             logger.error(f"Error updating role history: {e}")
-            return False
\ No newline at end of file
+            return False
+
+class ScheduledDeletionRepository:
+    @staticmethod
+    async def add_many(deletions: List[ScheduledDeletion]) -> bool:
+        """Сохранение отложенных удалений"""
+        try:
+            query = """
+            INSERT INTO scheduled_deletions (chat_id, message_id, delete_at)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (chat_id, message_id) DO UPDATE SET delete_at = EXCLUDED.delete_at
+            """
+            await Database.executemany(
+                query,
+                [(d.chat_id, d.message_id, d.delete_at) for d in deletions]
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving scheduled deletions: {e}")
+            return False
+    
+    @staticmethod
+    async def claim_overdue(before: datetime, limit: int) -> List[ScheduledDeletion]:
+        """Захват (с удалением из таблицы) просроченных удалений, брошенных другими процессами"""
+        try:
+            query = """
+            DELETE FROM scheduled_deletions
+            WHERE (chat_id, message_id) IN (
+                SELECT chat_id, message_id FROM scheduled_deletions
+                WHERE delete_at < $1
+                ORDER BY delete_at
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING chat_id, message_id, delete_at
+            """
+            rows = await Database.fetch(query, before, limit)
+            return [ScheduledDeletion(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error claiming overdue deletions: {e}")
+            return []
+    
+    @staticmethod
+    async def get_all() -> List[ScheduledDeletion]:
+        """Получение всех отложенных удалений"""
+        try:
+            query = "SELECT chat_id, message_id, delete_at FROM scheduled_deletions ORDER BY delete_at"
+            rows = await Database.fetch(query)
+            return [ScheduledDeletion(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting scheduled deletions: {e}")
+            return []
+    
+    @staticmethod
+    async def delete_many(chat_id: int, message_ids: List[int]) -> bool:
+        """Удаление выполненных записей"""
+        try:
+            query = """
+            DELETE FROM scheduled_deletions
+            WHERE chat_id = $1 AND message_id = ANY($2::bigint[])
+            """
+            await Database.execute(query, chat_id, message_ids)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting scheduled deletions: {e}")
+            return False
+
+class ChatConfigRepository:
+    @staticmethod
+    async def get_all() -> List[ChatConfig]:
+        """Получение настроек всех чатов"""
+        try:
+            rows = await Database.fetch("SELECT * FROM chat_settings")
+            return [ChatConfig(**dict(row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting chat settings: {e}")
+            return []
+    
+    @staticmethod
+    async def save(config: ChatConfig) -> bool:
+        """Сохранение настроек чата"""
+        try:
+            query = """
+            INSERT INTO chat_settings (chat_id, activity_timeout_minutes, updated_at)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                activity_timeout_minutes = EXCLUDED.activity_timeout_minutes,
+                updated_at = EXCLUDED.updated_at
+            """
+            await Database.execute(query, config.chat_id, config.activity_timeout_minutes, config.updated_at)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving chat settings: {e}")
+            return False
@@ -23,7 +23,46 @@ async def update_database_schema():
         else:
             logger.info("Column 'correct_answer' does not exist, skipping")
         
+        await migrate_to_chat_scoped_keys()
+        
+        # Отметка захвата пользователя при проверке неактивности
+        if await Database.fetchval("SELECT to_regclass('users') IS NOT NULL"):
+            await Database.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS sweep_claimed_at TIMESTAMP")
+        
         return True
     except Exception as e:
         logger.error(f"Error updating database schema: {e}")
         return False
+
+
+async def migrate_to_chat_scoped_keys():
+    """Переход на составной ключ (chat_id, user_id) в users и chat_id в role_history"""
+    if not await Database.fetchval("SELECT to_regclass('users') IS NOT NULL"):
+        return
+    
+    if await Database.fetchval("SELECT to_regclass('role_history') IS NOT NULL"):
+        await Database.execute("ALTER TABLE role_history ADD COLUMN IF NOT EXISTS chat_id BIGINT")
+    
+    pk_query = """
+    SELECT c.conname, array_agg(a.attname::text ORDER BY a.attname) AS columns
+    FROM pg_constraint c
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+    WHERE c.conrelid = 'users'::regclass AND c.contype = 'p'
+    GROUP BY c.conname
+    """
+    pk = await Database.fetchrow(pk_query)
+    if pk and list(pk['columns']) == ['user_id']:
+        logger.info("Migrating users primary key to (chat_id, user_id)...")
+        # Пока user_id уникален, переносим чат пользователя в историю ролей
+        if await Database.fetchval("SELECT to_regclass('role_history') IS NOT NULL"):
+            await Database.execute("""
+            UPDATE role_history h SET chat_id = u.chat_id
+            FROM users u
+            WHERE h.chat_id IS NULL AND h.user_id = u.user_id
+            """)
+        await Database.execute(
+            f'ALTER TABLE users DROP CONSTRAINT "{pk["conname"]}", ADD PRIMARY KEY (chat_id, user_id)'
+        )
+        # Индекс по chat_id покрывается первичным ключом
+        await Database.execute("DROP INDEX IF EXISTS idx_users_chat_id")
+        logger.info("Users primary key migrated successfully")
@@ -3,6 +3,10 @@ from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, filters
 from database.repositories import UserRepository, LogRepository
 from services.role_service import RoleService
+from services.circuit_breaker import promote_breaker
+from services.chat_config import chat_config
+from services.profiler import profiler
+from services.metrics import instrument_handler
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -45,7 +49,7 @@ class AdminHandlers:
             )
             
             # Обновляем пользователя в базе
-            user = await UserRepository.get_by_id(target_id)
+            user = await UserRepository.get_by_id(target_id, chat_id)
             if user:
                 user.is_blocked = False
                 user.warnings_count = 0
@@ -69,14 +73,27 @@ class AdminHandlers:
         chat_id = update.effective_chat.id
         
         try:
-            # Получаем пользователей с ролью
-            users_with_roles = await UserRepository.get_by_chat_and_role(chat_id, True)
-            all_users = await UserRepository.get_by_chat_and_role(chat_id, None)
+            # Счетчики только по этому чату
+            chat_stats = await UserRepository.get_chat_stats(chat_id)
             
             message = "📊 Статистика:\n\n"
-            message += f"👥 Всего пользователей: {len(all_users)}\n"
-            message += f"🎭 С активными ролями: {len(users_with_roles)}\n"
-            message += f"⏱️ Таймаут неактивности: {settings.ACTIVITY_TIMEOUT_MINUTES} мин\n"
+            message += f"👥 Всего пользователей: {chat_stats['total']}\n"
+            message += f"🎭 С активными ролями: {chat_stats['with_role']}\n"
+            message += f"⏱️ Таймаут неактивности: {chat_config.activity_timeout_minutes(chat_id)} мин\n"
+            
+            if promote_breaker.state(chat_id) != promote_breaker.CLOSED:
+                message += "🔌 У бота нет права назначать администраторов - восстановление ролей приостановлено\n"
+            
+            rate_limiter = getattr(context.bot, 'rate_limiter', None)
+            if rate_limiter is not None and hasattr(rate_limiter, 'stats'):
+                limiter_stats = rate_limiter.stats()
+                queue = ', '.join(f"{name}: {depth}" for name, depth in limiter_stats['queue'].items())
+                message += f"📮 Очередь исходящих: {queue} (макс. {limiter_stats['max_depth']})\n"
+                message += f"🐢 RetryAfter: {limiter_stats['retry_after']}\n"
+            
+            update_processor = context.application.update_processor
+            if hasattr(update_processor, 'backlog'):
+                message += f"📥 Обновлений в очереди пользователей: {update_processor.backlog}\n"
             
             await update.message.reply_text(message)
             
@@ -84,9 +101,82 @@ class AdminHandlers:
             logger.error(f"Error in stats command: {e}")
             await update.message.reply_text("❌ Ошибка при получении статистики.")
     
+    async def settimeout_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /settimeout - таймаут неактивности для этого чата"""
+        user_id = update.effective_user.id
+        
+        if not self.is_admin(user_id):
+            return
+        
+        chat_id = update.effective_chat.id
+        
+        try:
+            minutes = int(context.args[0]) if context.args else 0
+        except ValueError:
+            minutes = 0
+        if minutes <= 0:
+            await update.message.reply_text(
+                "Использование: /settimeout <минуты>\n"
+                f"Сейчас: {chat_config.activity_timeout_minutes(chat_id)} мин"
+            )
+            return
+        
+        try:
+            if not await chat_config.set_activity_timeout(chat_id, minutes):
+                await update.message.reply_text("❌ Не удалось сохранить настройку.")
+                return
+            
+            await update.message.reply_text(f"✅ Таймаут неактивности в этом чате: {minutes} мин")
+            
+        except Exception as e:
+            logger.error(f"Error in settimeout command: {e}")
+            await update.message.reply_text("❌ Произошла ошибка.")
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /profile - выборочное профилирование процесса на N секунд"""
+        user_id = update.effective_user.id
+        
+        if not self.is_admin(user_id):
+            return
+        
+        if profiler.running:
+            await update.message.reply_text("⏳ Профилирование уже идет.")
+            return
+        
+        try:
+            seconds = int(context.args[0]) if context.args else settings.PROFILE_DEFAULT_SECONDS
+        except ValueError:
+            await update.message.reply_text(f"Использование: /profile [секунды, до {settings.PROFILE_MAX_SECONDS}]")
+            return
+        seconds = min(max(seconds, 1), settings.PROFILE_MAX_SECONDS)
+        
+        await update.message.reply_text(f"🔬 Профилирование {seconds} с...")
+        # Сеанс идет в фоне, чтобы не занимать слот обработки обновлений
+        context.application.create_task(self._run_profile(update, seconds), update=update)
+    
+    async def _run_profile(self, update: Update, seconds: int):
+        try:
+            result = await profiler.run(seconds)
+        except Exception as e:
+            logger.error(f"Error in profile command: {e}")
+            await update.message.reply_text("❌ Не удалось выполнить профилирование.")
+            return
+        
+        message = f"🔬 Профиль за {result.duration:.0f} с: {result.samples} выборок\n"
+        message += f"📄 {result.profile_path}\n"
+        if result.stalls:
+            longest = max(stall.duration for stall in result.stalls)
+            message += f"🧱 Блокировок loop: {len(result.stalls)} (макс. {longest * 1000:.0f} мс), {result.stalls_path}\n"
+        message += "\nСобственное время:\n"
+        for name, share in result.top_functions(5):
+            message += f"{share:.0%} {name}\n"
+        await update.message.reply_text(message)
+    
     def get_handlers(self):
         """Получение всех обработчиков администраторов"""
         return [
-            CommandHandler("unblock", self.unblock_command, filters=filters.ChatType.GROUPS),
-            CommandHandler("stats", self.stats_command, filters=filters.ChatType.GROUPS)
+            CommandHandler("unblock", instrument_handler(self.unblock_command), filters=filters.ChatType.GROUPS),
+            CommandHandler("stats", instrument_handler(self.stats_command), filters=filters.ChatType.GROUPS),
+            CommandHandler("settimeout", instrument_handler(self.settimeout_command), filters=filters.ChatType.GROUPS),
+            CommandHandler("profile", instrument_handler(self.profile_command))
         ]
@@ -0,0 +1,36 @@
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes, ChatMemberHandler
+from services.chat_member_cache import chat_member_cache
+from services.member_waiters import member_waiters
+from services.circuit_breaker import promote_breaker
+
+logger = logging.getLogger(__name__)
+
+class ChatMemberHandlers:
+    """Служебные обработчики событий chat_member / my_chat_member"""
+
+    async def track_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Актуализация кэша участников и ожиданий статуса по событиям Telegram"""
+        try:
+            chat_member_update = update.chat_member or update.my_chat_member
+            if chat_member_update:
+                chat_member_cache.apply_update(chat_member_update)
+                member_waiters.resolve(chat_member_update)
+            
+            # Права бота изменились - сразу переключаем предохранитель чата
+            if update.my_chat_member:
+                chat_id = update.my_chat_member.chat.id
+                bot_member = update.my_chat_member.new_chat_member
+                if bot_member.status == 'creator' or getattr(bot_member, 'can_promote_members', False):
+                    promote_breaker.record_success(chat_id)
+                else:
+                    promote_breaker.record_failure(chat_id)
+        except Exception as e:
+            logger.error(f"Error in track_chat_member: {e}")
+
+    def get_handlers(self):
+        """Получение служебных обработчиков (регистрируются в группе -1, до основных)"""
+        return [
+            ChatMemberHandler(self.track_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER)
+        ]
@@ -0,0 +1,53 @@
+import time
+import logging
+from telegram import ChatPermissions, Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, MessageHandler, filters
+from services.flood_guard import FloodGuard, FLOOD_MUTES, ALLOW, MUTE
+from services.log_pipeline import SAMPLED
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class FloodHandlers:
+    """Антифлуд: проверка частоты сообщений раньше основных обработчиков и любых запросов к БД"""
+
+    def __init__(self, flood_guard: FloodGuard):
+        self.flood_guard = flood_guard
+
+    async def check_flood(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        chat_id = update.effective_chat.id
+        # Администраторы бота не ограничиваются
+        if user is None or user.id in settings.ADMIN_IDS:
+            return
+
+        verdict = self.flood_guard.check(chat_id, user.id)
+        if verdict == ALLOW:
+            return
+        if verdict == MUTE:
+            logger.warning(f"User {user.id} is flooding chat {chat_id}, muting for {self.flood_guard.mute_seconds}s")
+            # Мут в фоне: следующие сообщения пользователя отбрасываются, не дожидаясь Bot API
+            context.application.create_task(
+                self.mute(context, chat_id, user.id), update=update, name=f"flood-mute-{chat_id}-{user.id}"
+            )
+        else:
+            logger.debug("Dropped flood message from user %s in chat %s", user.id, chat_id, extra=SAMPLED)
+        raise ApplicationHandlerStop
+
+    async def mute(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int):
+        try:
+            await context.bot.restrict_chat_member(
+                chat_id=chat_id,
+                user_id=user_id,
+                permissions=ChatPermissions(can_send_messages=False),
+                until_date=int(time.time()) + self.flood_guard.mute_seconds
+            )
+            FLOOD_MUTES.inc(result='ok')
+        except Exception as e:
+            # Например, пользователь - администратор (роль); сообщения все равно отбрасываются до конца мута
+            FLOOD_MUTES.inc(result='failed')
+            logger.warning(f"Failed to mute flooding user {user_id} in chat {chat_id}: {e}")
+
+    def get_handlers(self):
+        """Получение обработчиков антифлуда"""
+        return [MessageHandler(filters.ChatType.GROUPS & filters.UpdateType.MESSAGE, self.check_flood)]
@@ -0,0 +1,21 @@
+import logging
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+from services.chat_partitioner import chat_partitioner
+
+logger = logging.getLogger(__name__)
+
+class PartitionHandlers:
+    """Пересылка обновлений чужих чатов воркеру-владельцу (выполняется раньше всех)"""
+
+    async def route_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if chat_partitioner.is_local(update):
+            return
+        if await chat_partitioner.forward(update):
+            raise ApplicationHandlerStop
+        # Владелец недоступен - обрабатываем сами, чтобы не потерять обновление
+        logger.warning(f"Processing update {update.update_id} locally: owner worker unavailable")
+
+    def get_handlers(self):
+        """Получение обработчиков маршрутизации"""
+        return [TypeHandler(Update, self.route_update)]
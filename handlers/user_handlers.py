@@ -1,21 +1,44 @@
 import logging
-import asyncio
 from datetime import datetime
+from typing import Optional
 from telegram import Update, ChatPermissions
 from telegram.ext import ContextTypes, MessageHandler, filters, ChatMemberHandler, CommandHandler
 from database.repositories import UserRepository, LogRepository
 from database.models import User, LogEntry
-from services.role_service import RoleService, delete_message_after_delay
+from services.deletion_scheduler import deletion_scheduler
 from services.activity_service import ActivityService
 from services.profanity_filter import ProfanityFilter
+from services.spam_detector import SpamDetector
+from services.role_queue import RoleJobQueue
+from services.metrics import instrument_handler
+from services.rate_limiter import PRIORITY_MODERATION
+from services.log_pipeline import SAMPLED
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Предупреждения и записи лога по типу нарушения
+WARNING_TEXTS = {
+    'profanity': "пожалуйста, не используйте ненормативную лексику!",
+    'spam': "пожалуйста, не рассылайте одинаковые сообщения!",
+}
+LOG_DETAILS = {
+    'profanity': "Message contained profanity",
+    'spam': "Near-duplicate spam",
+}
+
 class UserHandlers:
-    def __init__(self, activity_service: ActivityService, profanity_filter: ProfanityFilter):
+    def __init__(
+        self,
+        activity_service: ActivityService,
+        profanity_filter: ProfanityFilter,
+        role_queue: RoleJobQueue,
+        spam_detector: Optional[SpamDetector] = None
+    ):
         self.activity_service = activity_service
         self.profanity_filter = profanity_filter
+        self.role_queue = role_queue
+        self.spam_detector = spam_detector
     
     async def handle_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка новых участников"""
@@ -23,8 +46,9 @@ class UserHandlers:
             chat_member = update.chat_member
             
             # Проверяем, что это действительно новое присоединение
+            # (снятие прав администратора тоже дает переход в 'member')
             if (chat_member.new_chat_member.status == 'member' and 
-                chat_member.old_chat_member.status not in ['member', 'restricted']):
+                chat_member.old_chat_member.status in ['left', 'kicked']):
                 
                 user = chat_member.new_chat_member.user
                 chat_id = update.effective_chat.id
@@ -36,7 +60,7 @@ class UserHandlers:
                 logger.info(f"New member joined: {user.id} ({user.username or user.first_name})")
                 
                 # Получаем пользователя из базы
-                db_user = await UserRepository.get_by_id(user.id)
+                db_user = await UserRepository.get_by_id(user.id, chat_id)
                 
                 if not db_user:
                     # Создаем нового пользователя
@@ -50,7 +74,7 @@ class UserHandlers:
                         last_activity=datetime.now(),
                         warnings_count=0
                     )
-                    await UserRepository.create_or_update(db_user)
+                    await UserRepository.create(db_user)
                     
                     # Отправляем приветственное сообщение
                     try:
@@ -60,7 +84,7 @@ class UserHandlers:
                             parse_mode="HTML"
                         )
                         # Удаляем через 5 секунд
-                        asyncio.create_task(delete_message_after_delay(context, chat_id, welcome_msg.message_id))
+                        deletion_scheduler.schedule(chat_id, welcome_msg.message_id)
                     except Exception as e:
                         logger.error(f"Failed to send welcome message: {e}")
                     
@@ -77,25 +101,20 @@ class UserHandlers:
                     # Пользователь уже есть в базе
                     logger.info(f"Existing user rejoined: {user.id} ({user.username or user.first_name})")
                     
-                    # Обновляем chat_id на случай, если он изменился
-                    db_user.chat_id = chat_id
-                    db_user.last_activity = datetime.now()
-                    await UserRepository.create_or_update(db_user)
+                    # Только активность: роль могла измениться фоновой операцией
+                    await UserRepository.touch_activity(user.id, chat_id)
                     
                     # Если у пользователя уже есть nickname, пытаемся восстановить роль
                     if db_user.nickname and not db_user.role_assigned:
                         logger.info(f"Restoring role for user {user.id} with nickname '{db_user.nickname}'")
-                        success = await RoleService.assign_role(
-                            user_id=user.id,
-                            chat_id=chat_id,
-                            nickname=db_user.nickname,
-                            context=context
-                        )
                         
-                        if success:
-                            logger.info(f"Successfully restored role for user {user.id}")
-                        else:
-                            logger.warning(f"Could not restore role for user {user.id}")
+                        async def report_restore(success: bool):
+                            if success:
+                                logger.info(f"Successfully restored role for user {user.id}")
+                            else:
+                                logger.warning(f"Could not restore role for user {user.id}")
+                        
+                        self.role_queue.restore(user.id, chat_id, db_user.nickname, context, on_done=report_restore)
                     
         except Exception as e:
             logger.error(f"Error in handle_new_member: {e}")
@@ -116,12 +135,7 @@ class UserHandlers:
                 logger.info(f"User left: {user_id} ({user.username or user.first_name})")
                 
                 # Снимаем роль без уведомления
-                await RoleService.remove_role(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    reason="left_chat",
-                    context=context
-                )
+                self.role_queue.remove(user_id, chat_id, "left_chat", context)
                 
                 # Логируем
                 await LogRepository.create(LogEntry(
@@ -139,13 +153,10 @@ class UserHandlers:
         chat_id = update.effective_chat.id
         message_text = update.message.text
         
-        logger.debug(f"Message from user {user_id}: {message_text[:50]}...")
+        logger.debug("Message from user %s: %.50s...", user_id, message_text, extra=SAMPLED)
         
-        # Обновляем активность
-        await self.activity_service.update_user_activity(user_id)
-        
-        # Получаем пользователя
-        user = await UserRepository.get_by_id(user_id)
+        # Обновляем активность (заодно получаем пользователя)
+        user = await self.activity_service.update_user_activity(user_id, chat_id)
         if not user:
             # Если пользователя нет в БД, создаем
             user = User(
@@ -157,65 +168,81 @@ class UserHandlers:
                 last_activity=datetime.now(),
                 warnings_count=0
             )
-            await UserRepository.create_or_update(user)
+            await UserRepository.create(user)
             logger.info(f"Created user record for {user_id}")
         else:
-            # Обновляем последнюю активность
-            user.last_activity = datetime.now()
-            await UserRepository.create_or_update(user)
-            
             # Если у пользователя есть nickname, но роль не назначена - пытаемся восстановить
             # Только если пользователь не заблокирован
             if user.nickname and not user.role_assigned and not user.is_blocked:
                 logger.info(f"Restoring role for active user {user_id} with nickname '{user.nickname}'")
-                success = await RoleService.assign_role(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    nickname=user.nickname,
-                    context=context
-                )
                 
-                if success:
-                    logger.info(f"Successfully restored role for user {user_id}")
-                else:
-                    logger.warning(f"Could not restore role for user {user_id} - check bot admin rights")
+                async def report_restore(success: bool):
+                    if success:
+                        logger.info(f"Successfully restored role for user {user_id}")
+                    else:
+                        logger.warning(f"Could not restore role for user {user_id} - check bot admin rights")
+                
+                self.role_queue.restore(user_id, chat_id, user.nickname, context, on_done=report_restore)
         
         # Проверяем на матные слова
         if message_text and self.profanity_filter.contains_profanity(message_text):
-            logger.info(f"Profanity detected in message from user {user_id}")
-            
-            # Удаляем сообщение с матом
-            try:
-                await update.message.delete()
-                logger.info(f"Deleted profane message from user {user_id}")
-            except Exception as e:
-                logger.error(f"Failed to delete message: {e}")
-            
-            # Увеличиваем счетчик предупреждений (для статистики, но не блокируем)
-            user.warnings_count += 1
-            await UserRepository.create_or_update(user)
-            
-            # Отправляем предупреждение
-            warning_text = f"⚠️ {update.effective_user.mention_html()}, пожалуйста, не используйте ненормативную лексику!"
-            
-            try:
-                warning_msg = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=warning_text,
-                    parse_mode="HTML"
-                )
-                # Удаляем предупреждение через 5 секунд
-                asyncio.create_task(delete_message_after_delay(context, chat_id, warning_msg.message_id))
-                logger.info(f"Sent profanity warning to user {user_id} (warning #{user.warnings_count})")
-            except Exception as e:
-                logger.error(f"Failed to send profanity warning: {e}")
-            
-            # Логируем
-            await LogRepository.create(LogEntry(
-                user_id=user_id,
-                action="profanity_warning",
-                details=f"Message contained profanity: {message_text[:100]}"
-            ))
+            logger.info("Profanity detected in message from user %s", user_id, extra=SAMPLED)
+            await self.punish_message(update, context, user, 'profanity')
+            return
+        
+        # Рейды: почти одинаковые сообщения от разных аккаунтов.
+        # Участники с назначенной ролью не проверяются - рейдят новые аккаунты
+        if message_text and self.spam_detector is not None and not user.role_assigned:
+            earlier = self.spam_detector.check(chat_id, user_id, update.message.message_id, message_text)
+            if earlier is not None:
+                logger.info("Near-duplicate spam from user %s", user_id, extra=SAMPLED)
+                # Уже отправленные копии удаляются общей пачкой deleteMessages
+                for message_id in earlier:
+                    deletion_scheduler.schedule(chat_id, message_id, delay=0)
+                await self.punish_message(update, context, user, 'spam')
+    
+    async def punish_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user: User, violation: str):
+        """Удаление сообщения-нарушения, предупреждение автору и запись в лог"""
+        user_id = user.user_id
+        chat_id = update.effective_chat.id
+        message_text = update.message.text
+        
+        # Удаляем сообщение
+        try:
+            await update.message.delete()
+            logger.info("Deleted %s message from user %s", violation, user_id, extra=SAMPLED)
+        except Exception as e:
+            logger.error(f"Failed to delete message: {e}")
+        
+        # Увеличиваем счетчик предупреждений (для статистики, но не блокируем).
+        # Строка не перезаписывается целиком: роль могла измениться фоновой операцией
+        warnings_count = await UserRepository.increment_warnings(user_id, chat_id)
+        if warnings_count is not None:
+            user.warnings_count = warnings_count
+        
+        # Отправляем предупреждение
+        warning_text = f"⚠️ {update.effective_user.mention_html()}, {WARNING_TEXTS[violation]}"
+        
+        try:
+            # Предупреждение - часть модерации: не ждет в очереди за операциями с ролями
+            warning_msg = await context.bot.send_message(
+                chat_id=chat_id,
+                text=warning_text,
+                parse_mode="HTML",
+                rate_limit_args=PRIORITY_MODERATION
+            )
+            # Удаляем предупреждение через 5 секунд
+            deletion_scheduler.schedule(chat_id, warning_msg.message_id)
+            logger.info("Sent %s warning to user %s (warning #%s)", violation, user_id, user.warnings_count, extra=SAMPLED)
+        except Exception as e:
+            logger.error(f"Failed to send {violation} warning: {e}")
+        
+        # Логируем
+        await LogRepository.create(LogEntry(
+            user_id=user_id,
+            action=f"{violation}_warning",
+            details=f"{LOG_DETAILS[violation]}: {message_text[:100]}"
+        ))
     
     async def handle_changenick_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /changenick - изменение должности"""
@@ -232,7 +259,7 @@ class UserHandlers:
                 "📝 Или просто введите новый никнейм в ответ на это сообщение."
             )
             # Удаляем через 5 секунд
-            asyncio.create_task(delete_message_after_delay(context, chat_id, help_msg.message_id))
+            deletion_scheduler.schedule(chat_id, help_msg.message_id)
             return
         
         new_nickname = ' '.join(context.args)
@@ -242,11 +269,11 @@ class UserHandlers:
             error_msg = await update.message.reply_text(
                 "❌ Никнейм слишком длинный (максимум 16 символов)."
             )
-            asyncio.create_task(delete_message_after_delay(context, chat_id, error_msg.message_id))
+            deletion_scheduler.schedule(chat_id, error_msg.message_id)
             return
         
         # Получаем пользователя или создаем, если его нет в БД
-        user = await UserRepository.get_by_id(user_id)
+        user = await UserRepository.get_by_id(user_id, chat_id)
         if not user:
             # Если пользователя нет в БД, создаем его
             logger.info(f"User {user_id} not found in DB, creating new record")
@@ -260,40 +287,38 @@ class UserHandlers:
                 last_activity=datetime.now(),
                 warnings_count=0
             )
-            await UserRepository.create_or_update(user)
+            await UserRepository.create(user)
             logger.info(f"Created user record for {user_id} in changenick command")
         
-        # Назначаем роль (это также обновит никнейм и назначит админа)
-        logger.info(f"Attempting to assign role for user {user_id} with nickname '{new_nickname}'")
-        role_success = await RoleService.assign_role(
-            user_id=user_id,
-            chat_id=chat_id,
-            nickname=new_nickname,
-            context=context
-        )
+        # Назначаем роль в фоне (это также обновит никнейм и назначит админа),
+        # результат сообщаем самоудаляющимся сообщением
+        logger.info(f"Queueing role assignment for user {user_id} with nickname '{new_nickname}'")
         
-        if role_success:
-            logger.info(f"Role successfully assigned for user {user_id}")
-            # Отправляем подтверждение
-            success_msg = await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"✅ Должность '{new_nickname}' установлена для {update.effective_user.mention_html()}",
-                parse_mode="HTML"
-            )
-            asyncio.create_task(delete_message_after_delay(context, chat_id, success_msg.message_id))
-        else:
-            logger.warning(f"Role assignment failed for user {user_id}")
-            error_msg = await update.message.reply_text(
-                "❌ Не удалось установить должность. Проверьте, что бот имеет права администратора."
-            )
-            asyncio.create_task(delete_message_after_delay(context, chat_id, error_msg.message_id))
+        async def report_result(role_success: bool):
+            if role_success:
+                logger.info(f"Role successfully assigned for user {user_id}")
+                # Отправляем подтверждение
+                success_msg = await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"✅ Должность '{new_nickname}' установлена для {update.effective_user.mention_html()}",
+                    parse_mode="HTML"
+                )
+                deletion_scheduler.schedule(chat_id, success_msg.message_id)
+            else:
+                logger.warning(f"Role assignment failed for user {user_id}")
+                error_msg = await update.message.reply_text(
+                    "❌ Не удалось установить должность. Проверьте, что бот имеет права администратора."
+                )
+                deletion_scheduler.schedule(chat_id, error_msg.message_id)
+        
+        self.role_queue.assign(user_id, chat_id, new_nickname, context, on_done=report_result)
     
     def get_handlers(self):
         """Получение всех обработчиков пользователей"""
         return [
-            ChatMemberHandler(self.handle_new_member, ChatMemberHandler.CHAT_MEMBER),
-            ChatMemberHandler(self.handle_left_member, ChatMemberHandler.CHAT_MEMBER),
-            CommandHandler("changenick", self.handle_changenick_command),
-            CommandHandler("cn", self.handle_changenick_command),  # Алиас для быстрого доступа
-            MessageHandler(filters.TEXT & filters.ChatType.GROUPS & ~filters.COMMAND, self.handle_message)
+            ChatMemberHandler(instrument_handler(self.handle_new_member), ChatMemberHandler.CHAT_MEMBER),
+            ChatMemberHandler(instrument_handler(self.handle_left_member), ChatMemberHandler.CHAT_MEMBER),
+            CommandHandler("changenick", instrument_handler(self.handle_changenick_command)),
+            CommandHandler("cn", instrument_handler(self.handle_changenick_command)),  # Алиас для быстрого доступа
+            MessageHandler(filters.TEXT & filters.ChatType.GROUPS & ~filters.COMMAND, instrument_handler(self.handle_message))
         ]
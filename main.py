@@ -1,3 +1,5 @@
+import time
+import signal
 import asyncio
 import logging
 from telegram import BotCommand
@@ -8,17 +10,58 @@ from database.migrations import run_migrations
 from database.update_database import update_database_schema
 from services.activity_service import ActivityService
 from services.profanity_filter import ProfanityFilter
+from services.chat_member_cache import chat_member_cache, ADMIN_STATUSES
+from services.role_queue import RoleJobQueue
+from services.rate_limiter import PriorityRateLimiter
+from services.bot_request import create_bot_request, create_get_updates_request
+from services.deletion_scheduler import deletion_scheduler
+from services.error_aggregator import error_aggregator
+from services.reconciliation_service import ReconciliationService
+from services.chat_config import chat_config
+from services.chat_partitioner import chat_partitioner
+from services.leader_election import LeaderElection
+from services.update_processor import PerUserUpdateProcessor
+from services.webhook_updater import ServeOnlyUpdater
+from services.metrics import metrics_server
+from services.tracing import tracer
+from services.profiler import profiler
+from services.traffic_capture import traffic_capture
+from services.flood_guard import flood_guard
+from services.spam_detector import spam_detector
+from services.startup import StartupGraph
+from services.log_pipeline import setup_logging, stop_logging
 from handlers.user_handlers import UserHandlers
 from handlers.admin_handlers import AdminHandlers
+from handlers.chat_member_handlers import ChatMemberHandlers
+from handlers.partition_handlers import PartitionHandlers
+from handlers.flood_handlers import FloodHandlers
 from handlers.error_handlers import error_handler
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, settings.LOG_LEVEL.upper())
-)
+# Настройка логирования: запись в поток вывода идет из отдельного потока
+setup_logging()
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = ['message', 'chat_member', 'my_chat_member', 'callback_query']
+
+def install_profile_signal():
+    """SIGUSR1 запускает профилирование на PROFILE_DEFAULT_SECONDS секунд"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+    
+    async def run_profile():
+        try:
+            await profiler.run(settings.PROFILE_DEFAULT_SECONDS)
+        except Exception as e:
+            logger.error(f"Profiling failed: {e}")
+    
+    def on_signal():
+        if profiler.running:
+            logger.info("SIGUSR1 ignored: profiling is already running")
+            return
+        asyncio.get_running_loop().create_task(run_profile(), name="profile-signal")
+    
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_signal)
+
 async def set_bot_commands(application: Application):
     """Установка команд бота для быстрого доступа"""
     commands = [
@@ -33,67 +76,115 @@ async def set_bot_commands(application: Application):
     except Exception as e:
         logger.error(f"Failed to set bot commands: {e}")
 
-async def check_bot_info(application: Application):
-    """Проверка информации о боте"""
-    try:
-        bot_info = await application.bot.get_me()
-        logger.info(f"Bot started: @{bot_info.username} (ID: {bot_info.id})")
-        return bot_info
-    except Exception as e:
-        logger.error(f"Failed to get bot info: {e}")
-        return None
+def log_bot_info(application: Application):
+    """Информация о боте (getMe выполняется в application.initialize)"""
+    bot_info = application.bot.bot
+    logger.info(f"Bot started: @{bot_info.username} (ID: {bot_info.id})")
+    return bot_info
 
 async def check_bot_admin_status(application: Application, chat_id: int):
     """Проверка статуса бота в чате"""
     try:
-        chat_member = await application.bot.get_chat_member(chat_id, application.bot.id)
+        chat_member = await chat_member_cache.get_bot_member(application.bot, chat_id)
         logger.info(f"Bot status in chat {chat_id}: {chat_member.status}")
-        logger.info(f"Bot is admin: {chat_member.status in ['administrator', 'creator']}")
+        logger.info(f"Bot is admin: {chat_member.status in ADMIN_STATUSES}")
         return chat_member
     except Exception as e:
         logger.error(f"Failed to get bot chat status: {e}")
         return None
 
+async def check_bot_admin_statuses(application: Application):
+    """Статус бота во всех известных чатах (заодно прогревает кэш участников)"""
+    chat_ids = chat_config.chat_ids()
+    if not chat_ids:
+        logger.info("CHAT_ID not specified, skipping admin status check")
+        return
+    await asyncio.gather(*(check_bot_admin_status(application, chat_id) for chat_id in chat_ids))
+
+async def start_updates(application: Application):
+    """Запуск получения обновлений: long polling или webhook (UPDATE_MODE)"""
+    if settings.UPDATE_MODE == 'webhook':
+        # setWebhook заменяет polling (на воркерах, кроме 0, не вызывается);
+        # секретный токен проверяется сервером PTB
+        await application.updater.start_webhook(
+            listen=settings.WEBHOOK_LISTEN,
+            port=settings.WEBHOOK_PORT,
+            url_path=settings.WEBHOOK_PATH,
+            webhook_url=settings.WEBHOOK_URL,
+            secret_token=settings.WEBHOOK_SECRET_TOKEN,
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES
+        )
+        logger.info(f"Webhook server listening on {settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT}/{settings.WEBHOOK_PATH}")
+    else:
+        # start_polling сам удаляет ранее установленный webhook
+        await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+        logger.info("Long polling started")
+
 async def main():
     """Основная функция запуска бота"""
+    boot_started = time.perf_counter()
     
-    # Инициализация базы данных
-    logger.info("Initializing database...")
-    await Database.create_pool()
-    
-    # Обновляем схему базы данных
-    await update_database_schema()
-    
-    # Выполняем миграции
-    await run_migrations()
-    
-    # Создание фильтра матных слов
+    # Создание фильтра матных слов (слова загружаются при запуске)
     profanity_filter = ProfanityFilter()
-    await profanity_filter.load_words()
+    
+    # Фоновая очередь операций с ролями
+    role_queue = RoleJobQueue()
     
     # Создание сервиса активности
-    activity_service = ActivityService()
+    activity_service = ActivityService(role_queue)
     
-    # Создание приложения бота
-    application = Application.builder().token(settings.BOT_TOKEN).build()
+    # Сверка ролей с администраторами чатов
+    reconciliation_service = ReconciliationService()
     
-    # Проверка информации о боте
-    bot_info = await check_bot_info(application)
+    # Создание приложения бота
+    application = (
+        Application.builder()
+        .token(settings.BOT_TOKEN)
+        .request(create_bot_request())
+        .get_updates_request(create_get_updates_request())
+        .rate_limiter(PriorityRateLimiter())
+        .concurrent_updates(PerUserUpdateProcessor(settings.MAX_CONCURRENT_UPDATES))
+        .build()
+    )
     
-    # Проверка статуса бота в чате (если указан CHAT_ID)
-    if hasattr(settings, 'CHAT_ID') and settings.CHAT_ID:
-        await check_bot_admin_status(application, settings.CHAT_ID)
-    else:
-        logger.info("CHAT_ID not specified, skipping admin status check")
+    # Webhook регистрирует только воркер 0; остальные лишь принимают обновления
+    if settings.UPDATE_MODE == 'webhook' and settings.WORKER_INDEX != 0:
+        application.updater = ServeOnlyUpdater(bot=application.bot, update_queue=application.update_queue)
     
     # Сохраняем данные в bot_data
     application.bot_data['admin_ids'] = settings.ADMIN_IDS
     application.bot_data['activity_service'] = activity_service
     application.bot_data['profanity_filter'] = profanity_filter
+    application.bot_data['role_queue'] = role_queue
     
     # Инициализация обработчиков
-    user_handlers = UserHandlers(activity_service, profanity_filter)
+    user_handlers = UserHandlers(
+        activity_service, profanity_filter, role_queue,
+        spam_detector=spam_detector if spam_detector.enabled else None
+    )
     admin_handlers = AdminHandlers()
+    chat_member_handlers = ChatMemberHandlers()
+    
+    # Обновления чужих чатов пересылаются воркеру-владельцу раньше любой обработки
+    if chat_partitioner.enabled:
+        for handler in PartitionHandlers().get_handlers():
+            application.add_handler(handler, group=-2)
+        logger.info(f"Worker {settings.WORKER_INDEX + 1}/{settings.WORKER_COUNT}: chats are partitioned between workers")
+    
+    # Запись входящего трафика - до любой обработки, включая пересылку
+    if traffic_capture.enabled:
+        for handler in traffic_capture.get_handlers():
+            application.add_handler(handler, group=-3)
+    
+    # Служебные обработчики выполняются раньше основных (группа -1)
+    for handler in chat_member_handlers.get_handlers():
+        application.add_handler(handler, group=-1)
+    
+    # Антифлуд отбрасывает сообщения флудеров до обработчиков с запросами к БД
+    if flood_guard.enabled:
+        for handler in FloodHandlers(flood_guard).get_handlers():
+            application.add_handler(handler, group=-1)
     
     # Добавление обработчиков
     for handler in user_handlers.get_handlers():
@@ -114,28 +205,76 @@ async def main():
             "• /cn <ник> - краткая версия (то же самое)\n\n"
             "👨‍💼 *Для администраторов:*\n"
             "• /unblock <id> - разблокировать пользователя\n"
-            "• /stats - статистика\n\n"
+            "• /stats - статистика\n"
+            "• /settimeout <мин> - таймаут неактивности чата\n\n"
             "💡 *Совет:* Начните вводить / в чате, чтобы увидеть все команды!"
         )
         await update.message.reply_text(help_text, parse_mode="Markdown")
     
     application.add_handler(CommandHandler("start", start_command))
     
-    # Запуск проверки активности
-    await activity_service.start_activity_check(application)
+    # Одиночные фоновые задачи (неактивность, сверка ролей, брошенные удаления)
+    # выполняет только ведущий процесс
+    leader = LeaderElection('background-jobs')
+    
+    async def on_elected():
+        await activity_service.start_activity_check(application)
+        await reconciliation_service.start(application)
+        await deletion_scheduler.start_recovery()
+    
+    async def on_demoted():
+        await activity_service.stop()
+        await reconciliation_service.stop()
+        await deletion_scheduler.stop_recovery()
     
-    # Запуск бота
+    leader.on_elected.append(on_elected)
+    leader.on_demoted.append(on_demoted)
+    
+    # Обязательная фаза: без нее нельзя обрабатывать обновления.
+    # БД и Bot API готовятся параллельно, каждая цепочка - по своим зависимостям
     logger.info("Starting bot...")
-    await application.initialize()
-    await application.start()
+    startup = StartupGraph('required')
+    startup.add('db_pool', Database.create_pool)
+    startup.add('db_schema', update_database_schema, 'db_pool')
+    startup.add('db_migrations', run_migrations, 'db_schema')
+    startup.add('chat_config', chat_config.load, 'db_migrations')
+    startup.add('profanity_words', profanity_filter.load_words, 'db_migrations')
+    # getMe выполняется здесь же
+    startup.add('bot_initialize', application.initialize)
+    startup.add('application_start', application.start, 'bot_initialize')
+    startup.add('role_queue', role_queue.start)
+    # Планировщик удаления этого процесса, сводки ошибок и пакетная запись ошибок в БД
+    startup.add('deletion_scheduler', lambda: deletion_scheduler.start(application.bot), 'bot_initialize', 'db_migrations')
+    startup.add('error_aggregator', lambda: error_aggregator.start(application.bot, settings.ADMIN_IDS), 'bot_initialize', 'db_migrations')
+    # Метрики для Prometheus (обработчики, БД, Bot API)
+    startup.add('metrics_server', metrics_server.start)
+    # Запись обезличенного трафика; матные слова сохраняются, чтобы воспроизведение их находило
+    startup.add('traffic_capture', lambda: traffic_capture.start(
+        application.bot.id,
+        keep_word=lambda word: any(bad.lower() in word for bad in profanity_filter.bad_words)
+    ), 'bot_initialize')
+    await startup.run()
+    log_bot_info(application)
     
+    # Фоновая фаза: нужна не сразу, выполняется после начала приема обновлений
+    warmup = StartupGraph('background', background=True)
+    # Одиночные задачи запускаются у ведущего процесса
+    warmup.add('leader_election', leader.start)
+    # Настройки чатов, измененные другими процессами
+    if chat_partitioner.enabled:
+        warmup.add('chat_config_refresh', lambda: chat_config.start_refresh(settings.LEADER_CHECK_INTERVAL))
+    warmup.add('bot_admin_status', lambda: check_bot_admin_statuses(application))
     # Установка команд для быстрого доступа
-    await set_bot_commands(application)
+    warmup.add('bot_commands', lambda: set_bot_commands(application))
+    warmup_task = None
+    
+    # Профилирование по сигналу без перезапуска (kill -USR1 <pid>)
+    install_profile_signal()
     
     try:
-        await application.updater.start_polling(
-            allowed_updates=['message', 'chat_member', 'callback_query']
-        )
+        await start_updates(application)
+        logger.info(f"Accepting updates {(time.perf_counter() - boot_started) * 1000:.0f} ms after start")
+        warmup_task = asyncio.create_task(warmup.run(), name="startup-background")
         
         logger.info("✅ Bot is running and ready!")
         logger.info(f"👨‍💼 Admin IDs: {settings.ADMIN_IDS}")
@@ -151,9 +290,25 @@ async def main():
         logger.error(f"Error in main loop: {e}")
     finally:
         # Остановка
+        if warmup_task is not None and not warmup_task.done():
+            warmup_task.cancel()
+            await asyncio.gather(warmup_task, return_exceptions=True)
+        await leader.stop()
+        await chat_config.stop()
+        await chat_partitioner.close()
         await activity_service.stop()
+        await role_queue.stop()
+        await deletion_scheduler.stop()
+        await reconciliation_service.stop()
+        await error_aggregator.stop()
+        await metrics_server.stop()
+        await traffic_capture.stop()
+        tracer.close()
+        if application.updater.running:
+            await application.updater.stop()
         await application.stop()
         await Database.close_pool()
+        stop_logging()
 
 if __name__ == "__main__":
     asyncio.run(main())
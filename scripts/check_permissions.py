@@ -1,31 +1,56 @@
 #!/usr/bin/env python3
 import asyncio
+import argparse
 import sys
 import os
+from types import SimpleNamespace
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from telegram import Bot
+from config.settings import settings
 from database.connection import Database
-from database.repositories import UserRepository
+from services.reconciliation_service import ReconciliationService
+from services.chat_config import chat_config
 
-async def check_user_permissions():
-    """Проверка пользователей и их прав"""
+async def check_user_permissions(chat_ids, repair: bool):
+    """Сверка ролей в базе данных с администраторами чатов"""
     await Database.create_pool()
     
-    # Получаем всех пользователей
-    users = await UserRepository.get_by_chat_and_role(settings.CHAT_ID, None)
-    
-    print("=== Пользователи в базе данных ===")
-    print(f"Всего пользователей: {len(users)}")
-    print()
-    
-    for user in users:
-        status = "✅" if user.role_assigned else "❌"
-        nickname = user.nickname or "Нет ника"
-        print(f"{status} ID: {user.user_id}, Ник: {nickname}, Роль: {user.role_assigned}, "
-              f"Блокировка: {user.is_blocked}, Предупреждения: {user.warnings_count}")
+    async with Bot(settings.BOT_TOKEN) as bot:
+        context = SimpleNamespace(bot=bot)
+        service = ReconciliationService()
+        
+        if not chat_ids:
+            await chat_config.load()
+            chat_ids = await service.get_chat_ids()
+        
+        for chat_id in chat_ids:
+            diff = await service.diff_chat(chat_id, context)
+            
+            print(f"=== Чат {chat_id} ===")
+            print(f"Администраторов в Telegram: {diff.admins_total}, пользователей в БД: {diff.users_total}")
+            
+            for user in diff.missing_admins:
+                print(f"❌ ID: {user.user_id}, Ник: {user.nickname or 'Нет ника'} - роль в БД, но не админ в чате")
+            for user in diff.stray_admins:
+                print(f"⚠️ ID: {user.user_id}, Ник: {user.nickname or 'Нет ника'} - админ в чате, но роли в БД нет")
+            for user in diff.title_mismatch:
+                print(f"✏️ ID: {user.user_id}, Ник: {user.nickname} - должность в чате не совпадает")
+            for member in diff.unknown_admins:
+                print(f"❓ ID: {member.user.id}, Должность: {member.custom_title or '-'} - админ бота, нет в БД")
+            
+            if not diff.has_drift:
+                print("✅ Расхождений нет")
+            elif repair:
+                repaired = await service.repair(diff, context)
+                print(f"🔧 Исправлено: {repaired}")
+            print()
     
     await Database.close_pool()
 
 if __name__ == "__main__":
-    from config.settings import settings
-    asyncio.run(check_user_permissions())
+    parser = argparse.ArgumentParser(description="Сверка ролей в БД с администраторами чата")
+    parser.add_argument('chat_ids', nargs='*', type=int, help="ID чатов (по умолчанию - все чаты с ролями и из настроек)")
+    parser.add_argument('--repair', action='store_true', help="исправить найденные расхождения")
+    args = parser.parse_args()
+    asyncio.run(check_user_permissions(args.chat_ids, args.repair))
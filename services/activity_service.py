@@ -1,75 +1,240 @@
+import time
+import heapq
 import asyncio
 import logging
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from telegram.ext import ContextTypes
+from database.models import User
 from database.repositories import UserRepository
-from services.role_service import RoleService
+from services.role_queue import RoleJob, RoleJobQueue
+from services.chat_config import chat_config
+from services.metrics import metrics
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+SWEEP_SECONDS = metrics.histogram(
+    'activity_sweep_duration_seconds', 'Inactive users safety scan time',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
 class ActivityService:
-    def __init__(self):
+    """Снятие ролей по неактивности.
+
+    Сроки хранятся в памяти в min-куче (перестраивается из БД при запуске и
+    обновляется при каждой активности), снятие роли ставится в очередь ролей
+    точно в момент истечения. Периодическое сканирование БД остается редкой
+    страховкой. Пользователь учитывается отдельно в каждом чате, таймаут
+    берется из настроек чата.
+
+    При нескольких процессах циклы работают только на ведущем; пользователи
+    для снятия роли захватываются в БД (claim_inactive), поэтому активность,
+    записанная другими процессами, учитывается, а двойного снятия нет.
+    Сроки пользователей, чьи строки изменили другие процессы (активность,
+    назначение роли), ведущий подгружает из БД каждые
+    ACTIVITY_DEADLINE_REFRESH секунд.
+    """
+
+    def __init__(self, role_queue: RoleJobQueue):
+        self.role_queue = role_queue
+        self.role_queue.listeners.append(self._on_role_job_done)
+        chat_config.listeners.append(self._on_chat_config_changed)
+        self.context = None
         self.check_task = None
-    
+        self.deadline_task = None
+        self.refresh_task = None
+        # (срок, chat_id, user_id); актуальный срок - в _deadlines
+        self._heap: List[Tuple[float, int, int]] = []
+        self._deadlines: Dict[Tuple[int, int], float] = {}
+        self._wakeup = asyncio.Event()
+
     async def start_activity_check(self, context: ContextTypes.DEFAULT_TYPE):
         """Запуск проверки активности"""
+        self.context = context
+        if not self.running:
+            self.deadline_task = asyncio.create_task(self._deadline_loop())
+            rebuilt_at = datetime.now()
+            await self.rebuild_deadlines()
+            if settings.WORKER_COUNT > 1:
+                self.refresh_task = asyncio.create_task(self._refresh_loop(rebuilt_at))
         if self.check_task is None or self.check_task.done():
             self.check_task = asyncio.create_task(
                 self._activity_check_loop(context)
             )
-    
+
+    async def rebuild_deadlines(self, chat_id: Optional[int] = None):
+        """Перестроение сроков по данным БД (всех чатов или одного, например после смены таймаута)"""
+        users = await UserRepository.get_with_role(chat_id)
+        if chat_id is None:
+            self._heap = []
+            self._deadlines = {}
+        for user in users:
+            if user.last_activity:
+                self.track(user.user_id, user.chat_id, user.last_activity)
+        logger.info(f"Inactivity deadlines rebuilt for {len(users)} users")
+
+    @property
+    def running(self) -> bool:
+        return self.deadline_task is not None and not self.deadline_task.done()
+
+    def track(self, user_id: int, chat_id: int, last_activity: Optional[datetime] = None):
+        """Установка срока снятия роли от момента последней активности"""
+        if not self.running:
+            return  # сроки отслеживает ведущий процесс
+        base = last_activity.timestamp() if last_activity else time.time()
+        deadline = base + chat_config.activity_timeout_minutes(chat_id) * 60
+        if self._deadlines.get((chat_id, user_id)) == deadline:
+            return
+        self._deadlines[(chat_id, user_id)] = deadline
+        heapq.heappush(self._heap, (deadline, chat_id, user_id))
+        if self._heap[0][0] == deadline:
+            self._wakeup.set()
+
+    def untrack(self, user_id: int, chat_id: int):
+        """Снятие пользователя с учета (устаревшие записи кучи отбрасываются лениво)"""
+        self._deadlines.pop((chat_id, user_id), None)
+
+    def _on_role_job_done(self, job: RoleJob, result: bool):
+        if job.kind == RoleJob.ASSIGN and result:
+            self.track(job.user_id, job.chat_id)
+        elif job.kind == RoleJob.REMOVE and result:
+            self.untrack(job.user_id, job.chat_id)
+
+    async def _on_chat_config_changed(self, chat_id: int):
+        # Сроки чата пересчитываются с новым таймаутом
+        if self.running:
+            await self.rebuild_deadlines(chat_id)
+
+    def _pop_expired(self, now: float) -> List[Tuple[int, int]]:
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, chat_id, user_id = heapq.heappop(self._heap)
+            if self._deadlines.get((chat_id, user_id)) != deadline:
+                continue  # срок был продлен или пользователь снят с учета
+            del self._deadlines[(chat_id, user_id)]
+            expired.append((user_id, chat_id))
+        return expired
+
+    async def _remove_expired(self, expired: List[Tuple[int, int]]):
+        """Снятие ролей у захваченных пользователей; остальным - новый срок по данным БД"""
+        by_chat: Dict[int, List[int]] = {}
+        for user_id, chat_id in expired:
+            by_chat.setdefault(chat_id, []).append(user_id)
+
+        for chat_id, user_ids in by_chat.items():
+            claimed = await UserRepository.claim_inactive(
+                chat_id, chat_config.activity_timeout_minutes(chat_id), len(user_ids), user_ids
+            )
+            for user in claimed:
+                logger.info(f"Inactivity deadline reached for user {user.user_id} in chat {chat_id}")
+                self.role_queue.remove(user.user_id, chat_id, "inactivity", self.context)
+
+            # Активность могла быть записана другим процессом
+            claimed_ids = {user.user_id for user in claimed}
+            for user_id in user_ids:
+                if user_id in claimed_ids:
+                    continue
+                user = await UserRepository.get_by_id(user_id, chat_id)
+                if user and user.role_assigned and user.last_activity:
+                    self.track(user_id, chat_id, user.last_activity)
+
+    async def _deadline_loop(self):
+        """Снятие ролей точно в момент истечения срока"""
+        while True:
+            try:
+                expired = self._pop_expired(time.time())
+                if expired:
+                    await self._remove_expired(expired)
+
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in inactivity deadline loop: {e}")
+                await asyncio.sleep(1)
+
+    async def _refresh_loop(self, since: datetime):
+        """Подгрузка сроков, обновленных другими процессами"""
+        interval = settings.ACTIVITY_DEADLINE_REFRESH
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                started = datetime.now()
+                # С перекрытием: строка могла закоммититься позже своего updated_at
+                users = await UserRepository.get_with_role_updated_since(since - timedelta(seconds=interval))
+                for user in users:
+                    if user.last_activity:
+                        self.track(user.user_id, user.chat_id, user.last_activity)
+                since = started
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error refreshing inactivity deadlines: {e}")
+
     async def _activity_check_loop(self, context: ContextTypes.DEFAULT_TYPE):
-        """Цикл проверки активности"""
+        """Страховочная проверка неактивности по БД"""
+        interval = settings.ACTIVITY_SAFETY_SCAN_MINUTES * 60
         while True:
             try:
+                await asyncio.sleep(interval)
                 await self.check_inactive_users(context)
-                await asyncio.sleep(60)  # Проверка каждую минуту
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in activity check loop: {e}")
-                await asyncio.sleep(60)
-    
+
     async def check_inactive_users(self, context: ContextTypes.DEFAULT_TYPE):
-        """Проверка неактивных пользователей - БЕЗ УВЕДОМЛЕНИЙ"""
+        """Проверка неактивных пользователей по чатам - БЕЗ УВЕДОМЛЕНИЙ"""
+        with SWEEP_SECONDS.time():
+            await self._check_inactive_users(context)
+
+    async def _check_inactive_users(self, context: ContextTypes.DEFAULT_TYPE):
         try:
-            inactive_users = await UserRepository.get_inactive_users(
-                settings.ACTIVITY_TIMEOUT_MINUTES
-            )
-            
-            for user in inactive_users:
-                if user.role_assigned:
-                    await RoleService.remove_role(
-                        user_id=user.user_id,
-                        chat_id=user.chat_id,
-                        reason="inactivity",
-                        context=context
+            for chat_id in await UserRepository.get_chat_ids_with_roles():
+                timeout_minutes = chat_config.activity_timeout_minutes(chat_id)
+                # Пачками с захватом строк, чтобы не пересекаться с другими процессами
+                while True:
+                    inactive_users = await UserRepository.claim_inactive(
+                        chat_id, timeout_minutes, settings.SWEEP_BATCH_SIZE
                     )
-                    
-                    # Уведомление НЕ отправляем (по требованию задачи)
-                    # Вместо этого только логируем
-                    logger.info(f"Role removed from user {user.user_id} due to inactivity")
-                    
+
+                    for user in inactive_users:
+                        # Уведомление НЕ отправляем (по требованию задачи)
+                        logger.info(f"Safety scan: queueing role removal for inactive user {user.user_id} in chat {chat_id}")
+                        self.untrack(user.user_id, chat_id)
+                        self.role_queue.remove(user.user_id, chat_id, "inactivity", context)
+
+                    if len(inactive_users) < settings.SWEEP_BATCH_SIZE:
+                        break
+
         except Exception as e:
             logger.error(f"Error checking inactive users: {e}")
-    
-    async def update_user_activity(self, user_id: int):
-        """Обновление активности пользователя"""
+
+    async def update_user_activity(self, user_id: int, chat_id: int) -> Optional[User]:
+        """Обновление активности пользователя в чате; возвращает его строку (None - нет в БД)"""
         try:
-            user = await UserRepository.get_by_id(user_id)
-            if user:
-                user.last_activity = datetime.now()
-                user.updated_at = datetime.now()
-                await UserRepository.create_or_update(user)
+            user = await UserRepository.touch_activity(user_id, chat_id)
+            if user and user.role_assigned:
+                self.track(user.user_id, user.chat_id, user.last_activity)
+            return user
         except Exception as e:
             logger.error(f"Error updating user activity: {e}")
-    
+            return None
+
     async def stop(self):
         """Остановка проверки активности"""
-        if self.check_task and not self.check_task.done():
-            self.check_task.cancel()
-            try:
-                await self.check_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.deadline_task, self.refresh_task, self.check_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._heap = []
+        self._deadlines = {}
@@ -0,0 +1,38 @@
+import httpx
+from telegram.request import HTTPXRequest
+from config.settings import settings
+
+def create_bot_request(pool_size: int = None, keepalive_expiry: float = None) -> HTTPXRequest:
+    """HTTP-клиент для обычных вызовов Bot API (промоуты, удаления, сообщения).
+
+    Keep-alive по умолчанию у httpx - 5 секунд: между всплесками нагрузки
+    соединения закрываются и каждый новый всплеск платит за TCP/TLS заново.
+    Пул держит открытыми все соединения, а не только часть.
+    """
+    pool_size = pool_size or settings.BOT_API_POOL_SIZE
+    keepalive_expiry = settings.BOT_API_KEEPALIVE_EXPIRY if keepalive_expiry is None else keepalive_expiry
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=settings.BOT_API_CONNECT_TIMEOUT,
+        read_timeout=settings.BOT_API_READ_TIMEOUT,
+        write_timeout=settings.BOT_API_WRITE_TIMEOUT,
+        pool_timeout=settings.BOT_API_POOL_TIMEOUT,
+        http_version=settings.BOT_API_HTTP_VERSION,
+        httpx_kwargs={
+            'limits': httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry
+            )
+        }
+    )
+
+def create_get_updates_request() -> HTTPXRequest:
+    """HTTP-клиент getUpdates: один запрос за раз, к read_timeout добавляется таймаут long polling"""
+    return HTTPXRequest(
+        connection_pool_size=1,
+        connect_timeout=settings.GET_UPDATES_CONNECT_TIMEOUT,
+        read_timeout=settings.GET_UPDATES_READ_TIMEOUT,
+        pool_timeout=settings.GET_UPDATES_POOL_TIMEOUT,
+        http_version=settings.BOT_API_HTTP_VERSION
+    )
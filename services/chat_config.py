@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from database.models import ChatConfig
+from database.repositories import ChatConfigRepository
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class ChatConfigService:
+    """Настройки чатов в памяти.
+
+    Загружаются из БД один раз при запуске; изменения пишутся в БД и сразу
+    применяются в кэше, поэтому обработчики не обращаются к БД за настройками.
+    При нескольких процессах кэш периодически перечитывается (start_refresh).
+    """
+
+    def __init__(self):
+        self._configs: Dict[int, ChatConfig] = {}
+        # Наблюдатели за изменением настроек чата: listener(chat_id)
+        self.listeners: List[Callable[[int], Awaitable[None]]] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Загрузка настроек всех чатов"""
+        self._configs = {config.chat_id: config for config in await ChatConfigRepository.get_all()}
+        logger.info(f"Loaded settings for {len(self._configs)} chats")
+
+    async def refresh(self):
+        """Перечитывание настроек, измененных другими процессами"""
+        configs = {config.chat_id: config for config in await ChatConfigRepository.get_all()}
+        changed = [
+            chat_id for chat_id, config in configs.items()
+            if chat_id not in self._configs
+            or self._configs[chat_id].activity_timeout_minutes != config.activity_timeout_minutes
+        ]
+        self._configs = configs
+        for chat_id in changed:
+            await self._notify(chat_id)
+
+    async def _notify(self, chat_id: int):
+        for listener in self.listeners:
+            try:
+                await listener(chat_id)
+            except Exception as e:
+                logger.error(f"Error in chat config listener: {e}")
+
+    async def start_refresh(self, interval: float):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval), name="chat-config-refresh")
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.refresh()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error refreshing chat settings: {e}")
+
+    async def stop(self):
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+
+    def get(self, chat_id: int) -> ChatConfig:
+        config = self._configs.get(chat_id)
+        return config if config is not None else ChatConfig(chat_id=chat_id)
+
+    def activity_timeout_minutes(self, chat_id: int) -> int:
+        """Таймаут неактивности чата (или общий из настроек)"""
+        config = self._configs.get(chat_id)
+        if config is not None and config.activity_timeout_minutes:
+            return config.activity_timeout_minutes
+        return settings.ACTIVITY_TIMEOUT_MINUTES
+
+    async def set_activity_timeout(self, chat_id: int, minutes: int) -> bool:
+        """Изменение таймаута неактивности чата"""
+        config = self.get(chat_id).model_copy(update={
+            'activity_timeout_minutes': minutes,
+            'updated_at': datetime.now()
+        })
+        if not await ChatConfigRepository.save(config):
+            return False
+        self._configs[chat_id] = config
+        await self._notify(chat_id)
+        return True
+
+    def chat_ids(self) -> List[int]:
+        """Чаты из настроек окружения и чаты с сохраненными настройками"""
+        return sorted(set(settings.CHAT_IDS) | set(self._configs))
+
+chat_config = ChatConfigService()
@@ -0,0 +1,88 @@
+import time
+import logging
+from typing import Dict, Optional, Tuple
+from telegram import Bot, ChatMember, ChatMemberUpdated
+from config.settings import settings
+from services.log_pipeline import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+def is_admin_member(member: ChatMember) -> bool:
+    """Является ли участник администратором"""
+    return member.status in ADMIN_STATUSES
+
+class ChatMemberCache:
+    """Кэш статусов участников чата (включая права самого бота)"""
+
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl if ttl is not None else settings.CHAT_MEMBER_CACHE_TTL
+        # chat_id -> user_id -> (ChatMember, время истечения)
+        self._members: Dict[int, Dict[int, Tuple[ChatMember, float]]] = {}
+        self._next_sweep = 0.0
+
+    def get_cached(self, chat_id: int, user_id: int) -> Optional[ChatMember]:
+        """Получение участника из кэша без обращения к API"""
+        entry = self._members.get(chat_id, {}).get(user_id)
+        if entry is None:
+            return None
+        member, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._members[chat_id][user_id]
+            return None
+        return member
+
+    def put(self, chat_id: int, member: ChatMember):
+        """Сохранение участника в кэш"""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        self._members.setdefault(chat_id, {})[member.user.id] = (member, now + self.ttl)
+
+    def _sweep(self, now: float):
+        """Удаление истекших записей: события chat_member кладут в кэш и тех, кого потом не читают"""
+        for chat_id in list(self._members):
+            members = self._members[chat_id]
+            for user_id in [user_id for user_id, (_, expires_at) in members.items() if expires_at < now]:
+                del members[user_id]
+            if not members:
+                del self._members[chat_id]
+        self._next_sweep = now + self.ttl
+
+    async def get_member(self, bot: Bot, chat_id: int, user_id: int, use_cache: bool = True) -> ChatMember:
+        """Получение участника чата с использованием кэша"""
+        if use_cache:
+            member = self.get_cached(chat_id, user_id)
+            if member is not None:
+                return member
+        member = await bot.get_chat_member(chat_id, user_id)
+        self.put(chat_id, member)
+        return member
+
+    async def get_bot_member(self, bot: Bot, chat_id: int) -> ChatMember:
+        """Получение прав бота в чате"""
+        return await self.get_member(bot, chat_id, bot.id)
+
+    def invalidate(self, chat_id: int, user_id: Optional[int] = None):
+        """Сброс кэша для пользователя или для всего чата"""
+        if user_id is None:
+            self._members.pop(chat_id, None)
+        else:
+            self._members.get(chat_id, {}).pop(user_id, None)
+
+    def apply_update(self, chat_member_update: ChatMemberUpdated):
+        """Обновление кэша по событию chat_member / my_chat_member"""
+        chat_id = chat_member_update.chat.id
+        new_member = chat_member_update.new_chat_member
+        self.put(chat_id, new_member)
+        logger.debug(
+            "Chat member cache updated from event: chat %s, user %s, status %s",
+            chat_id, new_member.user.id, new_member.status, extra=SAMPLED
+        )
+
+    def clear(self):
+        """Полная очистка кэша"""
+        self._members.clear()
+
+chat_member_cache = ChatMemberCache()
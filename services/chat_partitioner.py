@@ -0,0 +1,61 @@
+import zlib
+import logging
+from typing import List, Optional
+import httpx
+from telegram import Update
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class ChatPartitioner:
+    """Распределение чатов между процессами бота.
+
+    Чат закреплен за воркером crc32(chat_id) % WORKER_COUNT, поэтому все
+    обновления одного чата обрабатываются одним процессом (порядок, кэши,
+    очередь ролей). Обновление чужого чата, пришедшее через балансировщик,
+    пересылается на webhook воркера-владельца.
+    """
+
+    def __init__(self, worker_index: int = None, worker_count: int = None, worker_urls: List[str] = None):
+        self.worker_index = settings.WORKER_INDEX if worker_index is None else worker_index
+        self.worker_count = settings.WORKER_COUNT if worker_count is None else worker_count
+        self.worker_urls = settings.WORKER_URLS if worker_urls is None else worker_urls
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.worker_count > 1
+
+    def owner_of(self, chat_id: int) -> int:
+        """Номер воркера, которому принадлежит чат"""
+        return zlib.crc32(str(chat_id).encode()) % self.worker_count
+
+    def is_local(self, update: Update) -> bool:
+        """Обрабатывается ли обновление этим процессом"""
+        if not self.enabled or update.effective_chat is None:
+            return True
+        return self.owner_of(update.effective_chat.id) == self.worker_index
+
+    async def forward(self, update: Update) -> bool:
+        """Пересылка обновления воркеру-владельцу чата"""
+        owner = self.owner_of(update.effective_chat.id)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10)
+        try:
+            response = await self._client.post(
+                self.worker_urls[owner],
+                json=update.to_dict(),
+                headers={'X-Telegram-Bot-Api-Secret-Token': settings.WEBHOOK_SECRET_TOKEN}
+            )
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to forward update {update.update_id} to worker {owner}: {e}")
+            return False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+chat_partitioner = ChatPartitioner()
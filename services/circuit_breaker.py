@@ -0,0 +1,88 @@
+import time
+import logging
+from typing import Dict
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class _ChatState:
+    __slots__ = ('state', 'open_until', 'backoff', 'failures')
+
+    def __init__(self):
+        self.state = ChatCircuitBreaker.CLOSED
+        self.open_until = 0.0
+        self.backoff = 0.0
+        self.failures = 0
+
+class ChatCircuitBreaker:
+    """Автомат-предохранитель на каждый чат.
+
+    После отказа чат размыкается: операции пропускаются без обращений к API
+    и БД. По истечении паузы пропускается одна пробная операция (half-open);
+    пауза растет вдвое после каждой неудачной пробы.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, base_backoff: float = None, max_backoff: float = None):
+        self.name = name
+        self.base_backoff = base_backoff or settings.BREAKER_BASE_BACKOFF
+        self.max_backoff = max_backoff or settings.BREAKER_MAX_BACKOFF
+        self._chats: Dict[int, _ChatState] = {}
+
+    def state(self, chat_id: int) -> str:
+        chat = self._chats.get(chat_id)
+        return chat.state if chat else self.CLOSED
+
+    def is_open(self, chat_id: int) -> bool:
+        """Разомкнут ли чат (без захвата пробы)"""
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.state == self.CLOSED:
+            return False
+        if chat.state == self.HALF_OPEN:
+            return True
+        return time.monotonic() < chat.open_until
+
+    def allow(self, chat_id: int) -> bool:
+        """Можно ли выполнять операцию; при истекшей паузе захватывает пробу"""
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.state == self.CLOSED:
+            return True
+        if chat.state == self.OPEN and time.monotonic() >= chat.open_until:
+            chat.state = self.HALF_OPEN
+            logger.info(f"Circuit '{self.name}' half-open for chat {chat_id}, probing")
+            return True
+        return False
+
+    def record_success(self, chat_id: int):
+        """Успешная операция замыкает чат"""
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None and chat.state != self.CLOSED:
+            logger.info(f"Circuit '{self.name}' closed for chat {chat_id}")
+
+    def record_failure(self, chat_id: int):
+        """Отказ размыкает чат с растущей паузой"""
+        chat = self._chats.setdefault(chat_id, _ChatState())
+        chat.failures += 1
+        chat.backoff = min(self.max_backoff, chat.backoff * 2 if chat.backoff else self.base_backoff)
+        chat.open_until = time.monotonic() + chat.backoff
+        if chat.state != self.OPEN:
+            logger.warning(f"Circuit '{self.name}' opened for chat {chat_id} for {chat.backoff:.0f}s")
+        chat.state = self.OPEN
+
+    def release(self, chat_id: int):
+        """Операция без результата (временная ошибка): захваченная проба
+        возвращается, пауза не растет"""
+        chat = self._chats.get(chat_id)
+        if chat is not None and chat.state == self.HALF_OPEN:
+            chat.state = self.OPEN
+            chat.open_until = time.monotonic()
+
+    def stats(self) -> Dict[int, str]:
+        """Состояние разомкнутых чатов"""
+        return {chat_id: chat.state for chat_id, chat in self._chats.items()}
+
+# Нет права can_promote_members у бота
+promote_breaker = ChatCircuitBreaker('promote_rights')
@@ -0,0 +1,188 @@
+import time
+import heapq
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from telegram import Bot
+from database.models import ScheduledDeletion
+from database.repositories import ScheduledDeletionRepository
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Bot API удаляет не более 100 сообщений за один вызов deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+# Пауза перед повторной записью заданий после ошибки БД, секунды
+PERSIST_RETRY_DELAY = 5
+
+class DeletionScheduler:
+    """Единый планировщик отложенного удаления сообщений.
+
+    Вместо отдельной спящей задачи на каждое сообщение - куча сроков и один
+    цикл. Задания сохраняются в БД; сообщения одного чата, срок которых
+    наступил одновременно, удаляются одним вызовом deleteMessages. Каждый
+    процесс удаляет свои сообщения, а задания, брошенные остановленными
+    процессами, подбирает ведущий процесс (start_recovery).
+    """
+
+    def __init__(self, batch_window: float = None):
+        self.batch_window = settings.DELETE_BATCH_WINDOW if batch_window is None else batch_window
+        self.bot: Optional[Bot] = None
+        # (время удаления, chat_id, message_id)
+        self._heap: List[Tuple[float, int, int]] = []
+        self._unsaved: List[Tuple[float, int, int]] = []
+        # После неудачной записи в БД повтор не раньше этого момента (time.time())
+        self._persist_retry_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._recovery_task: Optional[asyncio.Task] = None
+
+    async def start(self, bot: Bot):
+        """Запуск цикла удаления"""
+        self.bot = bot
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run(), name="deletion-scheduler")
+
+    async def start_recovery(self):
+        """Подбор просроченных заданий из БД (только на ведущем процессе)"""
+        if self._recovery_task is None or self._recovery_task.done():
+            self._recovery_task = asyncio.create_task(self._recovery_loop(), name="deletion-recovery")
+
+    async def stop_recovery(self):
+        if self._recovery_task and not self._recovery_task.done():
+            self._recovery_task.cancel()
+            try:
+                await self._recovery_task
+            except asyncio.CancelledError:
+                pass
+        self._recovery_task = None
+
+    async def _recovery_loop(self):
+        limit = DELETE_MESSAGES_LIMIT * 10
+        while True:
+            try:
+                # Живой процесс удаляет свои сообщения почти вовремя, поэтому
+                # задания, просроченные больше чем на DELETION_RECOVERY_GRACE, брошены
+                before = datetime.now() - timedelta(seconds=settings.DELETION_RECOVERY_GRACE)
+                claimed = await ScheduledDeletionRepository.claim_overdue(before, limit)
+                if claimed:
+                    logger.info(f"Recovered {len(claimed)} overdue message deletions")
+                    now = time.time()
+                    for deletion in claimed:
+                        heapq.heappush(self._heap, (now, deletion.chat_id, deletion.message_id))
+                    self._wakeup.set()
+                if len(claimed) < limit:
+                    await asyncio.sleep(settings.DELETION_RECOVERY_GRACE)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in deletion recovery loop: {e}")
+                await asyncio.sleep(settings.DELETION_RECOVERY_GRACE)
+
+    def schedule(self, chat_id: int, message_id: int, delay: float = None):
+        """Планирование удаления сообщения через delay секунд"""
+        delay = settings.MESSAGE_DELETE_DELAY if delay is None else delay
+        entry = (time.time() + delay, chat_id, message_id)
+        heapq.heappush(self._heap, entry)
+        self._unsaved.append(entry)
+        self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        """Количество запланированных удалений"""
+        return len(self._heap)
+
+    async def _persist_unsaved(self, min_delete_at: float) -> bool:
+        """Запись новых заданий в БД; при ошибке задания остаются несохраненными"""
+        entries = [e for e in self._unsaved if e[0] > min_delete_at]
+        # Задания, добавленные во время записи, попадут в следующую
+        self._unsaved = []
+        if not entries:
+            return True
+        saved = False
+        try:
+            saved = await ScheduledDeletionRepository.add_many([
+                ScheduledDeletion(chat_id=chat_id, message_id=message_id, delete_at=datetime.fromtimestamp(at))
+                for at, chat_id, message_id in entries
+            ])
+        finally:
+            if not saved:
+                self._unsaved[:0] = entries
+                self._persist_retry_at = time.time() + PERSIST_RETRY_DELAY
+                logger.warning(f"{len(entries)} scheduled deletions not persisted, retrying in {PERSIST_RETRY_DELAY}s")
+        return saved
+
+    def _pop_due(self, now: float) -> Dict[int, List[int]]:
+        due: Dict[int, List[int]] = defaultdict(list)
+        while self._heap and self._heap[0][0] <= now + self.batch_window:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due[chat_id].append(message_id)
+        return due
+
+    async def _delete_batch(self, chat_id: int, message_ids: List[int]):
+        for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+            chunk = message_ids[i:i + DELETE_MESSAGES_LIMIT]
+            try:
+                if len(chunk) == 1:
+                    await self.bot.delete_message(chat_id=chat_id, message_id=chunk[0])
+                else:
+                    await self.bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            except Exception as e:
+                logger.error(f"Failed to delete {len(chunk)} messages in chat {chat_id}: {e}")
+        await ScheduledDeletionRepository.delete_many(chat_id, message_ids)
+
+    async def flush(self) -> bool:
+        """Один проход цикла: запись новых заданий и удаление наступивших.
+        True, если что-то было удалено"""
+        now = time.time()
+        if self._unsaved and now >= self._persist_retry_at:
+            # Сообщения, которые удалятся прямо сейчас, сохранять нет смысла
+            await self._persist_unsaved(now + self.batch_window)
+        due = self._pop_due(now)
+        if due:
+            await asyncio.gather(*(
+                self._delete_batch(chat_id, message_ids)
+                for chat_id, message_ids in due.items()
+            ))
+        return bool(due)
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.flush():
+                    continue
+
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                self._wakeup.clear()
+                if self._unsaved:
+                    retry_in = self._persist_retry_at - time.time()
+                    if retry_in <= 0:
+                        continue
+                    timeout = retry_in if timeout is None else min(timeout, retry_in)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in deletion scheduler: {e}")
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        """Остановка цикла; несохраненные задания записываются в БД"""
+        await self.stop_recovery()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._unsaved and not await self._persist_unsaved(float('-inf')):
+            logger.error(f"{len(self._unsaved)} scheduled deletions lost on shutdown: database write failed")
+
+deletion_scheduler = DeletionScheduler()
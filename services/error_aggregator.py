@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+from telegram import Bot
+from database.models import LogEntry
+from database.repositories import LogRepository
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Числа, hex-идентификаторы и строки в кавычках не влияют на отпечаток
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|\d+|'[^']*'|\"[^\"]*\"")
+
+# Буфер записей лога при недоступной БД
+MAX_BUFFERED_ROWS = 1000
+
+def fingerprint(error: BaseException) -> str:
+    """Отпечаток ошибки: тип, нормализованный текст и место возникновения"""
+    frames = traceback.extract_tb(error.__traceback__) if error.__traceback__ else []
+    origin = f"{os.path.basename(frames[-1].filename)}:{frames[-1].lineno}" if frames else ""
+    message = _VOLATILE.sub('#', str(error))[:200]
+    raw = f"{type(error).__name__}|{message}|{origin}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+class ErrorGroup:
+    """Повторения одной ошибки"""
+
+    def __init__(self, key: str, error: BaseException):
+        self.key = key
+        self.name = type(error).__name__
+        self.sample = str(error)[:500]
+        self.window_started = time.monotonic()
+        self.last_seen = self.window_started
+        self.total = 0
+        # Повторы, о которых администраторы еще не знают
+        self.unreported = 0
+        self.users = set()
+
+class ErrorAggregator:
+    """Агрегация ошибок вместо сообщения и записи в БД на каждое исключение.
+
+    Первая ошибка с новым отпечатком сразу пишется в лог и (в пределах
+    ERROR_ALERTS_PER_DIGEST) отправляется администраторам. Повторы в окне
+    ERROR_DEDUP_WINDOW только считаются и попадают в периодическую сводку.
+    Записи в таблицу logs пишутся пакетами.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self.admin_ids: List[int] = []
+        self._groups: Dict[str, ErrorGroup] = {}
+        self._rows: List[LogEntry] = []
+        self._alerts_left = settings.ERROR_ALERTS_PER_DIGEST
+        self._alert_tasks = set()
+        self._digest_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self, bot: Bot, admin_ids: List[int]):
+        """Запуск сводок и пакетной записи"""
+        self.bot = bot
+        self.admin_ids = list(admin_ids)
+        if self._digest_task is None or self._digest_task.done():
+            self._digest_task = asyncio.create_task(self._digest_loop(), name="error-digest")
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="error-log-flush")
+
+    def record(self, error: BaseException, user_id: int = 0) -> bool:
+        """Учет ошибки; True, если это первая ошибка с таким отпечатком в окне"""
+        key = fingerprint(error)
+        now = time.monotonic()
+        group = self._groups.get(key)
+        is_new = group is None or now - group.window_started >= settings.ERROR_DEDUP_WINDOW
+        if is_new:
+            unreported = group.unreported if group else 0
+            group = self._groups[key] = ErrorGroup(key, error)
+            group.unreported = unreported
+            self._add_row(user_id, "error", f"[{key}] {group.sample}")
+            if self._alerts_left > 0:
+                self._alerts_left -= 1
+                self._send_later(f"❌ Ошибка бота [{key}]:\n\n{group.sample}")
+            else:
+                group.unreported += 1
+        else:
+            group.unreported += 1
+        group.total += 1
+        group.last_seen = now
+        if user_id:
+            group.users.add(user_id)
+        return is_new
+
+    def _add_row(self, user_id: int, action: str, details: str):
+        if len(self._rows) >= MAX_BUFFERED_ROWS:
+            self._rows.pop(0)
+        self._rows.append(LogEntry(user_id=user_id, action=action, details=details, created_at=datetime.now()))
+
+    def _send_later(self, text: str):
+        if self.bot is None or not self.admin_ids:
+            return
+        task = asyncio.create_task(self._send_to_admins(text))
+        self._alert_tasks.add(task)
+        task.add_done_callback(self._alert_tasks.discard)
+
+    async def _send_to_admins(self, text: str):
+        for admin_id in self.admin_ids:
+            try:
+                await self.bot.send_message(chat_id=admin_id, text=text[:4000])
+            except Exception as e:
+                logger.error(f"Failed to send error to admin: {e}")
+
+    def build_digest(self) -> Optional[str]:
+        """Сводка неотправленных повторов; счетчики сбрасываются"""
+        groups = sorted(
+            (g for g in self._groups.values() if g.unreported),
+            key=lambda g: g.unreported, reverse=True
+        )
+        if not groups:
+            return None
+        lines = ["📋 Сводка повторяющихся ошибок:"]
+        for group in groups[:20]:
+            lines.append(f"\n• ×{group.unreported} {group.name} [{group.key}], пользователей: {len(group.users)}\n  {group.sample[:200]}")
+            self._add_row(0, "error_digest", f"[{group.key}] x{group.unreported} {group.sample[:200]}")
+        if len(groups) > 20:
+            lines.append(f"\n…и еще {len(groups) - 20} видов ошибок")
+        for group in groups:
+            group.unreported = 0
+        return ''.join(lines)
+
+    def _expire_groups(self):
+        now = time.monotonic()
+        for key in [k for k, g in self._groups.items()
+                    if not g.unreported and now - g.last_seen >= settings.ERROR_DEDUP_WINDOW]:
+            del self._groups[key]
+
+    async def _digest_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.ERROR_DIGEST_INTERVAL)
+                digest = self.build_digest()
+                self._alerts_left = settings.ERROR_ALERTS_PER_DIGEST
+                self._expire_groups()
+                if digest:
+                    await self._send_to_admins(digest)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in error digest loop: {e}")
+
+    async def flush(self):
+        """Пакетная запись накопленных записей лога"""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        if not await LogRepository.create_many(rows):
+            # Вернем в буфер, чтобы записать при следующей попытке
+            self._rows = (rows + self._rows)[-MAX_BUFFERED_ROWS:]
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.ERROR_LOG_FLUSH_INTERVAL)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in error log flush loop: {e}")
+
+    async def stop(self):
+        """Остановка с записью оставшихся логов"""
+        for task in (self._digest_task, self._flush_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.build_digest()
+        await self.flush()
+
+error_aggregator = ErrorAggregator()
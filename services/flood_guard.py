@@ -0,0 +1,121 @@
+import time
+import logging
+from typing import Dict, Hashable, Optional
+from services.metrics import metrics
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FLOOD_DROPPED = metrics.counter(
+    'flood_dropped_messages_total', 'Messages dropped by the anti-flood limiter', ('scope',)
+)
+FLOOD_MUTES = metrics.counter(
+    'flood_mutes_total', 'Users muted for flooding', ('result',)
+)
+
+# Решения проверки
+ALLOW = 'allow'
+DROP = 'drop'
+MUTE = 'mute'
+
+class SlidingWindow:
+    """Приближенное скользящее окно на двух счетчиках (текущее и прошлое окно).
+
+    Оценка = прошлое окно * доля, еще попадающая в скользящее окно + текущее.
+    """
+
+    __slots__ = ('started', 'current', 'previous')
+
+    def __init__(self, started: float):
+        self.started = started
+        self.current = 0
+        self.previous = 0
+
+    def hit(self, now: float, window: float) -> float:
+        """Учет события; возвращает оценку числа событий за последние window секунд"""
+        elapsed = now - self.started
+        if elapsed >= window:
+            if elapsed < 2 * window:
+                # Текущее окно закончилось и становится прошлым
+                self.previous = self.current
+                self.started += window
+            else:
+                # Событий не было дольше окна - прошлое окно пустое
+                self.previous = 0
+                self.started = now
+            self.current = 0
+            elapsed = now - self.started
+        self.current += 1
+        return self.previous * (1 - elapsed / window) + self.current
+
+class FloodGuard:
+    """Ограничение частоты сообщений по пользователю и по чату, без обращений к БД.
+
+    Пользователь сверх user_limit сообщений за window секунд получает
+    временный мут (один раз на mute_seconds), его сообщения до конца мута
+    отбрасываются. Чат сверх chat_limit отбрасывает сообщения всех
+    пользователей до спада волны: обработка с записью в БД не
+    выполняется, чтобы волна спама не стала волной записей.
+    """
+
+    def __init__(self, user_limit: int = None, chat_limit: int = None, window: float = None, mute_seconds: int = None):
+        self.user_limit = settings.FLOOD_USER_LIMIT if user_limit is None else user_limit
+        self.chat_limit = settings.FLOOD_CHAT_LIMIT if chat_limit is None else chat_limit
+        self.window = window or settings.FLOOD_WINDOW
+        self.mute_seconds = mute_seconds or settings.FLOOD_MUTE_SECONDS
+        self._users: Dict[Hashable, SlidingWindow] = {}
+        self._chats: Dict[int, SlidingWindow] = {}
+        # (chat_id, user_id) -> monotonic-время окончания мута
+        self._muted: Dict[Hashable, float] = {}
+        self._next_prune = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.user_limit > 0 or self.chat_limit > 0
+
+    def check(self, chat_id: int, user_id: int, now: Optional[float] = None) -> str:
+        """ALLOW, DROP (отбросить сообщение) или MUTE (отбросить и замутить пользователя)"""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_prune:
+            self._prune(now)
+
+        key = (chat_id, user_id)
+        muted_until = self._muted.get(key)
+        if muted_until is not None:
+            if now < muted_until:
+                FLOOD_DROPPED.inc(scope='muted')
+                return DROP
+            del self._muted[key]
+
+        if self.user_limit > 0:
+            counter = self._users.get(key)
+            if counter is None:
+                counter = self._users[key] = SlidingWindow(now)
+            if counter.hit(now, self.window) > self.user_limit:
+                self._muted[key] = now + self.mute_seconds
+                # После мута счет начинается заново
+                del self._users[key]
+                FLOOD_DROPPED.inc(scope='user')
+                return MUTE
+
+        if self.chat_limit > 0:
+            counter = self._chats.get(chat_id)
+            if counter is None:
+                counter = self._chats[chat_id] = SlidingWindow(now)
+            if counter.hit(now, self.window) > self.chat_limit:
+                FLOOD_DROPPED.inc(scope='chat')
+                return DROP
+
+        return ALLOW
+
+    def _prune(self, now: float):
+        """Удаление счетчиков, не менявшихся дольше двух окон"""
+        stale = now - 2 * self.window
+        for counters in (self._users, self._chats):
+            for key in [key for key, counter in counters.items() if counter.started < stale]:
+                del counters[key]
+        for key in [key for key, until in self._muted.items() if until <= now]:
+            del self._muted[key]
+        self._next_prune = now + self.window
+
+flood_guard = FloodGuard()
@@ -0,0 +1,114 @@
+import zlib
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+import asyncpg
+from database.connection import Database
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+LeaderCallback = Callable[[], Awaitable[None]]
+
+class LeaderElection:
+    """Выбор ведущего процесса через advisory-блокировку Postgres.
+
+    Блокировка сессионная: держится на выделенном подключении, пока процесс
+    жив. Если подключение потеряно, Postgres снимает блокировку сам и ее
+    забирает другой процесс. Одиночные задачи запускаются в on_elected и
+    останавливаются в on_demoted.
+    """
+
+    def __init__(self, name: str, interval: float = None):
+        self.name = name
+        self.lock_key = zlib.crc32(name.encode())
+        self.interval = interval or settings.LEADER_CHECK_INTERVAL
+        self.is_leader = False
+        self.on_elected: List[LeaderCallback] = []
+        self.on_demoted: List[LeaderCallback] = []
+        self._conn: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Первая попытка сразу, затем периодическая проверка"""
+        if self._task is not None and not self._task.done():
+            return
+        # Цикл создается до первой попытки: ее ошибка не должна остановить выборы
+        first_check = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._loop(first_check), name=f"leader-{self.name}")
+        await asyncio.shield(first_check)
+
+    async def _loop(self, first_check: asyncio.Future):
+        try:
+            await self._check()
+        except Exception as e:
+            logger.error(f"Error in leader election '{self.name}': {e}")
+        finally:
+            if not first_check.done():
+                first_check.set_result(None)
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                await self._check()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in leader election '{self.name}': {e}")
+
+    async def _check(self):
+        if self._conn is not None:
+            try:
+                await self._conn.fetchval("SELECT 1")
+                return
+            except Exception as e:
+                logger.error(f"Leader connection for '{self.name}' lost: {e}")
+                await self._demote()
+                return
+
+        conn = await Database.acquire()
+        try:
+            acquired = await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key)
+        except Exception:
+            await Database.release(conn)
+            raise
+        if not acquired:
+            await Database.release(conn)
+            return
+
+        self._conn = conn
+        self.is_leader = True
+        logger.info(f"This worker is now leader for '{self.name}'")
+        await self._run_callbacks(self.on_elected)
+
+    async def _demote(self):
+        self.is_leader = False
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                await conn.fetchval("SELECT pg_advisory_unlock($1)", self.lock_key)
+            except Exception:
+                pass
+            try:
+                await Database.release(conn)
+            except Exception:
+                pass
+        logger.warning(f"This worker is no longer leader for '{self.name}'")
+        await self._run_callbacks(self.on_demoted)
+
+    async def _run_callbacks(self, callbacks: List[LeaderCallback]):
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Error in leader callback for '{self.name}': {e}")
+
+    async def stop(self):
+        """Остановка и освобождение блокировки"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.is_leader:
+            await self._demote()
@@ -0,0 +1,149 @@
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from services.tracing import tracer
+from config.settings import settings
+
+# Пометка частых строк (на каждое сообщение): logger.debug(..., extra=SAMPLED)
+SAMPLED = {'sampled': True}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord; остальные пришли через extra и попадают в JSON
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'sampled'}
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() склеивает сообщение с аргументами и форматирует
+    traceback до постановки в очередь, то есть в event loop. Здесь запись
+    уходит как есть, а getMessage() и traceback выполняет поток слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class TraceContextFilter(logging.Filter):
+    """Идентификатор текущей трассы в записи; читается до ухода в другой поток"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'trace_id'):
+            trace_id = tracer.current_trace_id()
+            if trace_id:
+                record.trace_id = trace_id
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Ограничение частоты строк, помеченных SAMPLED.
+
+    Каждый шаблон сообщения (логгер + строка формата до подстановки
+    аргументов) пропускается не чаще limit раз за window секунд. Число
+    отброшенных записей добавляется к первой пропущенной записи следующего
+    окна (поле suppressed).
+    """
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (логгер, шаблон) -> [начало окна, пропущено в окне, отброшено]
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False) or self.limit <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra сохраняются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат; число отброшенных строк дописывается в конец"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" [{suppressed} similar suppressed]"
+        return line
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+def setup_logging(level: str = None, log_format: str = None) -> QueueListener:
+    """Логирование через очередь: event loop только ставит запись в очередь,
+    форматирование и запись в поток выполняет отдельный поток"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+    log_format = (log_format or settings.LOG_FORMAT).lower()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_LIMIT, settings.LOG_SAMPLE_WINDOW))
+    queue_handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    _queue_handler = queue_handler
+    root.setLevel(getattr(logging, (level or settings.LOG_LEVEL).upper()))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Остановка слушателя; оставшиеся в очереди записи дописываются, дальше - напрямую"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
+    _queue_handler = None
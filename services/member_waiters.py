@@ -0,0 +1,94 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from telegram import Bot, ChatMember, ChatMemberUpdated
+from services.chat_member_cache import chat_member_cache
+
+logger = logging.getLogger(__name__)
+
+MemberPredicate = Callable[[ChatMember], bool]
+
+class StatusWaiter:
+    """Ожидание нужного статуса участника чата"""
+
+    def __init__(self, chat_id: int, user_id: int, predicate: MemberPredicate):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.predicate = predicate
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class MemberStatusWaiters:
+    """Реестр ожиданий изменения статуса участников.
+
+    Ожидание завершается входящим обновлением chat_member; опрос
+    get_chat_member с растущей паузой используется только как запасной путь.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[Tuple[int, int], List[StatusWaiter]] = {}
+
+    def register(self, chat_id: int, user_id: int, predicate: MemberPredicate) -> StatusWaiter:
+        """Регистрация ожидания (до вызова API, чтобы не пропустить событие)"""
+        waiter = StatusWaiter(chat_id, user_id, predicate)
+        self._waiters.setdefault((chat_id, user_id), []).append(waiter)
+        return waiter
+
+    def discard(self, waiter: StatusWaiter):
+        """Снятие ожидания из реестра"""
+        key = (waiter.chat_id, waiter.user_id)
+        waiters = self._waiters.get(key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[key]
+        if not waiter.future.done():
+            waiter.future.cancel()
+
+    def _try_resolve(self, waiter: StatusWaiter, member: ChatMember) -> bool:
+        if waiter.future.done() or not waiter.predicate(member):
+            return False
+        waiter.future.set_result(member)
+        return True
+
+    def resolve(self, chat_member_update: ChatMemberUpdated):
+        """Завершение ожиданий по событию chat_member"""
+        member = chat_member_update.new_chat_member
+        key = (chat_member_update.chat.id, member.user.id)
+        for waiter in list(self._waiters.get(key, [])):
+            if self._try_resolve(waiter, member):
+                logger.debug(f"Waiter for user {member.user.id} in chat {key[0]} resolved by update")
+                self.discard(waiter)
+
+    async def wait(
+        self,
+        waiter: StatusWaiter,
+        bot: Bot,
+        timeout: float,
+        initial_delay: float = 0.2,
+        max_delay: float = 2.0
+    ) -> Optional[ChatMember]:
+        """Ожидание статуса: событие или опрос с растущей паузой. None по таймауту"""
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                done, _ = await asyncio.wait({waiter.future}, timeout=min(delay, remaining))
+                if done:
+                    return waiter.future.result()
+                try:
+                    member = await chat_member_cache.get_member(
+                        bot, waiter.chat_id, waiter.user_id, use_cache=False
+                    )
+                    if self._try_resolve(waiter, member):
+                        return member
+                except Exception as e:
+                    logger.warning(f"Fallback status poll failed for user {waiter.user_id}: {e}")
+                delay = min(delay * 2, max_delay)
+        finally:
+            self.discard(waiter)
+
+member_waiters = MemberStatusWaiters()
@@ -2,9 +2,16 @@ import re
 import logging
 from typing import List
 from database.repositories import ProfanityWordRepository
+from services.metrics import metrics
+from services.log_pipeline import SAMPLED
 
 logger = logging.getLogger(__name__)
 
+PROFANITY_SCAN_SECONDS = metrics.histogram(
+    'profanity_scan_duration_seconds', 'Profanity regex scan time per message',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+
 class ProfanityFilter:
     """Фильтр нецензурной лексики"""
     
@@ -60,29 +67,20 @@ class ProfanityFilter:
             return False
         
         try:
-            # Приводим текст к нижнему регистру для поиска
-            text_lower = text.lower()
-            
-            # Проверяем через регулярное выражение
-            result = bool(self.pattern.search(text_lower))
-            
-            # Дополнительная проверка: ищем слова как подстроки (на случай если regex не сработал)
-            if not result:
-                # Проверяем каждое слово отдельно
-                for word in self.bad_words:
-                    word_lower = word.lower()
-                    # Ищем слово как отдельное слово (окруженное не-буквами или границами)
-                    if re.search(r'(?:^|[^\w])' + re.escape(word_lower) + r'(?:[^\w]|$)', text_lower, re.IGNORECASE | re.UNICODE):
-                        result = True
-                        logger.debug(f"Found profanity word '{word}' in text (fallback check)")
-                        break
+            with PROFANITY_SCAN_SECONDS.time():
+                # Приводим текст к нижнему регистру для поиска
+                text_lower = text.lower()
+                
+                # Общий паттерн содержит все слова с теми же границами, что и
+                # проверка по одному слову, поэтому отдельный проход по списку не нужен
+                result = bool(self.pattern.search(text_lower))
             
-            if result:
-                # Находим и логируем совпадения
-                matches = self.pattern.findall(text_lower) if self.pattern else []
-                logger.info(f"Profanity detected: found {len(matches) if matches else 1} matches in text")
-                logger.debug(f"Matched words: {matches}")
-                logger.debug(f"Original text: {text[:100]}...")
+            # Повторный поиск всех совпадений нужен только для отладочного лога
+            if result and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Profanity detected: matched %s in text: %.100s...",
+                    self.pattern.findall(text_lower), text, extra=SAMPLED
+                )
             
             return result
         except Exception as e:
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def collapse_stack(frame) -> str:
+    """Стек в формате collapsed (корень;...;лист) для flamegraph.pl / speedscope"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+@dataclass
+class LoopStall:
+    """Блокировка event loop дольше порога"""
+    started_at: datetime
+    duration: float
+    stack: List[str]
+
+@dataclass
+class ProfileResult:
+    """Итог сеанса профилирования"""
+    started_at: datetime
+    duration: float
+    samples: int
+    stacks: Counter = field(default_factory=Counter)
+    stalls: List[LoopStall] = field(default_factory=list)
+    profile_path: Optional[str] = None
+    stalls_path: Optional[str] = None
+
+    def top_functions(self, limit: int = 10) -> List[tuple]:
+        """Функции с наибольшим собственным временем (доля выборок)"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = self.samples or 1
+        return [(name, count / total) for name, count in leaves.most_common(limit)]
+
+class SamplingProfiler:
+    """Выборочный профилировщик работающего процесса.
+
+    Фоновый поток с заданным интервалом снимает стек потока event loop
+    (sys._current_frames) и считает одинаковые стеки - накладные расходы не
+    зависят от количества вызовов функций, в отличие от cProfile. Тот же
+    поток следит за пульсом, который loop обновляет каждые interval секунд:
+    если пульса нет дольше порога, стек блокирующего колбэка сохраняется.
+    """
+
+    def __init__(self, interval: float = None, lag_threshold: float = None, output_dir: str = None):
+        self.interval = interval or settings.PROFILE_INTERVAL
+        self.lag_threshold = lag_threshold or settings.PROFILE_LOOP_LAG_THRESHOLD
+        self.output_dir = output_dir or settings.PROFILE_DIR
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float) -> ProfileResult:
+        """Профилирование в течение seconds секунд (одновременно только один сеанс)"""
+        if self._lock.locked():
+            raise RuntimeError("Profiler is already running")
+        async with self._lock:
+            seconds = min(max(seconds, 1), settings.PROFILE_MAX_SECONDS)
+            loop = asyncio.get_running_loop()
+            result = ProfileResult(started_at=datetime.now(), duration=seconds, samples=0)
+            heartbeat = [time.monotonic()]
+            stop = threading.Event()
+
+            def beat():
+                heartbeat[0] = time.monotonic()
+                if not stop.is_set():
+                    loop.call_later(self.interval, beat)
+
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), heartbeat, stop, result),
+                name="sampling-profiler",
+                daemon=True
+            )
+            logger.info(f"Profiling for {seconds:.0f}s (interval {self.interval * 1000:.0f}ms)")
+            loop.call_soon(beat)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+            await asyncio.to_thread(self._save, result)
+            logger.info(
+                f"Profiling finished: {result.samples} samples, {len(result.stalls)} loop stalls, "
+                f"profile {result.profile_path}"
+            )
+            return result
+
+    def _sample(self, thread_id: int, heartbeat: list, stop: threading.Event, result: ProfileResult):
+        stall_started: Optional[float] = None
+        stall_stack: List[str] = []
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            result.stacks[collapse_stack(frame)] += 1
+            result.samples += 1
+
+            lag = time.monotonic() - heartbeat[0]
+            if lag > self.lag_threshold:
+                if stall_started is None:
+                    # Стек снимается в момент обнаружения - это и есть блокирующий код
+                    stall_started = heartbeat[0]
+                    stall_stack = traceback.format_stack(frame)
+            elif stall_started is not None:
+                self._record_stall(result, stall_started, heartbeat[0], stall_stack)
+                stall_started = None
+            del frame
+        if stall_started is not None:
+            self._record_stall(result, stall_started, time.monotonic(), stall_stack)
+
+    def _record_stall(self, result: ProfileResult, started: float, ended: float, stack: List[str]):
+        duration = ended - started - self.interval
+        started_at = datetime.fromtimestamp(time.time() - (time.monotonic() - started))
+        result.stalls.append(LoopStall(started_at=started_at, duration=duration, stack=stack))
+        logger.warning(f"Event loop blocked for {duration * 1000:.0f}ms at:\n{''.join(stack[-5:])}")
+
+    def _save(self, result: ProfileResult):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = result.started_at.strftime('%Y%m%d-%H%M%S')
+            result.profile_path = os.path.join(self.output_dir, f"profile-{stamp}.folded")
+            with open(result.profile_path, 'w', encoding='utf-8') as f:
+                for stack, count in result.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            if result.stalls:
+                result.stalls_path = os.path.join(self.output_dir, f"profile-{stamp}-stalls.txt")
+                with open(result.stalls_path, 'w', encoding='utf-8') as f:
+                    for stall in result.stalls:
+                        f.write(f"{stall.started_at.isoformat()} blocked {stall.duration * 1000:.0f}ms\n")
+                        f.write(''.join(stall.stack))
+                        f.write('\n')
+        except Exception as e:
+            logger.error(f"Failed to save profile: {e}")
+
+profiler = SamplingProfiler()
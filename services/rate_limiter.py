@@ -0,0 +1,275 @@
+import time
+import bisect
+import asyncio
+import logging
+import itertools
+import contextlib
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from services.metrics import metrics
+from services.tracing import tracer
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BOT_API_SECONDS = metrics.histogram(
+    'bot_api_request_duration_seconds', 'Bot API call time (after rate limiting)', ('endpoint',)
+)
+BOT_API_ERRORS = metrics.counter(
+    'bot_api_errors_total', 'Failed Bot API calls', ('endpoint', 'error')
+)
+
+# Классы приоритета (меньше - важнее). Без нуля: ExtBot отбрасывает
+# ложное значение rate_limit_args, и приоритет 0 не дошел бы до ограничителя
+PRIORITY_MODERATION = 1
+PRIORITY_ROLES = 2
+PRIORITY_NOTIFY = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: 'moderation',
+    PRIORITY_ROLES: 'roles',
+    PRIORITY_NOTIFY: 'notify',
+}
+
+ENDPOINT_PRIORITIES = {
+    'deleteMessage': PRIORITY_MODERATION,
+    'deleteMessages': PRIORITY_MODERATION,
+    'restrictChatMember': PRIORITY_MODERATION,
+    'banChatMember': PRIORITY_MODERATION,
+    'unbanChatMember': PRIORITY_MODERATION,
+    'promoteChatMember': PRIORITY_ROLES,
+    'setChatAdministratorCustomTitle': PRIORITY_ROLES,
+    'getChatMember': PRIORITY_ROLES,
+    'getChatAdministrators': PRIORITY_ROLES,
+    'getChat': PRIORITY_ROLES,
+}
+
+class TokenBucket:
+    """Корзина токенов: rate запросов за period секунд"""
+
+    def __init__(self, rate: float, period: float):
+        self.capacity = rate
+        self.fill_rate = rate / period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до появления токена"""
+        if self.paused_until > now:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.fill_rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов (после RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'chat_key', 'limit_chat', 'future')
+
+    def __init__(self, priority: int, seq: int, chat_key, limit_chat: bool):
+        self.priority = priority
+        self.seq = seq
+        self.chat_key = chat_key
+        self.limit_chat = limit_chat
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: '_Ticket') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Ограничитель исходящих запросов к Bot API.
+
+    Общая корзина (30 запросов/с) и корзины на каждый чат (20 сообщений/мин
+    в группах, 1 сообщение/с в личке). Ожидающие запросы получают токены по
+    приоритету: модерация, затем роли, затем уведомления. RetryAfter
+    обрабатывается здесь же: чат (или весь бот) ставится на паузу, запрос
+    повторяется. Приоритет можно переопределить через ``rate_limit_args``.
+    """
+
+    def __init__(
+        self,
+        global_per_second: float = None,
+        group_per_minute: float = None,
+        private_per_second: float = 1,
+        max_retries: int = None
+    ):
+        self.global_bucket = TokenBucket(global_per_second or settings.RATE_LIMIT_GLOBAL_PER_SECOND, 1)
+        self.group_per_minute = group_per_minute or settings.RATE_LIMIT_GROUP_PER_MINUTE
+        self.private_per_second = private_per_second
+        self.max_retries = settings.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._waiting: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted = Counter()
+        self.retry_after_count = 0
+        self.max_depth = 0
+        self._last_depth_warning = 0.0
+
+    async def initialize(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch_loop(), name="rate-limiter")
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._dispatcher
+            self._dispatcher = None
+
+    def _chat_bucket(self, chat_key) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_key)
+        if bucket is None:
+            if len(self._chat_buckets) > 512:
+                now = time.monotonic()
+                for key, old in list(self._chat_buckets.items()):
+                    if old.is_idle(now):
+                        del self._chat_buckets[key]
+            if isinstance(chat_key, str) or chat_key < 0:
+                bucket = TokenBucket(self.group_per_minute, 60)
+            else:
+                bucket = TokenBucket(self.private_per_second, 1)
+            self._chat_buckets[chat_key] = bucket
+        return bucket
+
+    def _ticket_wait(self, ticket: _Ticket, now: float) -> float:
+        wait = self.global_bucket.wait_time(now)
+        if ticket.chat_key is not None:
+            chat_bucket = self._chat_bucket(ticket.chat_key)
+            if ticket.limit_chat:
+                wait = max(wait, chat_bucket.wait_time(now))
+            elif chat_bucket.paused_until > now:
+                wait = max(wait, chat_bucket.paused_until - now)
+        return wait
+
+    async def _dispatch_loop(self):
+        while True:
+            timeout = None
+            now = time.monotonic()
+            for ticket in list(self._waiting):
+                if ticket.future.done():
+                    self._waiting.remove(ticket)
+                    continue
+                wait = self._ticket_wait(ticket, now)
+                if wait <= 0:
+                    self.global_bucket.consume(now)
+                    if ticket.chat_key is not None and ticket.limit_chat:
+                        self._chat_bucket(ticket.chat_key).consume(now)
+                    self._waiting.remove(ticket)
+                    self.granted[ticket.priority] += 1
+                    ticket.future.set_result(None)
+                    continue
+                timeout = wait if timeout is None else min(timeout, wait)
+                global_wait = self.global_bucket.wait_time(now)
+                if global_wait > 0:
+                    # Общая корзина пуста - менее приоритетным тоже ждать
+                    timeout = min(timeout, global_wait)
+                    break
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, priority: int, chat_key, limit_chat: bool):
+        ticket = _Ticket(priority, next(self._seq), chat_key, limit_chat)
+        bisect.insort(self._waiting, ticket)
+        self._report_depth()
+        self._wakeup.set()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            ticket.future.cancel()
+            raise
+
+    def _report_depth(self):
+        depth = len(self._waiting)
+        self.max_depth = max(self.max_depth, depth)
+        now = time.monotonic()
+        if depth >= settings.RATE_LIMIT_QUEUE_WARN and now - self._last_depth_warning > 10:
+            self._last_depth_warning = now
+            logger.warning(f"Outbound Bot API queue is deep: {self.queue_depths()}")
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Текущая глубина очереди по классам приоритета"""
+        depths = Counter(PRIORITY_NAMES.get(t.priority, str(t.priority)) for t in self._waiting)
+        return {name: depths.get(name, 0) for name in PRIORITY_NAMES.values()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики ограничителя"""
+        return {
+            'queue': self.queue_depths(),
+            'max_depth': self.max_depth,
+            'granted': {PRIORITY_NAMES.get(p, str(p)): n for p, n in self.granted.items()},
+            'retry_after': self.retry_after_count,
+        }
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ):
+        priority = rate_limit_args if rate_limit_args is not None else ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_NOTIFY)
+        chat_key = data.get('chat_id')
+        with contextlib.suppress(ValueError, TypeError):
+            chat_key = int(chat_key)
+        # Ограничения Telegram на чат относятся к отправке сообщений
+        limit_chat = chat_key is not None and endpoint.startswith(('send', 'copy', 'forward'))
+
+        for attempt in range(self.max_retries + 1):
+            with tracer.span(f'bot.{endpoint}', chat_id=chat_key, attempt=attempt) as span:
+                queued = time.perf_counter()
+                await self._acquire(priority, chat_key, limit_chat)
+                started = time.perf_counter()
+                if span is not None:
+                    span.attrs['queued_ms'] = round((started - queued) * 1000, 3)
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as exc:
+                    BOT_API_ERRORS.inc(endpoint=endpoint, error='RetryAfter')
+                    self.retry_after_count += 1
+                    retry_after = exc.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    pause = float(retry_after) + 0.1
+                    if chat_key is not None:
+                        self._chat_bucket(chat_key).pause(pause)
+                    else:
+                        self.global_bucket.pause(pause)
+                    if attempt == self.max_retries:
+                        logger.error(f"RetryAfter on {endpoint} after {self.max_retries} retries")
+                        raise
+                    if span is not None:
+                        span.attrs['retry_after'] = pause
+                    logger.warning(f"RetryAfter on {endpoint} (chat {chat_key}), pausing {pause:.1f}s")
+                except Exception as exc:
+                    BOT_API_ERRORS.inc(endpoint=endpoint, error=type(exc).__name__)
+                    raise
+                finally:
+                    BOT_API_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        return None
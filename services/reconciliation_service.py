@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List
+from telegram import ChatMember
+from telegram.ext import ContextTypes
+from database.models import User, LogEntry
+from database.repositories import UserRepository, LogRepository
+from services.chat_member_cache import chat_member_cache
+from services.role_service import RoleService
+from services.chat_config import chat_config
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Пользователи, измененные недавно, пропускаются: операция с ролью может быть еще в процессе
+RECONCILE_GRACE = timedelta(minutes=2)
+
+class RosterDiff:
+    """Расхождения между users.role_assigned и списком админов чата"""
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        # В БД роль есть, в Telegram пользователь не админ
+        self.missing_admins: List[User] = []
+        # Админ, назначенный ботом, а в БД роли нет
+        self.stray_admins: List[User] = []
+        # Роль есть, но должность в Telegram не совпадает с ником
+        self.title_mismatch: List[User] = []
+        # Админы, назначенные ботом, которых нет в БД (только отчет)
+        self.unknown_admins: List[ChatMember] = []
+        self.admins_total = 0
+        self.users_total = 0
+
+    @property
+    def has_drift(self) -> bool:
+        return bool(self.missing_admins or self.stray_admins or self.title_mismatch)
+
+    def summary(self) -> str:
+        return (
+            f"chat {self.chat_id}: admins={self.admins_total}, users={self.users_total}, "
+            f"missing_admins={len(self.missing_admins)}, stray_admins={len(self.stray_admins)}, "
+            f"title_mismatch={len(self.title_mismatch)}, unknown_admins={len(self.unknown_admins)}"
+        )
+
+class ReconciliationService:
+    """Сверка ролей в БД со списком администраторов чата.
+
+    Один вызов getChatAdministrators и один запрос к БД на чат; исправления
+    выполняются пакетно, вызовы Bot API - с ограниченной параллельностью.
+    """
+
+    def __init__(self):
+        self.task = None
+
+    @staticmethod
+    async def fetch_roster(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> Dict[int, ChatMember]:
+        """Получение всех администраторов чата одним запросом"""
+        admins = await context.bot.get_chat_administrators(chat_id)
+        for member in admins:
+            chat_member_cache.put(chat_id, member)
+        return {member.user.id: member for member in admins}
+
+    @staticmethod
+    async def diff_chat(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> RosterDiff:
+        """Построение расхождений для одного чата"""
+        roster, users = await asyncio.gather(
+            ReconciliationService.fetch_roster(chat_id, context),
+            UserRepository.get_by_chat_and_role(chat_id, None)
+        )
+        diff = RosterDiff(chat_id)
+        diff.admins_total = len(roster)
+        diff.users_total = len(users)
+        users_by_id = {user.user_id: user for user in users}
+        settled_before = datetime.now() - RECONCILE_GRACE
+
+        for user in users:
+            if user.updated_at and user.updated_at > settled_before:
+                continue
+            member = roster.get(user.user_id)
+            if user.role_assigned and member is None:
+                diff.missing_admins.append(user)
+            elif (user.role_assigned and member is not None and user.nickname
+                  and member.status == ChatMember.ADMINISTRATOR
+                  and member.custom_title != user.nickname[:16]):
+                diff.title_mismatch.append(user)
+            elif (not user.role_assigned and member is not None
+                  and member.status == ChatMember.ADMINISTRATOR and member.can_be_edited):
+                diff.stray_admins.append(user)
+
+        for user_id, member in roster.items():
+            if (user_id not in users_by_id and user_id != context.bot.id
+                    and member.status == ChatMember.ADMINISTRATOR and member.can_be_edited):
+                diff.unknown_admins.append(member)
+        return diff
+
+    @staticmethod
+    async def repair(diff: RosterDiff, context: ContextTypes.DEFAULT_TYPE) -> Dict[str, int]:
+        """Исправление расхождений"""
+        repaired = {'missing_admins': 0, 'stray_admins': 0, 'title_mismatch': 0}
+
+        # Роль в БД без прав в Telegram: снимаем флаг одним запросом,
+        # роль восстановится обычным путем при следующем сообщении
+        if diff.missing_admins:
+            user_ids = [user.user_id for user in diff.missing_admins]
+            if await UserRepository.set_role_assigned_bulk(diff.chat_id, user_ids, False):
+                repaired['missing_admins'] = len(user_ids)
+
+        semaphore = asyncio.Semaphore(settings.RECONCILE_CONCURRENCY)
+
+        async def demote(user: User):
+            async with semaphore:
+                return await RoleService.demote_member(diff.chat_id, user.user_id, context)
+
+        async def retitle(user: User):
+            async with semaphore:
+                return await RoleService._set_custom_title_with_retry(
+                    chat_id=diff.chat_id,
+                    user_id=user.user_id,
+                    nickname=user.nickname,
+                    context=context,
+                    max_retries=1
+                )
+
+        demoted, retitled = await asyncio.gather(
+            asyncio.gather(*(demote(user) for user in diff.stray_admins)),
+            asyncio.gather(*(retitle(user) for user in diff.title_mismatch))
+        )
+        repaired['stray_admins'] = sum(1 for ok in demoted if ok)
+        repaired['title_mismatch'] = sum(1 for ok in retitled if ok)
+
+        if any(repaired.values()):
+            await LogRepository.create(LogEntry(
+                user_id=0,
+                action="roster_reconciled",
+                details=f"chat {diff.chat_id}: {repaired}"
+            ))
+        return repaired
+
+    @staticmethod
+    async def get_chat_ids() -> List[int]:
+        """Чаты для сверки: с назначенными ролями и известные из настроек"""
+        chat_ids = set(await UserRepository.get_chat_ids_with_roles())
+        chat_ids.update(chat_config.chat_ids())
+        return sorted(chat_ids)
+
+    async def reconcile_all(self, context: ContextTypes.DEFAULT_TYPE, repair: bool = True) -> List[RosterDiff]:
+        """Сверка всех чатов"""
+        diffs = []
+        for chat_id in await self.get_chat_ids():
+            try:
+                diff = await self.diff_chat(chat_id, context)
+            except Exception as e:
+                logger.error(f"Failed to reconcile chat {chat_id}: {e}")
+                continue
+            diffs.append(diff)
+            if diff.has_drift:
+                logger.warning(f"Roster drift found: {diff.summary()}")
+                if repair:
+                    repaired = await self.repair(diff, context)
+                    logger.info(f"Roster drift repaired in chat {chat_id}: {repaired}")
+            else:
+                logger.debug(f"No roster drift: {diff.summary()}")
+        return diffs
+
+    async def start(self, context: ContextTypes.DEFAULT_TYPE):
+        """Запуск периодической сверки"""
+        if settings.RECONCILE_INTERVAL_MINUTES <= 0:
+            logger.info("Roster reconciliation disabled")
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._reconcile_loop(context))
+
+    async def _reconcile_loop(self, context: ContextTypes.DEFAULT_TYPE):
+        while True:
+            try:
+                await self.reconcile_all(context)
+                await asyncio.sleep(settings.RECONCILE_INTERVAL_MINUTES * 60)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in reconciliation loop: {e}")
+                await asyncio.sleep(60)
+
+    async def stop(self):
+        """Остановка периодической сверки"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
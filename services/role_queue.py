@@ -0,0 +1,246 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from telegram.ext import ContextTypes
+from services.role_service import RoleService
+from services.circuit_breaker import promote_breaker
+from services.tracing import tracer
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+JobCallback = Callable[[bool], Awaitable[None]]
+
+class RoleJob:
+    """Операция с ролью пользователя"""
+
+    ASSIGN = 'assign'
+    REMOVE = 'remove'
+    RETITLE = 'retitle'
+
+    def __init__(
+        self,
+        kind: str,
+        user_id: int,
+        chat_id: int,
+        context: ContextTypes.DEFAULT_TYPE,
+        nickname: Optional[str] = None,
+        reason: Optional[str] = None
+    ):
+        self.kind = kind
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.context = context
+        self.nickname = nickname
+        self.reason = reason
+        self.callbacks: List[JobCallback] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Трасса обновления, поставившего операцию (время в очереди входит в нее)
+        self.trace = tracer.detach()
+        self.enqueued_at = time.perf_counter()
+
+    @property
+    def key(self) -> tuple:
+        """Ключ для дедупликации одинаковых операций"""
+        return (self.kind, self.chat_id, self.user_id, self.nickname, self.reason)
+
+    async def wait(self) -> bool:
+        """Ожидание результата операции"""
+        return await asyncio.shield(self.future)
+
+class RoleJobQueue:
+    """Фоновая очередь операций с ролями.
+
+    Операции одного пользователя выполняются строго по порядку, разные
+    пользователи обрабатываются параллельно ограниченным числом воркеров.
+    Операция, совпадающая с последней ожидающей операцией пользователя в
+    том же чате, повторно не ставится.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers_count = workers or settings.ROLE_QUEUE_WORKERS
+        self._pending: Dict[int, Deque[RoleJob]] = {}
+        self._scheduled: Set[int] = set()
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        # Наблюдатели за выполненными операциями: listener(job, result)
+        self.listeners: List[Callable[['RoleJob', bool], None]] = []
+        # Восстановление ролей: одна операция на пользователя чата и пауза после неудачи
+        self._restoring: Dict[Tuple[int, int], RoleJob] = {}
+        self._restore_failed_until: Dict[Tuple[int, int], float] = {}
+        self._next_restore_prune = 0.0
+
+    async def start(self):
+        """Запуск воркеров"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"role-worker-{i}")
+            for i in range(self.workers_count)
+        ]
+        logger.info(f"Role job queue started with {self.workers_count} workers")
+
+    def enqueue(self, job: RoleJob, on_done: Optional[JobCallback] = None) -> RoleJob:
+        """Постановка операции в очередь; возвращает уже ожидающую копию, если она есть"""
+        jobs = self._pending.setdefault(job.user_id, deque())
+        # Сравнение только с последней операцией пользователя в этом чате: иначе
+        # [назначить X, снять] + назначить X потеряло бы повторное назначение
+        last = next((queued for queued in reversed(jobs) if queued.chat_id == job.chat_id), None)
+        if last is not None and last.key == job.key:
+            logger.debug(f"Role job {job.kind} for user {job.user_id} deduplicated")
+            job.future.cancel()
+            tracer.release(job.trace)
+            job = last
+        else:
+            jobs.append(job)
+
+        if on_done is not None:
+            job.callbacks.append(on_done)
+
+        if job.user_id not in self._scheduled:
+            self._scheduled.add(job.user_id)
+            self._ready.put_nowait(job.user_id)
+        return job
+
+    def assign(self, user_id: int, chat_id: int, nickname: str, context, on_done: JobCallback = None) -> RoleJob:
+        """Назначение роли в фоне"""
+        return self.enqueue(RoleJob(RoleJob.ASSIGN, user_id, chat_id, context, nickname=nickname), on_done)
+
+    def restore(self, user_id: int, chat_id: int, nickname: str, context, on_done: JobCallback = None) -> Optional[RoleJob]:
+        """Восстановление роли: параллельные вызовы разделяют одну операцию и ее результат.
+
+        После неудачи повторные попытки не ставятся RESTORE_FAILURE_COOLDOWN секунд
+        (возвращается None).
+        """
+        member_key = (chat_id, user_id)
+        job = self._restoring.get(member_key)
+        if job is not None:
+            if on_done is not None:
+                job.callbacks.append(on_done)
+            return job
+
+        # Бот без права назначать админов: восстановление не ставим вовсе
+        if promote_breaker.is_open(chat_id):
+            logger.debug(f"Role restore for user {user_id} skipped: promote circuit open in chat {chat_id}")
+            return None
+
+        now = time.monotonic()
+        if now >= self._next_restore_prune:
+            self._prune_restore_failures(now)
+        failed_until = self._restore_failed_until.get(member_key)
+        if failed_until is not None:
+            if failed_until > now:
+                logger.debug(f"Role restore for user {user_id} skipped: cooldown after failure")
+                return None
+            del self._restore_failed_until[member_key]
+
+        job = self.assign(user_id, chat_id, nickname, context)
+
+        async def restore_done(success: bool):
+            self._restoring.pop(member_key, None)
+            if not success:
+                self._restore_failed_until[member_key] = time.monotonic() + settings.RESTORE_FAILURE_COOLDOWN
+
+        # Первым, чтобы следующий триггер из колбэков уже видел итог
+        job.callbacks.insert(0, restore_done)
+        if on_done is not None:
+            job.callbacks.append(on_done)
+        self._restoring[member_key] = job
+        return job
+
+    def _prune_restore_failures(self, now: float):
+        """Удаление истекших пауз: пользователь после неудачи может больше не появиться"""
+        for key in [key for key, until in self._restore_failed_until.items() if until <= now]:
+            del self._restore_failed_until[key]
+        self._next_restore_prune = now + settings.RESTORE_FAILURE_COOLDOWN
+
+    def remove(self, user_id: int, chat_id: int, reason: str, context, on_done: JobCallback = None) -> RoleJob:
+        """Снятие роли в фоне"""
+        return self.enqueue(RoleJob(RoleJob.REMOVE, user_id, chat_id, context, reason=reason), on_done)
+
+    def retitle(self, user_id: int, chat_id: int, nickname: str, context, on_done: JobCallback = None) -> RoleJob:
+        """Обновление никнейма в фоне"""
+        return self.enqueue(RoleJob(RoleJob.RETITLE, user_id, chat_id, context, nickname=nickname), on_done)
+
+    @property
+    def depth(self) -> int:
+        """Количество ожидающих операций"""
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            try:
+                jobs = self._pending.get(user_id)
+                if jobs:
+                    await self._run_job(jobs.popleft())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in role worker: {e}")
+            finally:
+                # Одна операция за раз, затем пользователь встает в конец очереди
+                if self._pending.get(user_id):
+                    self._ready.put_nowait(user_id)
+                else:
+                    self._pending.pop(user_id, None)
+                    self._scheduled.discard(user_id)
+                self._ready.task_done()
+
+    async def _run_job(self, job: RoleJob):
+        queued_ms = round((time.perf_counter() - job.enqueued_at) * 1000, 3)
+        with tracer.attach(job.trace, f'role_job.{job.kind}', user_id=job.user_id, queued_ms=queued_ms):
+            await self._execute_job(job)
+
+    async def _execute_job(self, job: RoleJob):
+        try:
+            if job.kind == RoleJob.ASSIGN:
+                result = await RoleService.assign_role(job.user_id, job.chat_id, job.nickname, job.context)
+            elif job.kind == RoleJob.REMOVE:
+                result = await RoleService.remove_role(job.user_id, job.chat_id, job.reason, job.context)
+            elif job.kind == RoleJob.RETITLE:
+                result = await RoleService.update_nickname(job.user_id, job.chat_id, job.nickname, job.context)
+            else:
+                raise ValueError(f"Unknown role job kind: {job.kind}")
+        except Exception as e:
+            logger.error(f"Role job {job.kind} for user {job.user_id} failed: {e}")
+            result = False
+
+        if not job.future.done():
+            job.future.set_result(result)
+
+        for listener in self.listeners:
+            try:
+                listener(job, result)
+            except Exception as e:
+                logger.error(f"Error in role job listener: {e}")
+
+        for callback in job.callbacks:
+            try:
+                await callback(result)
+            except Exception as e:
+                logger.error(f"Error in role job callback: {e}")
+
+    async def join(self):
+        """Ожидание обработки всех операций"""
+        await self._ready.join()
+
+    async def stop(self):
+        """Остановка воркеров"""
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        for jobs in self._pending.values():
+            for job in jobs:
+                if not job.future.done():
+                    job.future.cancel()
+                tracer.release(job.trace)
+        if self.depth:
+            logger.warning(f"Role job queue stopped with {self.depth} pending jobs")
@@ -1,41 +1,48 @@
+import time
 import logging
 import asyncio
 from datetime import datetime
+from typing import Optional
 from telegram import ChatPermissions
 from telegram.ext import ContextTypes
 from database.repositories import UserRepository, RoleHistoryRepository, LogRepository
 from database.models import RoleHistory, LogEntry
+from services.chat_member_cache import chat_member_cache, is_admin_member, ADMIN_STATUSES
+from services.member_waiters import member_waiters
+from services.deletion_scheduler import deletion_scheduler
+from services.circuit_breaker import promote_breaker
+from services.tracing import tracer
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-async def delete_message_after_delay(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, delay: int = 5):
-    """Удаление сообщения через указанное время"""
-    await asyncio.sleep(delay)
-    try:
-        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-    except Exception as e:
-        logger.error(f"Failed to delete message: {e}")
-
 class RoleService:
     @staticmethod
-    async def is_user_admin(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    @tracer.traced('role.is_user_admin')
+    async def is_user_admin(
+        chat_id: int,
+        user_id: int,
+        context: ContextTypes.DEFAULT_TYPE,
+        use_cache: bool = True
+    ) -> bool:
         """Проверка, является ли пользователь администратором чата"""
         try:
-            chat_member = await context.bot.get_chat_member(chat_id, user_id)
-            return chat_member.status in ['administrator', 'creator']
+            chat_member = await chat_member_cache.get_member(context.bot, chat_id, user_id, use_cache=use_cache)
+            return chat_member.status in ADMIN_STATUSES
         except Exception as e:
             logger.error(f"Failed to check admin status for user {user_id}: {e}")
             return False
 
     @staticmethod
-    async def _ensure_bot_is_admin(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Проверка, является ли бот администратором с нужными правами"""
+    @tracer.traced('role.ensure_bot_is_admin')
+    async def _ensure_bot_is_admin(chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> Optional[bool]:
+        """Проверка, является ли бот администратором с нужными правами.
+        None - проверить не удалось (временная ошибка API)"""
         try:
-            bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
+            bot_member = await chat_member_cache.get_bot_member(context.bot, chat_id)
             
             # Проверяем, что бот - администратор
-            if bot_member.status not in ['administrator', 'creator']:
+            if bot_member.status not in ADMIN_STATUSES:
                 logger.error(f"Bot is not an admin in chat {chat_id}, status: {bot_member.status}")
                 return False
             
@@ -45,13 +52,14 @@ class RoleService:
                 logger.error(f"Bot member details: status={bot_member.status}, can_promote_members={bot_member.can_promote_members}")
                 return False
             
-            logger.info(f"Bot has permission to promote members in chat {chat_id}")
+            logger.debug(f"Bot has permission to promote members in chat {chat_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to check bot admin status: {e}")
-            return False
+            return None
 
     @staticmethod
+    @tracer.traced('role.set_custom_title_with_retry')
     async def _set_custom_title_with_retry(
         chat_id: int,
         user_id: int,
@@ -75,29 +83,29 @@ class RoleService:
                 if "User is not an administrator" in error_str:
                     logger.warning(f"User {user_id} is not an admin yet, waiting... (attempt {attempt + 1}/{max_retries})")
                     if attempt < max_retries - 1:
-                        # Увеличиваем задержку с каждой попыткой
-                        wait_time = delay * (attempt + 1)
-                        await asyncio.sleep(wait_time)
-                        # Проверяем статус перед следующей попыткой
-                        is_admin = await RoleService.is_user_admin(chat_id, user_id, context)
-                        if is_admin:
+                        # Ждем событие о назначении админом (не дольше delay × attempt)
+                        waiter = member_waiters.register(chat_id, user_id, is_admin_member)
+                        with tracer.span('role.wait_admin', attempt=attempt + 1):
+                            member = await member_waiters.wait(waiter, context.bot, timeout=delay * (attempt + 1))
+                        if member is not None:
                             logger.info(f"User {user_id} is now admin, retrying title setting")
-                            continue
                         else:
                             logger.debug(f"User {user_id} still not admin, will wait more")
-                            continue
+                        continue
                 elif "CHAT_ADMIN_REQUIRED" in error_str or "not enough rights" in error_str.lower():
                     logger.error(f"Bot doesn't have permission to set custom title: {e}")
                     return False
                 else:
                     logger.warning(f"Failed to set custom title for user {user_id} (attempt {attempt + 1}/{max_retries}): {e}")
                     if attempt < max_retries - 1:
-                        await asyncio.sleep(delay)
+                        with tracer.span('role.retry_sleep', attempt=attempt + 1):
+                            await asyncio.sleep(delay)
                         continue
                     return False
         return False
 
     @staticmethod
+    @tracer.traced('role.assign_role')
     async def assign_role(
         user_id: int,
         chat_id: int,
@@ -107,39 +115,43 @@ class RoleService:
         """Назначение роли пользователю"""
         try:
             # Получаем пользователя
-            user = await UserRepository.get_by_id(user_id)
+            user = await UserRepository.get_by_id(user_id, chat_id)
             if not user:
                 logger.error(f"User {user_id} not found in database")
                 return False
             
-            # Проверяем, является ли бот администратором с нужными правами
-            bot_is_admin = await RoleService._ensure_bot_is_admin(chat_id, context)
+            # Проверяем, является ли бот администратором с нужными правами.
+            # Пока предохранитель чата разомкнут, права бота не перепроверяем
+            if promote_breaker.allow(chat_id):
+                bot_is_admin = await RoleService._ensure_bot_is_admin(chat_id, context)
+                if bot_is_admin is None:
+                    # Временная ошибка ничего не говорит о правах бота: предохранитель
+                    # не размыкается, операция завершается неудачей и повторяется позже
+                    promote_breaker.release(chat_id)
+                    logger.warning(f"Could not check bot rights in chat {chat_id}, role for user {user_id} not assigned")
+                    return False
+                if bot_is_admin:
+                    promote_breaker.record_success(chat_id)
+                else:
+                    promote_breaker.record_failure(chat_id)
+            else:
+                logger.debug(f"Promote circuit is open for chat {chat_id}, skipping bot rights check")
+                bot_is_admin = False
+            
             if not bot_is_admin:
                 logger.warning(f"Bot can't promote members in chat {chat_id}, only saving nickname in DB")
-                # Сохраняем только никнейм в БД без назначения прав
-                user.nickname = nickname
-                user.role_assigned = False  # Не назначаем права
-                user.updated_at = datetime.now()
-                await UserRepository.create_or_update(user)
+                # Сохраняем только никнейм в БД без назначения прав (если есть что сохранять)
+                if user.nickname != nickname or user.role_assigned:
+                    # Не назначаем права
+                    await UserRepository.update_role(user_id, chat_id, nickname=nickname, role_assigned=False)
                 return False  # Возвращаем False, чтобы показать ошибку
             
-            # Получаем информацию о чате для проверки типа
-            try:
-                chat = await context.bot.get_chat(chat_id)
-                logger.info(f"Chat type: {chat.type}, title: {chat.title}")
-            except Exception as e:
-                logger.warning(f"Could not get chat info: {e}")
-            
             # Проверяем, является ли пользователь уже администратором
             is_admin = await RoleService.is_user_admin(chat_id, user_id, context)
             
             if not is_admin:
                 # Назначаем пользователя администратором с ограниченными правами
                 try:
-                    # Проверяем права бота перед промоутом
-                    bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
-                    logger.info(f"Bot permissions: can_promote_members={bot_member.can_promote_members}")
-                    
                     # Минимальные права администратора согласно требованиям:
                     # ВАЖНО: Для супергрупп Telegram API требует хотя бы одно право True для успешного промоута
                     # can_post_messages работает только для каналов, не для супергрупп
@@ -166,54 +178,46 @@ class RoleService:
                     }
                     
                     logger.info(f"Promoting user {user_id} with params: {promote_params}")
-                    result = await context.bot.promote_chat_member(**promote_params)
+                    # Ожидание регистрируется до промоута, чтобы не пропустить событие chat_member
+                    waiter = member_waiters.register(chat_id, user_id, is_admin_member)
+                    try:
+                        result = await context.bot.promote_chat_member(**promote_params)
+                    except Exception:
+                        member_waiters.discard(waiter)
+                        raise
+                    chat_member_cache.invalidate(chat_id, user_id)
                     
                     logger.info(f"Promote result: {result}, user {user_id} promoted to admin with limited rights")
                     
-                    # Проверяем статус пользователя сразу после промоута
-                    await asyncio.sleep(0.5)
-                    chat_member_after = await context.bot.get_chat_member(chat_id, user_id)
-                    logger.info(f"User {user_id} status after promotion: {chat_member_after.status}")
+                    # Telegram может применять промоут с задержкой: ждем событие chat_member,
+                    # при его отсутствии опрашиваем статус с растущей паузой
+                    started = time.monotonic()
+                    with tracer.span('role.confirm_promotion'):
+                        confirmed_member = await member_waiters.wait(
+                            waiter, context.bot, timeout=settings.PROMOTION_CONFIRM_TIMEOUT
+                        )
+                    is_admin = confirmed_member is not None
                     
-                    # Ждем и проверяем статус несколько раз с задержками
-                    # Telegram API может обновлять статус с задержкой
-                    is_admin = False
-                    for attempt in range(8):  # Увеличиваем до 8 попыток
-                        await asyncio.sleep(1.0)  # Ждем 1 секунду между попытками
-                        chat_member_check = await context.bot.get_chat_member(chat_id, user_id)
-                        is_admin = chat_member_check.status in ['administrator', 'creator']
-                        
-                        if is_admin:
-                            logger.info(f"User {user_id} confirmed as admin after {attempt + 1} attempts, status: {chat_member_check.status}")
-                            # Логируем права нового админа
-                            if hasattr(chat_member_check, 'can_post_messages'):
-                                logger.info(f"Admin permissions: can_post_messages={getattr(chat_member_check, 'can_post_messages', None)}")
-                            break
-                        else:
-                            logger.debug(f"User {user_id} not yet admin, attempt {attempt + 1}/8, current status: {chat_member_check.status}")
-                    
-                    if not is_admin:
-                        logger.error(f"User {user_id} promotion API returned success but user is still not admin after 8 attempts!")
-                        logger.error(f"Final status: {chat_member_check.status if 'chat_member_check' in locals() else 'unknown'}")
-                        # Пробуем еще раз проверить через get_chat_member
-                        final_check = await context.bot.get_chat_member(chat_id, user_id)
-                        logger.error(f"Final check status: {final_check.status}, type: {type(final_check)}")
+                    if is_admin:
+                        logger.info(f"User {user_id} confirmed as admin in {time.monotonic() - started:.2f}s, status: {confirmed_member.status}")
+                    else:
+                        logger.error(f"User {user_id} promotion API returned success but user is still not admin after {settings.PROMOTION_CONFIRM_TIMEOUT}s!")
+                        # Последний известный статус (из кэша, без лишнего запроса)
+                        final_check = await chat_member_cache.get_member(context.bot, chat_id, user_id)
+                        logger.error(f"Final check status: {final_check.status}")
                     
                 except Exception as promote_error:
                     logger.error(f"Failed to promote user {user_id}: {promote_error}")
+                    error_str = str(promote_error)
+                    if "CHAT_ADMIN_REQUIRED" in error_str or "not enough rights" in error_str.lower():
+                        promote_breaker.record_failure(chat_id)
                     
                     # Если не удалось назначить администратором, сохраняем только никнейм
-                    user.nickname = nickname
-                    user.role_assigned = False
-                    user.updated_at = datetime.now()
-                    await UserRepository.create_or_update(user)
+                    await UserRepository.update_role(user_id, chat_id, nickname=nickname, role_assigned=False)
                     return True
             
-            # Обновляем пользователя
-            user.role_assigned = True
-            user.nickname = nickname
-            user.updated_at = datetime.now()
-            await UserRepository.create_or_update(user)
+            # Обновляем пользователя (строка могла измениться за время промоута)
+            await UserRepository.update_role(user_id, chat_id, nickname=nickname, role_assigned=True)
             
             # Пытаемся установить кастомный заголовок с повторными попытками
             # Пробуем даже если проверка статуса не прошла, так как промоут был успешным
@@ -244,6 +248,7 @@ class RoleService:
             # Сохраняем в историю
             await RoleHistoryRepository.create(RoleHistory(
                 user_id=user_id,
+                chat_id=chat_id,
                 role_name=nickname,
                 assigned_at=datetime.now()
             ))
@@ -260,6 +265,33 @@ class RoleService:
             return False
     
     @staticmethod
+    @tracer.traced('role.demote_member')
+    async def demote_member(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Снятие прав администратора в Telegram (без изменений в БД)"""
+        try:
+            await context.bot.promote_chat_member(
+                chat_id=chat_id,
+                user_id=user_id,
+                can_post_messages=False,
+                can_edit_messages=False,
+                can_delete_messages=False,
+                can_restrict_members=False,
+                can_promote_members=False,
+                can_change_info=False,
+                can_pin_messages=False,
+                can_manage_chat=False,
+                can_manage_video_chats=False,
+                can_invite_users=False
+            )
+            chat_member_cache.invalidate(chat_id, user_id)
+            logger.info(f"Successfully demoted user {user_id} in chat {chat_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to demote user {user_id}: {e}")
+            return False
+    
+    @staticmethod
+    @tracer.traced('role.remove_role')
     async def remove_role(
         user_id: int,
         chat_id: int,
@@ -269,7 +301,7 @@ class RoleService:
         """Снятие роли с пользователя"""
         try:
             # Получаем пользователя
-            user = await UserRepository.get_by_id(user_id)
+            user = await UserRepository.get_by_id(user_id, chat_id)
             if not user:
                 logger.warning(f"User {user_id} not found when trying to remove role")
                 return False
@@ -280,38 +312,18 @@ class RoleService:
             
             # Проверяем, является ли пользователь администратором, прежде чем снимать права
             if context and await RoleService.is_user_admin(chat_id, user_id, context):
-                try:
-                    # Снимаем права администратора
-                    await context.bot.promote_chat_member(
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        can_post_messages=False,
-                        can_edit_messages=False,
-                        can_delete_messages=False,
-                        can_restrict_members=False,
-                        can_promote_members=False,
-                        can_change_info=False,
-                        can_pin_messages=False,
-                        can_manage_chat=False,
-                        can_manage_video_chats=False,
-                        can_invite_users=False
-                    )
-                    logger.info(f"Successfully demoted user {user_id} in chat {chat_id}")
-                except Exception as e:
-                    logger.error(f"Failed to demote user {user_id}: {e}")
-                    # Продолжаем, даже если не удалось снять права
+                # Продолжаем, даже если не удалось снять права
+                await RoleService.demote_member(chat_id, user_id, context)
             else:
                 logger.info(f"User {user_id} is not an admin or no context provided, skipping demotion")
             
             # Обновляем пользователя
-            user.role_assigned = False
-            user.updated_at = datetime.now()
-            await UserRepository.create_or_update(user)
+            await UserRepository.update_role(user_id, chat_id, role_assigned=False)
             
             # Обновляем историю ролей
             try:
                 # Находим последнюю активную роль пользователя
-                role_history_list = await RoleHistoryRepository.get_by_user_id(user_id)
+                role_history_list = await RoleHistoryRepository.get_by_user_id(user_id, chat_id)
                 for role_history in role_history_list:
                     if not role_history.removed_at:
                         role_history.removed_at = datetime.now()
@@ -339,6 +351,7 @@ class RoleService:
             return False
     
     @staticmethod
+    @tracer.traced('role.update_nickname')
     async def update_nickname(
         user_id: int,
         chat_id: int,
@@ -348,7 +361,7 @@ class RoleService:
         """Обновление никнейма пользователя"""
         try:
             # Получаем пользователя
-            user = await UserRepository.get_by_id(user_id)
+            user = await UserRepository.get_by_id(user_id, chat_id)
             if not user:
                 logger.error(f"User {user_id} not found when updating nickname")
                 return False
@@ -356,9 +369,7 @@ class RoleService:
             old_nickname = user.nickname or "Без роли"
             
             # Обновляем никнейм в базе данных
-            user.nickname = new_nickname
-            user.updated_at = datetime.now()
-            await UserRepository.create_or_update(user)
+            await UserRepository.update_role(user_id, chat_id, nickname=new_nickname)
             
             # Пытаемся обновить кастомный заголовок с повторными попытками
             if await RoleService.is_user_admin(chat_id, user_id, context):
@@ -391,7 +402,7 @@ class RoleService:
                     text=f"✏️ Никнейм изменен с '{old_nickname}' на '{new_nickname}'"
                 )
                 # Удаляем через 5 секунд
-                asyncio.create_task(delete_message_after_delay(context, chat_id, msg.message_id))
+                deletion_scheduler.schedule(chat_id, msg.message_id)
             except Exception as e:
                 logger.error(f"Failed to send nickname update message: {e}")
             
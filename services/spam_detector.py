@@ -0,0 +1,184 @@
+import re
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from services.metrics import metrics
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SPAM_CHECK_SECONDS = metrics.histogram(
+    'spam_check_duration_seconds', 'Near-duplicate lookup time per message',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+SPAM_DETECTED = metrics.counter(
+    'spam_near_duplicates_total', 'Messages classified as near-duplicate spam'
+)
+
+SHINGLE = 3
+# Сигнатура: минимум хэшей триграмм в каждой из BINS корзин (one permutation hashing)
+BINS = 32
+BIN_BITS = 5
+# LSH: полоса из ROWS соседних корзин; совпадение любой полосы дает кандидата
+ROWS = 2
+EMPTY = (1 << 64) - 1
+# Сигнатура считается по началу сообщения; хвост рейдовых сообщений редко отличается
+MAX_TEXT_LENGTH = 1000
+NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize(text: str) -> str:
+    """Нижний регистр, без пунктуации и эмодзи, пробелы схлопнуты"""
+    return NON_WORD_RE.sub(' ', text[:MAX_TEXT_LENGTH].lower()).strip()
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash-сигнатура символьных триграмм за один проход.
+
+    Вместо BINS независимых хэш-функций (BINS проходов по тексту) один хэш
+    триграммы делится на номер корзины и значение; в корзине хранится
+    минимум. Пустые корзины заполняются из следующей непустой, чтобы
+    короткие тексты сравнивались корректно. Доля совпавших корзин двух
+    сигнатур оценивает коэффициент Жаккара множеств триграмм.
+    """
+    mins = [EMPTY] * BINS
+    for i in range(max(1, len(text) - SHINGLE + 1)):
+        h = hash(text[i:i + SHINGLE]) & EMPTY
+        b = h & (BINS - 1)
+        value = h >> BIN_BITS
+        if value < mins[b]:
+            mins[b] = value
+    for i in range(BINS):
+        if mins[i] == EMPTY:
+            for offset in range(1, BINS):
+                donor = mins[(i + offset) % BINS]
+                if donor != EMPTY:
+                    # Смещение различает заимствованные значения разных корзин
+                    mins[i] = donor + offset
+                    break
+    return tuple(mins)
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Оценка коэффициента Жаккара по двум сигнатурам"""
+    return sum(x == y for x, y in zip(a, b)) / BINS
+
+class _Entry:
+    __slots__ = ('signature', 'user_id', 'message_id', 'seen_at', 'deleted')
+
+    def __init__(self, signature: Tuple[int, ...], user_id: int, message_id: int, seen_at: float):
+        self.signature = signature
+        self.user_id = user_id
+        self.message_id = message_id
+        self.seen_at = seen_at
+        self.deleted = False
+
+class _ChatIndex:
+    """Недавние сигнатуры одного чата: очередь по времени и LSH-корзины по полосам битов"""
+
+    def __init__(self):
+        self.entries: Deque[_Entry] = deque()
+        self.buckets: Dict[tuple, Deque[_Entry]] = {}
+
+class SpamDetector:
+    """Поиск почти одинаковых сообщений от разных аккаунтов (рейды).
+
+    Сигнатура сообщения (MinHash) делится на полосы по ROWS значений, и
+    сообщение попадает в корзину индекса по каждой полосе. Похожие тексты
+    почти наверняка совпадают хотя бы в одной полосе, случайные - почти
+    никогда, поэтому с новым сообщением сравниваются только сообщения из
+    тех же корзин, а не вся история чата. Кандидаты проверяются оценкой
+    сходства (similarity). Индекс каждого чата ограничен окном window
+    секунд и index_size записями.
+
+    Сообщение считается спамом, если за окно похожие сообщения прислали
+    не меньше min_accounts разных пользователей (считая автора).
+    """
+
+    def __init__(
+        self,
+        min_accounts: int = None,
+        min_similarity: float = None,
+        window: float = None,
+        min_length: int = None,
+        index_size: int = None
+    ):
+        self.min_accounts = settings.SPAM_MIN_ACCOUNTS if min_accounts is None else min_accounts
+        self.min_similarity = settings.SPAM_SIMILARITY if min_similarity is None else min_similarity
+        self.window = window or settings.SPAM_WINDOW
+        self.min_length = settings.SPAM_MIN_LENGTH if min_length is None else min_length
+        self.index_size = index_size or settings.SPAM_INDEX_SIZE
+        self._chats: Dict[int, _ChatIndex] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_accounts > 1
+
+    @staticmethod
+    def _band_keys(signature: Tuple[int, ...]) -> List[tuple]:
+        return [(start,) + signature[start:start + ROWS] for start in range(0, BINS, ROWS)]
+
+    def check(self, chat_id: int, user_id: int, message_id: int, text: str, now: Optional[float] = None) -> Optional[List[int]]:
+        """Учет сообщения. None - не спам; иначе id ранее отправленных похожих
+        сообщений, которые тоже нужно удалить (текущее не включается)"""
+        if not self.enabled or not text:
+            return None
+        normalized = normalize(text)
+        if len(normalized) < self.min_length:
+            return None
+        with SPAM_CHECK_SECONDS.time():
+            return self._check(chat_id, user_id, message_id, minhash(normalized), now)
+
+    def _check(self, chat_id: int, user_id: int, message_id: int, signature: Tuple[int, ...], now: Optional[float]) -> Optional[List[int]]:
+        now = time.monotonic() if now is None else now
+        index = self._chats.get(chat_id)
+        if index is None:
+            index = self._chats[chat_id] = _ChatIndex()
+        self._expire(index, now - self.window)
+
+        band_keys = self._band_keys(signature)
+        matches: Dict[int, _Entry] = {}
+        checked = set()
+        for key in band_keys:
+            for entry in index.buckets.get(key, ()):
+                if id(entry) in checked:
+                    continue
+                checked.add(id(entry))
+                if similarity(entry.signature, signature) >= self.min_similarity:
+                    matches[id(entry)] = entry
+
+        entry = _Entry(signature, user_id, message_id, now)
+        index.entries.append(entry)
+        for key in band_keys:
+            index.buckets.setdefault(key, deque()).append(entry)
+        if len(index.entries) > self.index_size:
+            self._evict(index, index.entries.popleft())
+
+        accounts = {match.user_id for match in matches.values()} | {user_id}
+        if len(accounts) < self.min_accounts:
+            return None
+
+        SPAM_DETECTED.inc()
+        # Удаленные сообщения остаются в индексе: по ним узнаются следующие аккаунты рейда
+        earlier = [match.message_id for match in matches.values() if not match.deleted]
+        for match in matches.values():
+            match.deleted = True
+        entry.deleted = True
+        logger.info(
+            "Near-duplicate spam in chat %s from %s accounts (%s earlier messages to delete)",
+            chat_id, len(accounts), len(earlier)
+        )
+        return earlier
+
+    def _expire(self, index: _ChatIndex, older_than: float):
+        while index.entries and index.entries[0].seen_at < older_than:
+            self._evict(index, index.entries.popleft())
+
+    def _evict(self, index: _ChatIndex, entry: _Entry):
+        # Записи попадают в корзины по порядку, поэтому вытесняемая всегда первая
+        for key in self._band_keys(entry.signature):
+            bucket = index.buckets.get(key)
+            if bucket and bucket[0] is entry:
+                bucket.popleft()
+                if not bucket:
+                    del index.buckets[key]
+
+spam_detector = SpamDetector()
@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+StartupFunc = Callable[[], Awaitable[object]]
+
+STARTUP_SECONDS = metrics.histogram(
+    'startup_step_duration_seconds', 'Startup step time', ('phase', 'step'),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+class StartupStep:
+    """Шаг запуска и его замеры (смещения от начала фазы, секунды)"""
+
+    def __init__(self, name: str, func: StartupFunc, deps: Tuple[str, ...]):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.skipped = False
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+class StartupGraph:
+    """Фаза запуска: шаги с зависимостями, независимые шаги идут параллельно.
+
+    Шаг начинается, как только завершены все его зависимости. В обязательной
+    фазе ошибка шага прерывает запуск; в фоновой (background=True) ошибка
+    логируется, а зависящие от шага шаги пропускаются. По завершении фазы в
+    лог пишется разбивка по шагам.
+    """
+
+    def __init__(self, phase: str, background: bool = False):
+        self.phase = phase
+        self.background = background
+        self.steps: Dict[str, StartupStep] = {}
+        self.elapsed = 0.0
+
+    def add(self, name: str, func: StartupFunc, *deps: str) -> 'StartupGraph':
+        """Добавление шага; зависимости должны быть добавлены раньше (циклы невозможны)"""
+        if name in self.steps:
+            raise ValueError(f"Startup step '{name}' is already defined")
+        unknown = [dep for dep in deps if dep not in self.steps]
+        if unknown:
+            raise ValueError(f"Startup step '{name}' depends on unknown steps: {unknown}")
+        self.steps[name] = StartupStep(name, func, deps)
+        return self
+
+    async def run(self):
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_step(step: StartupStep):
+            if step.deps:
+                await asyncio.gather(*(tasks[dep] for dep in step.deps))
+                failed = [dep for dep in step.deps if self.steps[dep].error or self.steps[dep].skipped]
+                if failed:
+                    step.skipped = True
+                    logger.warning(f"Startup step '{step.name}' skipped: {', '.join(failed)} failed")
+                    return
+            step.started = time.perf_counter() - started
+            try:
+                await step.func()
+            except Exception as e:
+                step.error = e
+                if not self.background:
+                    raise
+                logger.error(f"Startup step '{step.name}' failed: {e}")
+            finally:
+                step.finished = time.perf_counter() - started
+                STARTUP_SECONDS.observe(step.duration, phase=self.phase, step=step.name)
+
+        for step in self.steps.values():
+            tasks[step.name] = asyncio.create_task(run_step(step), name=f"startup-{step.name}")
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            self.elapsed = time.perf_counter() - started
+            self.log_timings()
+
+    def log_timings(self):
+        lines = [f"Startup phase '{self.phase}' took {self.elapsed * 1000:.0f} ms:"]
+        for step in sorted(self.steps.values(), key=lambda s: (s.started is None, s.started or 0)):
+            if step.started is None:
+                status = 'skipped' if step.skipped else 'not started'
+                lines.append(f"  {step.name:22} {status}")
+                continue
+            if step.finished is None:
+                lines.append(f"  {step.name:22} cancelled (+{step.started * 1000:.0f} ms)")
+                continue
+            status = f" FAILED: {step.error}" if step.error else ''
+            lines.append(
+                f"  {step.name:22} {step.duration * 1000:8.0f} ms  "
+                f"(+{step.started * 1000:.0f} ms){status}"
+            )
+        lines.append(f"  critical path: {' -> '.join(self.critical_path()) or '-'}")
+        logger.info('\n'.join(lines))
+
+    def critical_path(self) -> List[str]:
+        """Цепочка шагов, определившая длительность фазы"""
+        path = []
+        step = max(self.steps.values(), key=lambda s: s.finished or 0, default=None)
+        while step is not None and step.finished is not None:
+            path.append(step.name)
+            deps = [self.steps[dep] for dep in step.deps]
+            step = max(deps, key=lambda s: s.finished or 0, default=None)
+        return list(reversed(path))
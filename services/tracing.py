@@ -0,0 +1,217 @@
+import json
+import time
+import random
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """Участок трассировки: имя, время, атрибуты и вложенные участки"""
+
+    __slots__ = ('name', 'attrs', 'start', 'end', 'error', 'children')
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.children: List['Span'] = []
+
+    def finished_at(self) -> float:
+        """Конец участка с учетом вложенных (фоновые операции могут закончиться позже)"""
+        end = self.end if self.end is not None else self.start
+        for child in self.children:
+            end = max(end, child.finished_at())
+        return end
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(((self.end or self.start) - self.start) * 1000, 3),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.error:
+            data['error'] = self.error
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+    def format_tree(self, origin: float, depth: int = 0) -> List[str]:
+        duration = ((self.end or self.start) - self.start) * 1000
+        offset = (self.start - origin) * 1000
+        attrs = ' '.join(f"{key}={value}" for key, value in self.attrs.items())
+        error = f" ERROR {self.error}" if self.error else ''
+        lines = [f"{'  ' * depth}{self.name} +{offset:.1f}ms {duration:.1f}ms {attrs}{error}".rstrip()]
+        for child in self.children:
+            lines.extend(child.format_tree(origin, depth + 1))
+        return lines
+
+class Trace:
+    """Дерево участков одного обновления.
+
+    Завершается, когда закрыт корневой участок и все отложенные операции
+    (например, задания очереди ролей), привязанные к трассе через detach().
+    """
+
+    __slots__ = ('trace_id', 'root', 'pending')
+
+    def __init__(self, root: Span):
+        self.trace_id = f"{random.getrandbits(64):016x}"
+        self.root = root
+        self.pending = 1
+
+# Текущая трасса и участок задачи asyncio
+_current: contextvars.ContextVar[Optional[Tuple[Trace, Span]]] = contextvars.ContextVar('trace_span', default=None)
+
+TraceHandle = Tuple[Trace, Span]
+
+class Tracer:
+    """Трассировка обновлений через contextvars.
+
+    Корневой участок создается на каждое обновление, вложенные участки
+    (запросы к БД, Bot API, шаги RoleService) привязываются к текущему
+    автоматически. Выборка трасс пишется в JSON-lines файл, медленные
+    обновления пишутся всегда и выводятся деревом в лог.
+    """
+
+    def __init__(self, path: str = None, sample_rate: float = None, slow_threshold: float = None):
+        self.path = settings.TRACE_FILE if path is None else path
+        self.sample_rate = settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.slow_threshold = settings.TRACE_SLOW_THRESHOLD if slow_threshold is None else slow_threshold
+        self._file: Optional[TextIO] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) or self.slow_threshold > 0
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Корневой участок трассы"""
+        if not self.enabled:
+            yield None
+            return
+        root = Span(name, attrs)
+        trace = Trace(root)
+        token = _current.set((trace, root))
+        try:
+            yield root
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current.reset(token)
+            self._release(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Вложенный участок; вне трассы ничего не делает"""
+        current = _current.get()
+        if current is None:
+            yield None
+            return
+        trace, parent = current
+        span = Span(name, attrs)
+        parent.children.append(span)
+        token = _current.set((trace, span))
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current.reset(token)
+
+    def traced(self, name: str = None):
+        """Декоратор корутины: выполнение в отдельном участке"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        """Идентификатор текущей трассы (для связи логов с трассами)"""
+        current = _current.get()
+        return current[0].trace_id if current is not None else None
+
+    def detach(self) -> Optional[TraceHandle]:
+        """Привязка отложенной операции к текущей трассе (трасса ждет release)"""
+        current = _current.get()
+        if current is not None:
+            current[0].pending += 1
+        return current
+
+    @contextmanager
+    def attach(self, handle: Optional[TraceHandle], name: str, **attrs):
+        """Выполнение отложенной операции внутри трассы, из которой она создана"""
+        if handle is None:
+            yield None
+            return
+        token = _current.set(handle)
+        try:
+            with self.span(name, **attrs) as span:
+                yield span
+        finally:
+            _current.reset(token)
+            self.release(handle)
+
+    def release(self, handle: Optional[TraceHandle]):
+        """Отказ от отложенной операции без выполнения"""
+        if handle is not None:
+            self._release(handle[0])
+
+    def _release(self, trace: Trace):
+        trace.pending -= 1
+        if trace.pending == 0:
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        root = trace.root
+        duration = root.finished_at() - root.start
+        slow = self.slow_threshold > 0 and duration >= self.slow_threshold
+        if not slow and (not self.path or random.random() >= self.sample_rate):
+            return
+
+        if slow:
+            tree = '\n'.join(root.format_tree(root.start))
+            logger.warning(f"Slow {root.name} ({duration:.2f}s, trace {trace.trace_id}):\n{tree}")
+        if self.path:
+            self._write({
+                'trace_id': trace.trace_id,
+                'timestamp': time.time() - (time.perf_counter() - root.start),
+                'duration_ms': round(duration * 1000, 3),
+                'slow': slow,
+                'root': root.to_dict(root.start),
+            })
+
+    def _write(self, record: Dict[str, Any]):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+        except Exception as e:
+            logger.error(f"Failed to write trace: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+tracer = Tracer()
@@ -0,0 +1,179 @@
+import re
+import gzip
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+from services.chat_partitioner import chat_partitioner
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Числовые идентификаторы пользователей и чатов
+ID_KEYS = {'id', 'user_id', 'chat_id', 'sender_chat_id'}
+# Персональные строки заменяются псевдонимами целиком
+NAME_KEYS = {'username', 'first_name', 'last_name', 'title', 'phone_number', 'bio', 'invite_link', 'email'}
+# Текст сохраняет длину, слова-команды и слова из списка (например, матные)
+TEXT_KEYS = {'text', 'caption', 'query', 'data'}
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+LATIN = 'abcdefghijklmnopqrstuvwxyz'
+CYRILLIC = 'абвгдежзийклмнопрстуфхцчшщъыьэюя'
+
+class Anonymizer:
+    """Детерминированное обезличивание обновлений ключом (HMAC).
+
+    Один и тот же пользователь или чат получает один и тот же псевдоним, так
+    что последовательность действий пользователя при воспроизведении
+    сохраняется. Длина текста (в том числе в UTF-16) не меняется, поэтому
+    смещения entities остаются верными.
+    """
+
+    def __init__(self, key: str, keep_word: Callable[[str], bool] = None):
+        self.key = key.encode()
+        # Слова, которые нужно сохранить (например, матные - иначе фильтр при воспроизведении их не увидит)
+        self.keep_word = keep_word or (lambda word: False)
+
+    def _digest(self, value: str) -> int:
+        return int.from_bytes(hmac.new(self.key, value.encode(), hashlib.sha256).digest()[:8], 'big')
+
+    def pseudo_id(self, value: int) -> int:
+        """Псевдоним идентификатора того же вида (пользователь, группа, супергруппа)"""
+        digest = self._digest(f"id:{value}")
+        if value <= -1000000000000:
+            return -(1000000000000 + digest % 1000000000000)
+        if value < 0:
+            return -(1 + digest % 999999999)
+        return 1 + digest % 9999999999
+
+    def _pseudo_word(self, word: str) -> str:
+        digest = self._digest(f"word:{word.lower()}")
+        chars = []
+        for i, char in enumerate(word):
+            bits = (digest >> (i % 56)) & 0xFF
+            if char.isdigit():
+                replacement = str(bits % 10)
+            elif char.lower() in CYRILLIC:
+                replacement = CYRILLIC[bits % len(CYRILLIC)]
+            elif char.isalpha() and ord(char) < 0x10000:
+                replacement = LATIN[bits % len(LATIN)]
+            else:
+                replacement = char
+            chars.append(replacement.upper() if char.isupper() else replacement)
+        return ''.join(chars)
+
+    def text(self, value: str) -> str:
+        def replace(match: re.Match) -> str:
+            word = match.group(0)
+            start = match.start()
+            # Команды бота (/cn) и слова из списка оставляем как есть
+            if start > 0 and value[start - 1] == '/' or self.keep_word(word.lower()):
+                return word
+            return self._pseudo_word(word)
+
+        return WORD_RE.sub(replace, value)
+
+    def anonymize(self, data: Any, key: str = None) -> Any:
+        if isinstance(data, dict):
+            return {k: self.anonymize(v, k) for k, v in data.items()}
+        if isinstance(data, list):
+            return [self.anonymize(item, key) for item in data]
+        if key in ID_KEYS and isinstance(data, int) and not isinstance(data, bool):
+            return self.pseudo_id(data)
+        if key in NAME_KEYS and isinstance(data, str):
+            return f"{key}_{self._digest(f'{key}:{data}') % 1000000:06d}"
+        if key in TEXT_KEYS and isinstance(data, str):
+            return self.text(data)
+        return data
+
+class TrafficCapture:
+    """Запись входящих обновлений в сжатый файл для воспроизведения.
+
+    Обновления обезличиваются и копятся в памяти; раз в CAPTURE_FLUSH_INTERVAL
+    пачка дописывается в файл отдельным gzip-блоком в потоке, не блокируя
+    event loop. Склеенные gzip-блоки читаются как один файл (read_capture).
+    """
+
+    def __init__(self, path: str = None, key: str = None, flush_interval: float = None):
+        self.path = settings.CAPTURE_FILE if path is None else path
+        self.anonymizer = Anonymizer(key or settings.CAPTURE_KEY)
+        self.flush_interval = flush_interval or settings.CAPTURE_FLUSH_INTERVAL
+        self._buffer: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self.captured = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def get_handlers(self):
+        """Обработчик записи (регистрируется в самой ранней группе)"""
+        return [TypeHandler(Update, self.capture_update)]
+
+    async def capture_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Обновления чужих чатов запишет воркер-владелец, которому они пересылаются
+        if chat_partitioner.is_local(update):
+            self.record(update.to_dict())
+
+    def record(self, update_data: Dict[str, Any]):
+        try:
+            self._buffer.append(json.dumps({
+                'ts': round(time.time(), 3),
+                'update': self.anonymizer.anonymize(update_data)
+            }, ensure_ascii=False))
+            self.captured += 1
+        except Exception as e:
+            logger.error(f"Failed to capture update: {e}")
+
+    async def start(self, bot_id: int, keep_word: Callable[[str], bool] = None):
+        """Запуск записи; bot_id сохраняется в заголовке пачки для воспроизведения"""
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        if keep_word is not None:
+            self.anonymizer.keep_word = keep_word
+        self._buffer.append(json.dumps({'ts': round(time.time(), 3), 'bot_id': self.anonymizer.pseudo_id(bot_id)}))
+        self._task = asyncio.create_task(self._flush_loop(), name="traffic-capture")
+        logger.info(f"Capturing anonymized updates to {self.path}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error flushing captured updates: {e}")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: List[str]):
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+def read_capture(path: str) -> Iterator[Dict[str, Any]]:
+    """Записи файла захвата по порядку (заголовки с bot_id и обновления)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+traffic_capture = TrafficCapture()
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional, Tuple
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from services.metrics import metrics
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+UPDATES_TOTAL = metrics.counter('bot_updates_total', 'Received updates', ('type',))
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    max_concurrent_updates). Пока обрабатывается обновление пользователя,
+    его следующие обновления копятся в очереди и выполняются по порядку той же
+    задачей, не занимая дополнительных слотов.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._queues: Dict[Hashable, Deque[Tuple[object, Awaitable[Any]]]] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """Ключ упорядочивания: пользователь, иначе чат; None - без ограничений"""
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return ('user', update.effective_user.id)
+            if update.effective_chat is not None:
+                return ('chat', update.effective_chat.id)
+        return None
+
+    @property
+    def backlog(self) -> int:
+        """Обновления, ожидающие своей очереди за предыдущими того же пользователя"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @staticmethod
+    def update_type(update: object) -> str:
+        if isinstance(update, Update):
+            for name in Update.ALL_TYPES:
+                if getattr(update, name, None) is not None:
+                    return name
+        return type(update).__name__
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        UPDATES_TOTAL.inc(type=self.update_type(update))
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Обновление пользователя уже обрабатывается - встаем за ним
+            queue.append((update, coroutine))
+            return
+
+        queue = self._queues[key] = deque()
+        try:
+            while True:
+                try:
+                    await self._run(update, coroutine)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error processing update for {key}: {e}")
+                if not queue:
+                    break
+                update, coroutine = queue.popleft()
+        finally:
+            del self._queues[key]
+            for _, pending in queue:
+                pending.close()
+            if queue:
+                logger.warning(f"Dropped {len(queue)} queued updates for {key} on cancellation")
+
+    async def _run(self, update: object, coroutine: Awaitable[Any]):
+        """Обработка обновления в корневом участке трассировки"""
+        update_id = getattr(update, 'update_id', None)
+        with tracer.trace('update', update_id=update_id, type=str(self.update_type(update))):
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._queues:
+            logger.warning(f"Update processor shut down with {self.backlog} queued updates")
@@ -0,0 +1,19 @@
+import logging
+from telegram.ext import Updater
+
+logger = logging.getLogger(__name__)
+
+class ServeOnlyUpdater(Updater):
+    """Updater, который поднимает webhook-сервер без вызова setWebhook.
+
+    При нескольких воркерах webhook регистрирует только воркер 0: иначе
+    каждый запуск перезаписывал бы регистрацию предыдущего. Остальные
+    воркеры только принимают обновления с тем же общим секретом.
+    """
+
+    async def _bootstrap(self, *args, webhook_url=None, **kwargs):
+        # Polling передает пустой webhook_url (удаление webhook) - выполняется как обычно
+        if not webhook_url:
+            await super()._bootstrap(*args, webhook_url=webhook_url, **kwargs)
+            return
+        logger.info("Webhook registration skipped: it is registered by worker 0")